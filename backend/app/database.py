@@ -1,35 +1,104 @@
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event, text
+from sqlalchemy.engine import URL, make_url
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
 from sqlalchemy.orm import sessionmaker, declarative_base
 from .config import config
-import chromadb
 
 Base = declarative_base()
 
 # Database Connection
-# For SQLite we keep a single file-based database with check_same_thread disabled
-# so sessions can be used across FastAPI workers safely.
-engine = create_engine(
-    f"sqlite:///{config.DB_PATH}",
-    connect_args={"check_same_thread": False},
-    pool_pre_ping=True,
-)
+# DATABASE_URL picks the backend: a local SQLite file by default, or a
+# server database (PostgreSQL) shared by several workers or hosts.
+
+
+def sqlite_pragmas() -> dict:
+    """The configured SQLite performance profile (see config.SQLITE_*)"""
+    pragmas = {
+        "journal_mode": config.SQLITE_JOURNAL_MODE,
+        "synchronous": config.SQLITE_SYNCHRONOUS,
+        "mmap_size": config.SQLITE_MMAP_SIZE,
+        "cache_size": config.SQLITE_CACHE_SIZE,
+        "busy_timeout": config.SQLITE_BUSY_TIMEOUT_MS,
+        "temp_store": "MEMORY",
+    }
+    return {name: value for name, value in pragmas.items() if value not in (None, "")}
+
+
+def _apply_sqlite_pragmas(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    try:
+        for name, value in sqlite_pragmas().items():
+            cursor.execute(f"PRAGMA {name}={value}")
+    finally:
+        cursor.close()
+
+
+_ASYNC_DRIVERS = {"sqlite": "sqlite+aiosqlite", "postgresql": "postgresql+asyncpg"}
+
+
+def async_url(url) -> URL:
+    """The asyncio-driver variant of a database URL (aiosqlite, asyncpg)"""
+    url = make_url(url)
+    backend = url.get_backend_name()
+    if backend not in _ASYNC_DRIVERS:
+        raise ValueError(f"Unsupported database backend: {backend}")
+    return url.set(drivername=_ASYNC_DRIVERS[backend])
+
+
+def create_db_engine(url=None, asynchronous: bool = False):
+    """
+    Engine for `url` (default: config.DATABASE_URL). SQLite connections get
+    the pragma profile; server databases get a sized connection pool.
+    """
+    url = make_url(url or config.DATABASE_URL)
+    if asynchronous:
+        url = async_url(url)
+
+    if url.get_backend_name() == "sqlite":
+        connect_args = {"timeout": config.SQLITE_BUSY_TIMEOUT_MS / 1000}
+        if not asynchronous:
+            # Sessions are used from request threads and background workers
+            connect_args["check_same_thread"] = False
+        options = {"connect_args": connect_args}
+    else:
+        options = {
+            "pool_size": config.DB_POOL_SIZE,
+            "max_overflow": config.DB_MAX_OVERFLOW,
+            "pool_timeout": config.DB_POOL_TIMEOUT_S,
+            "pool_recycle": config.DB_POOL_RECYCLE_S,
+        }
+
+    if asynchronous:
+        new_engine = create_async_engine(url, pool_pre_ping=True, **options)
+        sync_engine = new_engine.sync_engine
+    else:
+        new_engine = sync_engine = create_engine(url, pool_pre_ping=True, **options)
+    if url.get_backend_name() == "sqlite":
+        event.listen(sync_engine, "connect", _apply_sqlite_pragmas)
+    return new_engine
+
+
+engine = create_db_engine()
+
+# Async engine for async routes: the driver (aiosqlite, asyncpg) never
+# blocks the event loop. Same database, same connection settings.
+async_engine = create_db_engine(asynchronous=True)
+
 
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
-# ChromaDB Client
-try:
-    chroma_client = chromadb.PersistentClient(path=str(config.CHROMA_PATH))
-    collection = chroma_client.get_or_create_collection(name="documents")
-except Exception as e:
-    print(f"ChromaDB initialization error: {e}")
-    collection = None
+# expire_on_commit=False: attribute access after commit would otherwise
+# trigger lazy loads, which cannot run implicitly under asyncio
+AsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
 
 def init_db():
     """Initialize database with tables and default data"""
     # Import models here to ensure they are registered with Base.metadata
-    from .models.sql_models import User, Task, Reminder, ChatHistory, Document, RoutineEvent
+    from .models.sql_models import User, Task, Reminder, ChatHistory, Document, RoutineEvent, IngestionJob
+    from .migrations import run_migrations
     
     Base.metadata.create_all(engine)
+    run_migrations(engine)
     
     # Create default user if not exists
     db = SessionLocal()
@@ -54,10 +123,25 @@ def init_db():
     finally:
         db.close()
 
+    if engine.dialect.name == "postgresql":
+        _sync_user_id_sequence()
+
+def _sync_user_id_sequence():
+    """The default user is inserted with an explicit id; move the sequence past it"""
+    with engine.begin() as conn:
+        conn.execute(text(
+            "SELECT setval(pg_get_serial_sequence('users', 'id'), COALESCE((SELECT MAX(id) FROM users), 1))"
+        ))
+
 def get_db():
     """Dependency for getting database session"""
     db = SessionLocal()
     try:
         yield db
     finally:
-        db.close()
\ No newline at end of file
+        db.close()
+
+async def get_async_db():
+    """Dependency for getting an async database session"""
+    async with AsyncSessionLocal() as db:
+        yield db
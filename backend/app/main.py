@@ -5,10 +5,18 @@ from fastapi.responses import FileResponse, JSONResponse
 from .config import config
 from .websocket_manager import manager
 from .database import init_db
+from .services.llm_scheduler import LLMBusyError
+from .models.llm_models import llm
+from .services.rag_service import sync_lexical_index
+from .services.reranker import reranker
+from .services.ingestion_service import ingestion_queue, move_bodies_to_blob_store
+from .utils.upload_stream import clear_stale_spool_files
+from .utils.loop_monitor import loop_monitor
 from .routes import (
     chat, tasks, upload, dashboard, reminders, search, 
     export, schedule, insights, settings, routine
 )
+import threading
 
 app = FastAPI(title="AURA API", version="1.0.0")
 
@@ -21,6 +29,16 @@ async def global_exception_handler(request: Request, exc: Exception):
         content={"message": "Internal Server Error", "details": str(exc)},
     )
 
+# LLM backpressure: queue full (429), queued past deadline or models still
+# warming up (503)
+@app.exception_handler(LLMBusyError)
+async def llm_busy_handler(request: Request, exc: LLMBusyError):
+    return JSONResponse(
+        status_code=exc.status_code,
+        content={"message": exc.message, "status": exc.status, "details": str(exc)},
+        headers={"Retry-After": str(exc.retry_after)},
+    )
+
 # CORS
 app.add_middleware(
     CORSMiddleware,
@@ -34,11 +52,29 @@ app.add_middleware(
 async def startup_event():
     # Initialize DB
     init_db()
+
+    # Load the LLM, embeddings and reranker in the background; everything
+    # that does not need them is served right away.
+    llm.start_loading()
+    if config.RERANK_ENABLED:
+        reranker.start_loading()
+
+    # Move document bodies stored inline in SQL (before the blob store) out of it
+    threading.Thread(target=move_bodies_to_blob_store, name="blob-store-migration", daemon=True).start()
+
+    # Backfill the BM25 index for documents indexed before it existed
+    threading.Thread(target=sync_lexical_index, name="lexical-index-sync", daemon=True).start()
     
     print(f"📂 Serving static files from: {config.FRONTEND_DIR}")
     
     import asyncio
     manager.set_loop(asyncio.get_running_loop())
+    loop_monitor.start()
+
+    # Ingestion workers (after the loop is set so progress events go out);
+    # picks up jobs interrupted by the last shutdown
+    ingestion_queue.start()
+    clear_stale_spool_files()
 
 # Routers
 app.include_router(chat.router, prefix="/api")
@@ -70,6 +106,14 @@ async def websocket_endpoint(websocket: WebSocket):
         print(f"WebSocket error: {e}")
         manager.disconnect(websocket)
 
+@app.get("/api/health")
+async def health():
+    """
+    Liveness plus model readiness ("loading" until the LLM can answer) and
+    event-loop lag (stalls mean blocking code ran on the loop).
+    """
+    return {"status": "ok", "models": llm.status, "ready": llm.ready, "event_loop": loop_monitor.get_stats()}
+
 @app.get("/")
 async def root():
     return FileResponse(str(config.FRONTEND_DIR / "index.html"))
\ No newline at end of file
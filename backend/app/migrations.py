@@ -0,0 +1,113 @@
+"""
+Versioned schema migrations.
+
+Base.metadata.create_all() creates missing tables but never changes the
+ones already on disk, so every change to an existing table (a new column,
+a new index) is also written down here as a numbered migration. The last
+applied version is kept in the schema_version table and init_db runs the
+pending migrations in order, each in its own transaction.
+
+Migrations must be idempotent: on a fresh database create_all has already
+built the latest schema and they run anyway, so add columns and indexes
+through _add_column / _create_index, which skip what exists.
+
+To change the schema: edit the model, then append a migration with the
+next version number. Never edit or renumber one that has shipped.
+"""
+from sqlalchemy import Column, inspect, text
+
+MIGRATIONS = []
+
+
+def migration(version: int, description: str):
+    def register(fn):
+        MIGRATIONS.append((version, description, fn))
+        return fn
+    return register
+
+
+def _add_column(conn, column: Column):
+    table = column.table.name
+    if column.name in {c["name"] for c in inspect(conn).get_columns(table)}:
+        return
+    conn.execute(text(
+        f"ALTER TABLE {table} ADD COLUMN {column.name} {column.type.compile(conn.dialect)}"
+    ))
+
+
+def _create_index(conn, table, name: str):
+    index = next(index for index in table.indexes if index.name == name)
+    index.create(conn, checkfirst=True)
+
+
+@migration(1, "documents: upload hash and size, blob store key")
+def _document_upload_columns(conn):
+    from .models.sql_models import Document
+
+    columns = Document.__table__.c
+    for column in (columns.content_hash, columns.file_size, columns.content_blob):
+        _add_column(conn, column)
+    _create_index(conn, Document.__table__, "ix_documents_content_hash")
+
+
+@migration(2, "indexes for the hot task, chat history and document lookups")
+def _hot_path_indexes(conn):
+    from .models.sql_models import ChatHistory, Document, Task
+
+    for table, names in (
+        (Task.__table__, ("ix_tasks_user_completed_due", "ix_tasks_user_completed_at")),
+        (ChatHistory.__table__, ("ix_chat_history_user_timestamp",)),
+        (Document.__table__, ("ix_documents_filename", "ix_documents_content_blob")),
+    ):
+        for name in names:
+            _create_index(conn, table, name)
+
+
+@migration(3, "postgresql: GIN index for task tag filters")
+def _task_tags_gin_index(conn):
+    from .models.sql_models import Task
+
+    if conn.dialect.name == "postgresql":
+        _create_index(conn, Task.__table__, "ix_tasks_tags_gin")
+
+
+@migration(4, "full-text search over tasks and chat history")
+def _full_text_search(conn):
+    from .models.full_text import create_sqlite_indexes
+    from .models.sql_models import ChatHistory, Task
+
+    if conn.dialect.name == "sqlite":
+        create_sqlite_indexes(conn)
+    elif conn.dialect.name == "postgresql":
+        _create_index(conn, Task.__table__, "ix_tasks_search")
+        _create_index(conn, ChatHistory.__table__, "ix_chat_history_search")
+
+
+@migration(5, "ingestion_jobs: owner and heartbeat for job claiming")
+def _ingestion_job_owner(conn):
+    from .models.sql_models import IngestionJob
+
+    columns = IngestionJob.__table__.c
+    for column in (columns.owner, columns.heartbeat_at):
+        _add_column(conn, column)
+
+
+def current_version(conn) -> int:
+    conn.execute(text("CREATE TABLE IF NOT EXISTS schema_version (version INTEGER NOT NULL)"))
+    version = conn.execute(text("SELECT MAX(version) FROM schema_version")).scalar()
+    return version or 0
+
+
+def run_migrations(engine) -> int:
+    """Apply pending migrations in order; returns the schema version"""
+    with engine.begin() as conn:
+        version = current_version(conn)
+    for number, description, fn in sorted(MIGRATIONS, key=lambda m: m[0]):
+        if number <= version:
+            continue
+        with engine.begin() as conn:
+            fn(conn)
+            conn.execute(text("INSERT INTO schema_version (version) VALUES (:v)"), {"v": number})
+        version = number
+        print(f"✅ Schema migration {number}: {description}")
+    return version
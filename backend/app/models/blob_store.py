@@ -0,0 +1,137 @@
+"""
+Content-addressed, compressed store for document bodies.
+
+Extracted document text lives in files under BLOB_STORE_PATH named by the
+sha256 of the text (<aa>/<sha256>.zst), compressed with zstd, so SQL rows
+only carry the 64-character key. Identical texts are stored once. Bodies
+are written and read as streams: ingestion compresses parsed pages as they
+go by, and readers get the text back block by block.
+
+zstandard is optional; without it bodies are gzip-compressed (.gz) and
+both formats stay readable.
+"""
+from pathlib import Path
+import gzip
+import hashlib
+import io
+import logging
+import os
+import uuid
+
+from ..config import config
+
+logger = logging.getLogger(__name__)
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+READ_BLOCK_CHARS = 1 << 20
+
+
+class BlobWriter:
+    """Streams text into a temporary compressed file; `key` is set on close."""
+
+    def __init__(self, store: "BlobStore"):
+        self.store = store
+        self.key = None
+        self.size = 0
+        self._digest = hashlib.sha256()
+        self._tmp = store.root / f".{uuid.uuid4().hex}.tmp"
+        self._raw = open(self._tmp, "wb")
+        if zstandard is not None:
+            self._out = zstandard.ZstdCompressor(level=config.BLOB_ZSTD_LEVEL).stream_writer(self._raw)
+        else:
+            self._out = gzip.GzipFile(fileobj=self._raw, mode="wb")
+
+    def write(self, text: str):
+        data = text.encode("utf-8")
+        self._digest.update(data)
+        self._out.write(data)
+        self.size += len(data)
+
+    def close(self) -> str:
+        self._out.close()  # also closes the underlying file
+        if not self._raw.closed:
+            self._raw.close()
+        self.key = self._digest.hexdigest()
+        path = self.store._path(self.key, self.store.suffix)
+        if self.store.exists(self.key):
+            self._tmp.unlink()
+        else:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            os.replace(self._tmp, path)
+        return self.key
+
+    def abort(self):
+        try:
+            self._out.close()
+        except Exception:
+            pass
+        self._tmp.unlink(missing_ok=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+
+class BlobStore:
+    def __init__(self, root: Path = None):
+        self.root = Path(root or config.BLOB_STORE_PATH)
+        self.root.mkdir(parents=True, exist_ok=True)
+        self.suffix = ".zst" if zstandard is not None else ".gz"
+        if zstandard is None:
+            logger.warning("[WARNING] zstandard not installed; document bodies are stored gzip-compressed")
+
+    def _path(self, key: str, suffix: str) -> Path:
+        return self.root / key[:2] / f"{key}{suffix}"
+
+    def _find(self, key: str):
+        for suffix in (".zst", ".gz"):
+            path = self._path(key, suffix)
+            if path.exists():
+                return path
+        return None
+
+    def exists(self, key: str) -> bool:
+        return self._find(key) is not None
+
+    def writer(self) -> BlobWriter:
+        return BlobWriter(self)
+
+    def put(self, text: str) -> str:
+        with self.writer() as writer:
+            writer.write(text)
+        return writer.key
+
+    def iter_text(self, key: str, block_chars: int = READ_BLOCK_CHARS):
+        """Yield the stored text in blocks of up to `block_chars` characters."""
+        path = self._find(key)
+        if path is None:
+            raise KeyError(f"Blob {key} not found")
+        with open(path, "rb") as raw:
+            if path.suffix == ".zst":
+                if zstandard is None:
+                    raise RuntimeError("zstandard is required to read .zst document bodies")
+                stream = zstandard.ZstdDecompressor().stream_reader(raw)
+            else:
+                stream = gzip.GzipFile(fileobj=raw, mode="rb")
+            with io.TextIOWrapper(stream, encoding="utf-8") as text:
+                yield from iter(lambda: text.read(block_chars), "")
+
+    def get(self, key: str) -> str:
+        return "".join(self.iter_text(key))
+
+    def delete(self, key: str):
+        path = self._find(key)
+        if path is not None:
+            path.unlink(missing_ok=True)
+
+
+blob_store = BlobStore()
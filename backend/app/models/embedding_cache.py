@@ -0,0 +1,134 @@
+"""
+Content-addressed embedding cache.
+
+Embeddings are keyed by sha256(model name + text), so the same chunk or
+query is only ever encoded once per model, whichever path asks for it.
+Lookups go through an in-memory LRU first and then a SQLite file of
+float16 vectors under DATA_DIR (half the size of float32, and well within
+MiniLM's useful precision), capped at EMBED_CACHE_MAX_ENTRIES rows with
+least-recently-used eviction. Hit rates are tracked per caller kind, e.g.
+"ingest" for document chunks and "query" for chat/search queries.
+"""
+from collections import OrderedDict, defaultdict
+from pathlib import Path
+import hashlib
+import logging
+import sqlite3
+import threading
+import time
+
+import numpy as np
+
+from ..config import config
+
+logger = logging.getLogger(__name__)
+
+
+class EmbeddingCache:
+    def __init__(self, model_name: str, path: Path = None, memory_entries: int = None, max_entries: int = None):
+        self.model_name = model_name
+        self.path = path or config.EMBED_CACHE_PATH
+        self.memory_entries = memory_entries or config.EMBED_CACHE_MEMORY_ENTRIES
+        self.max_entries = max_entries or config.EMBED_CACHE_MAX_ENTRIES
+        self._memory = OrderedDict()  # key -> float16 bytes
+        self._lock = threading.Lock()
+        self.stats = defaultdict(lambda: {"memory_hits": 0, "disk_hits": 0, "misses": 0})
+        self.evictions = 0
+
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(str(self.path), check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings (key TEXT PRIMARY KEY, vector BLOB NOT NULL, last_used REAL NOT NULL DEFAULT 0)"
+        )
+        columns = {row[1] for row in self._conn.execute("PRAGMA table_info(embeddings)")}
+        if "last_used" not in columns:
+            # Files written before the row cap existed
+            self._conn.execute("ALTER TABLE embeddings ADD COLUMN last_used REAL NOT NULL DEFAULT 0")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS ix_embeddings_last_used ON embeddings(last_used)")
+        self._conn.commit()
+
+    def key(self, text: str) -> str:
+        return hashlib.sha256(f"{self.model_name}\0{text}".encode("utf-8")).hexdigest()
+
+    def _remember(self, key: str, blob: bytes):
+        self._memory[key] = blob
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_entries:
+            self._memory.popitem(last=False)
+
+    def get_many(self, texts: list, kind: str = "query") -> list:
+        """Cached vectors for `texts` (None where missing), in order."""
+        keys = [self.key(text) for text in texts]
+        found = {}
+        with self._lock:
+            stats = self.stats[kind]
+            for key in keys:
+                blob = self._memory.get(key)
+                if blob is not None:
+                    self._memory.move_to_end(key)
+                    found[key] = blob
+                    stats["memory_hits"] += 1
+
+            missing = [key for key in set(keys) if key not in found]
+            disk_hits = []
+            for start in range(0, len(missing), 500):
+                batch = missing[start:start + 500]
+                rows = self._conn.execute(
+                    f"SELECT key, vector FROM embeddings WHERE key IN ({','.join('?' * len(batch))})", batch
+                ).fetchall()
+                for key, blob in rows:
+                    found[key] = blob
+                    self._remember(key, blob)
+                    disk_hits.append(key)
+                    stats["disk_hits"] += 1
+            stats["misses"] += sum(1 for key in keys if key not in found)
+
+            if disk_hits:
+                # Memory hits are not written back; the LRU in front keeps
+                # hot keys off the disk tier's eviction order anyway.
+                now = time.time()
+                self._conn.executemany(
+                    "UPDATE embeddings SET last_used = ? WHERE key = ?", [(now, key) for key in disk_hits]
+                )
+                self._conn.commit()
+
+        return [
+            np.frombuffer(found[key], dtype=np.float16).astype(np.float32).tolist() if key in found else None
+            for key in keys
+        ]
+
+    def put_many(self, texts: list, vectors: list):
+        now = time.time()
+        rows = []
+        for text, vector in zip(texts, vectors):
+            rows.append((self.key(text), np.asarray(vector, dtype=np.float16).tobytes(), now))
+        with self._lock:
+            for key, blob, _ in rows:
+                self._remember(key, blob)
+            self._conn.executemany("INSERT OR REPLACE INTO embeddings (key, vector, last_used) VALUES (?, ?, ?)", rows)
+            overflow = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0] - self.max_entries
+            if overflow > 0:
+                self._conn.execute(
+                    "DELETE FROM embeddings WHERE key IN "
+                    "(SELECT key FROM embeddings ORDER BY last_used ASC LIMIT ?)",
+                    (overflow,),
+                )
+                self.evictions += overflow
+            self._conn.commit()
+
+    def get_stats(self) -> dict:
+        with self._lock:
+            kinds = {}
+            for kind, counts in self.stats.items():
+                hits = counts["memory_hits"] + counts["disk_hits"]
+                lookups = hits + counts["misses"]
+                kinds[kind] = {**counts, "hit_rate": round(hits / lookups, 3) if lookups else None}
+            disk_entries = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+            return {
+                "model": self.model_name,
+                "memory_entries": len(self._memory),
+                "disk_entries": disk_entries,
+                "max_entries": self.max_entries,
+                "evictions": self.evictions,
+                **kinds,
+            }
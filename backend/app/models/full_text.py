@@ -0,0 +1,156 @@
+"""
+Full-text search over tasks and chat history.
+
+SQLite: FTS5 tables (tasks_fts, chat_history_fts) index the rows of their
+source table in place (external content, nothing stored twice). Triggers
+keep them in step with every insert, update and delete, whoever writes -
+ORM sessions, the write queue or raw SQL. Matches are ranked by bm25()
+(task titles weigh more than descriptions) and snippet() marks them.
+
+PostgreSQL: GIN indexes over the tsvector expressions in sql_models,
+ranked by ts_rank_cd() and marked by ts_headline().
+
+Both are built by migration 4. User input never reaches the FTS query
+syntax: it is reduced to words, all of which must match. The last word
+also matches as a prefix (search as you type), as does any word ending
+in '*'.
+
+Snippets are HTML: the database marks matches with control characters,
+the text is HTML-escaped when the row is read, and only then do the marks
+become <mark></mark> tags, so markup in a task or message is shown as
+text, never rendered.
+"""
+import html
+import re
+
+from sqlalchemy import (
+    String, TypeDecorator, column, false, func, literal, literal_column, select, table, type_coerce,
+)
+
+from .sql_models import (
+    SEARCH_CONFIG, ChatHistory, Task, chat_search_vector, task_search_vector,
+)
+
+# Match delimiters in the SQL snippet; they cannot occur in typed text
+MARK_START, MARK_END = "\x02", "\x03"
+SNIPPET_WORDS = 16
+_MAX_TERMS = 16
+_WORD_RE = re.compile(r"(\w+)(\*?)")
+
+# FTS5 table -> (source table, indexed columns, default ranking)
+SQLITE_FTS_TABLES = {
+    "tasks_fts": ("tasks", ("title", "description"), "bm25(10.0, 1.0)"),
+    "chat_history_fts": ("chat_history", ("content",), "bm25()"),
+}
+
+
+def create_sqlite_indexes(conn):
+    """Create the FTS5 tables and their triggers (idempotent), then (re)index the rows"""
+    for fts, (source, columns, rank) in SQLITE_FTS_TABLES.items():
+        names = ", ".join(columns)
+        new = ", ".join(f"new.{c}" for c in columns)
+        old = ", ".join(f"old.{c}" for c in columns)
+        insert = f"INSERT INTO {fts}(rowid, {names}) VALUES (new.id, {new});"
+        delete = f"INSERT INTO {fts}({fts}, rowid, {names}) VALUES ('delete', old.id, {old});"
+        for statement in (
+            f"CREATE VIRTUAL TABLE IF NOT EXISTS {fts} USING fts5({names}, content='{source}', "
+            "content_rowid='id', tokenize='porter unicode61 remove_diacritics 2', prefix='2 3')",
+            f"CREATE TRIGGER IF NOT EXISTS {fts}_insert AFTER INSERT ON {source} BEGIN {insert} END",
+            f"CREATE TRIGGER IF NOT EXISTS {fts}_delete AFTER DELETE ON {source} BEGIN {delete} END",
+            f"CREATE TRIGGER IF NOT EXISTS {fts}_update AFTER UPDATE OF {names} ON {source} "
+            f"BEGIN {delete} {insert} END",
+            f"INSERT INTO {fts}({fts}, rank) VALUES ('rank', '{rank}')",
+            f"INSERT INTO {fts}({fts}) VALUES ('rebuild')",
+        ):
+            conn.exec_driver_sql(statement)
+
+
+def snippet_html(snippet: str) -> str:
+    """HTML for a snippet marked with MARK_START/MARK_END: escaped text, matches in <mark></mark>"""
+    if snippet is None:
+        return None
+    return html.escape(snippet).replace(MARK_START, "<mark>").replace(MARK_END, "</mark>")
+
+
+class SnippetHTML(TypeDecorator):
+    """Result type of the snippet column: converted by snippet_html as rows are read"""
+    impl = String
+    cache_ok = True
+
+    def process_result_value(self, value, dialect):
+        return snippet_html(value)
+
+
+def drop_sqlite_indexes(conn):
+    for fts in SQLITE_FTS_TABLES:
+        conn.exec_driver_sql(f"DROP TABLE IF EXISTS {fts}")
+
+
+def parse_query(query: str) -> list:
+    """(word, prefix) pairs for the words of `query`"""
+    words = _WORD_RE.findall(query or "")[:_MAX_TERMS]
+    terms = [(word.lower(), bool(star)) for word, star in words]
+    if terms and len(terms[-1][0]) >= 2:
+        terms[-1] = (terms[-1][0], True)
+    return terms
+
+
+def fts5_query(terms: list) -> str:
+    return " AND ".join(f'"{word}"' + ("*" if prefix else "") for word, prefix in terms)
+
+
+def tsquery_text(terms: list) -> str:
+    return " & ".join(f"'{word}'" + (":*" if prefix else "") for word, prefix in terms)
+
+
+def _search(dialect: str, model, fts: str, vector, headline, user_id: int, query: str, limit: int):
+    terms = parse_query(query)
+    if not terms:
+        return select(model, literal(0.0).label("score"), literal("").label("snippet")).where(false())
+
+    if dialect == "sqlite":
+        fts_table = table(fts, column("rowid"), column("rank"))
+        fts_ref = literal_column(fts)
+        snippet = type_coerce(
+            func.snippet(fts_ref, -1, MARK_START, MARK_END, "…", SNIPPET_WORDS), SnippetHTML()
+        )
+        return (
+            select(model, (-fts_table.c.rank).label("score"), snippet.label("snippet"))
+            .select_from(fts_table)
+            .join(model, model.id == fts_table.c.rowid)
+            .where(fts_ref.op("MATCH")(fts5_query(terms)), model.user_id == user_id)
+            .order_by(fts_table.c.rank)
+            .limit(limit)
+        )
+
+    tsquery = func.to_tsquery(SEARCH_CONFIG, tsquery_text(terms))
+    score = func.ts_rank_cd(vector, tsquery)
+    snippet = type_coerce(func.ts_headline(
+        SEARCH_CONFIG, headline, tsquery,
+        f"StartSel={MARK_START}, StopSel={MARK_END}, MaxWords={SNIPPET_WORDS}, MinWords=4, MaxFragments=1",
+    ), SnippetHTML())
+    return (
+        select(model, score.label("score"), snippet.label("snippet"))
+        .where(vector.op("@@")(tsquery), model.user_id == user_id)
+        .order_by(score.desc())
+        .limit(limit)
+    )
+
+
+def search_tasks(dialect: str, user_id: int, query: str, limit: int = 20):
+    """
+    Select (Task, score, snippet) rows for the user's tasks matching `query`,
+    best first: `score` is higher for better matches and `snippet` is an
+    HTML excerpt (escaped text, matches wrapped in <mark></mark>). `dialect` is the
+    session's, e.g. db.bind.dialect.name.
+    """
+    headline = Task.title + ": " + func.coalesce(Task.description, "")
+    return _search(dialect, Task, "tasks_fts", task_search_vector, headline, user_id, query, limit)
+
+
+def search_chat_history(dialect: str, user_id: int, query: str, limit: int = 20):
+    """Select (ChatHistory, score, snippet) rows, like search_tasks"""
+    headline = func.coalesce(ChatHistory.content, "")
+    return _search(
+        dialect, ChatHistory, "chat_history_fts", chat_search_vector, headline, user_id, query, limit
+    )
@@ -1,22 +1,130 @@
-from llama_cpp import Llama
-from sentence_transformers import SentenceTransformer
 from pathlib import Path
+from collections import OrderedDict
 import logging
 import sys
+import threading
+import time
 
 # Absolute imports
 sys.path.insert(0, str(Path(__file__).parent.parent.parent))
 
 from backend.app.config import config
+from backend.app.utils.chunker import estimate_tokens
 
 logger = logging.getLogger(__name__)
 
+STOP_TOKENS = ["<|end|>", "<|user|>", "<|assistant|>"]
+OFFLINE_MESSAGE = ("[WARNING] AURA is running in offline mode. "
+                   "Please download the model using: python backend/download_models.py")
+GENERATION_ERROR = "I encountered an error. Please try again."
+INVALID_OUTPUT_MESSAGE = "I encountered an error generating a response."
+
+
 class LLM:
-    def __init__(self):
+    def __init__(self, *, local: bool = None, n_threads: int = None, load_embeddings: bool = True,
+                 lazy: bool = False):
+        """
+        `local` loads the GGUF model in this process; otherwise completions are
+        sent to the inference worker pool (see llm_pool.py). By default the
+        pool is used whenever LLM_POOL_SIZE > 0.
+
+        With `lazy`, nothing is loaded here: call start_loading() to load the
+        models in a background thread (the API does this on startup), or let
+        the first call that needs a model trigger it. `status` moves from
+        "not_loaded" to "loading" to "ready" (or "failed").
+        """
         self.llm = None
+        self.pool = None
         self.embedding_model = None
+        self.embedding_cache = None
         self.fallback_mode = False
-        
+        # llama.cpp contexts are not thread-safe; a completion (including any
+        # prefix-state restore) must own the model for its whole duration.
+        self._model_lock = threading.RLock()
+        self._prefix_cache = OrderedDict()  # system prompt text -> {"tokens", "state", "bytes"}
+        self._grammars = {}  # GBNF text -> compiled LlamaGrammar
+        self._vocab = None  # vocab-only Llama for token counting in pool mode
+        self._stats_lock = threading.Lock()
+        self.stats = {
+            "streams": 0,
+            "ttft_ms_total": 0.0,
+            "last_ttft_ms": None,
+            "stream_tokens": 0,
+            "prefix_hits": 0,
+            "prefix_misses": 0,
+            "prefill_tokens_skipped": 0,
+        }
+
+        if local is None:
+            local = config.LLM_POOL_SIZE <= 0
+        self._local = local
+        self._n_threads = n_threads or config.LLM_THREADS
+        self._with_embeddings = load_embeddings
+        self.status = "not_loaded"
+        self.load_seconds = None
+        self._ready = threading.Event()
+        self._load_started = threading.Lock()
+        self._load_thread = None
+
+        # Cached where requests enter: the API process, not the pool workers
+        self.response_cache = None
+        if config.LLM_RESPONSE_CACHE_ENABLED and not config.LLM_POOL_WORKER:
+            try:
+                from .response_cache import ResponseCache
+                self.response_cache = ResponseCache()
+            except Exception as e:
+                logger.warning(f"[WARNING] LLM response cache disabled: {e}")
+
+        if not lazy:
+            self.load()
+
+    # ----- loading / readiness -----
+
+    def load(self):
+        """Load the model (or connect to the pool) and the embeddings. Blocking."""
+        started = time.perf_counter()
+        self.status = "loading"
+        try:
+            if self._local:
+                self._load_llm(self._n_threads)
+            else:
+                from .llm_pool import LLMPoolClient
+                self.pool = LLMPoolClient()
+                logger.info(f"[INFO] Using LLM worker pool ({len(self.pool.addresses)} workers)")
+
+            if self._with_embeddings:
+                self._load_embeddings()
+            self.status = "ready"
+        except Exception as e:
+            logger.exception(f"[ERROR] Model loading failed: {e}")
+            self.fallback_mode = True
+            self.status = "failed"
+        finally:
+            self.load_seconds = round(time.perf_counter() - started, 1)
+            # Set even on failure so waiters fall through to offline mode
+            self._ready.set()
+        logger.info(f"[INFO] Models {self.status} after {self.load_seconds}s")
+
+    def start_loading(self):
+        """Start loading in a background thread (no-op if already started)."""
+        with self._load_started:
+            if self._load_thread is not None or self._ready.is_set():
+                return
+            self.status = "loading"
+            self._load_thread = threading.Thread(target=self.load, name="model-loader", daemon=True)
+            self._load_thread.start()
+
+    @property
+    def ready(self) -> bool:
+        return self._ready.is_set()
+
+    def wait_ready(self, timeout: float = None) -> bool:
+        """Block until the models are loaded, starting the load if needed."""
+        if not self._ready.is_set():
+            self.start_loading()
+        return self._ready.wait(timeout if timeout is not None else config.MODEL_LOAD_TIMEOUT_S)
+
+    def _load_llm(self, n_threads: int):
         # Load LLM
         logger.info(f"[INFO] Checking model path: {config.MODEL_PATH.resolve()}")
         
@@ -43,21 +151,27 @@ class LLM:
                 logger.warning(f"[WARNING] Model might not be quantized: {model_name}. Ensure it fits in RAM.")
 
             try:
+                from llama_cpp import Llama
+
                 logger.info(f"[INFO] Loading LLM from {config.MODEL_PATH}...")
                 self.llm = Llama(
                     model_path=str(config.MODEL_PATH),
                     n_ctx=config.LLM_CONTEXT_WINDOW,
                     n_gpu_layers=-1 if config.USE_GPU else 0,
                     verbose=False,
-                    n_threads=4  # CPU threads
+                    n_threads=n_threads,
+                    use_mmap=True  # pool workers share the file's pages
                 )
                 logger.info("[OK] LLM Loaded successfully")
             except Exception as e:
                 logger.exception(f"[ERROR] Error loading LLM: {e}")
                 self.fallback_mode = True
 
+    def _load_embeddings(self):
         # Load Embeddings
         try:
+            from sentence_transformers import SentenceTransformer
+
             logger.info("[INFO] Loading Embeddings model...")
             self.embedding_model = SentenceTransformer(
                 config.EMBEDDING_MODEL,
@@ -67,64 +181,358 @@ class LLM:
         except Exception as e:
             logger.exception(f"[ERROR] Error loading Embeddings: {e}")
             logger.warning("[WARNING] System will work without semantic search")
+            return
+
+        if config.EMBED_CACHE_ENABLED:
+            try:
+                from .embedding_cache import EmbeddingCache
+                self.embedding_cache = EmbeddingCache(config.EMBEDDING_MODEL)
+            except Exception as e:
+                logger.warning(f"[WARNING] Embedding cache disabled: {e}")
 
-    def generate(self, prompt: str, max_tokens: int = None, *, temperature: float = None) -> str:
-        """Generate text using LLM with error handling"""
+    def _completion_kwargs(self, max_tokens: int = None, temperature: float = None, grammar: str = None) -> dict:
+        """Sampling parameters shared by blocking and streaming generation"""
         if max_tokens is None:
             max_tokens = config.LLM_MAX_TOKENS
         if temperature is None:
             temperature = config.LLM_TEMPERATURE
-            
-        if self.fallback_mode or not self.llm:
+        kwargs = {
+            "max_tokens": max_tokens,
+            "stop": STOP_TOKENS,
+            "echo": False,
+            "temperature": temperature,
+            "top_p": 0.8,
+            "repeat_penalty": 1.2,
+            "top_k": 40,
+        }
+        if grammar:
+            kwargs["grammar"] = self._compile_grammar(grammar)
+        return kwargs
+
+    def _compile_grammar(self, grammar: str):
+        """Parse GBNF once; the same few grammars are used on every request"""
+        compiled = self._grammars.get(grammar)
+        if compiled is None:
+            from llama_cpp import LlamaGrammar
+
+            compiled = LlamaGrammar.from_string(grammar, verbose=False)
+            self._grammars[grammar] = compiled
+        return compiled
+
+    def _tokenize(self, text: str) -> list:
+        """Tokenize exactly like create_completion does for a prompt"""
+        try:
+            return self.llm.tokenize(text.encode("utf-8"), special=True)
+        except TypeError:
+            # Older llama-cpp-python builds have no `special` flag
+            return self.llm.tokenize(text.encode("utf-8"))
+
+    def _tokenizer(self):
+        if self.llm is not None:
+            return self.llm
+        if self._vocab is None and self.pool is not None and config.MODEL_PATH.exists():
+            try:
+                from llama_cpp import Llama
+
+                # Loads the vocabulary only (no weights), so the API process can
+                # count tokens without a model instance of its own.
+                self._vocab = Llama(model_path=str(config.MODEL_PATH), vocab_only=True, verbose=False)
+            except Exception as e:
+                logger.warning(f"[WARNING] Could not load tokenizer vocabulary: {e}")
+                self._vocab = False
+        return self._vocab or None
+
+    def count_tokens(self, text: str) -> int:
+        """
+        Number of prompt tokens `text` costs with the model's tokenizer.
+        Tokenizing only reads the vocabulary, so this does not take the model
+        lock. Without a model it falls back to a conservative estimate.
+        """
+        if not text:
+            return 0
+        self.wait_ready()
+        tokenizer = self._tokenizer()
+        if tokenizer is None:
+            return len(text) // 3 + 1
+        try:
+            return len(tokenizer.tokenize(text.encode("utf-8"), add_bos=False, special=True))
+        except TypeError:
+            return len(tokenizer.tokenize(text.encode("utf-8"), add_bos=False))
+
+    def _use_prefix(self, prompt: str, prefix: str = None):
+        """
+        Make the llama.cpp KV cache start with `prefix` before a completion.
+
+        The first time a prefix is seen it is evaluated once and the resulting
+        state saved; later calls restore that state, and llama.cpp's own
+        longest-prefix matching then only evaluates the prompt suffix.
+        Must be called with the model lock held. Changes to the cache dict
+        itself also take the stats lock, so get_stats can read it mid-generation.
+        """
+        if not prefix or not config.LLM_PREFIX_CACHE_ENABLED or not prompt.startswith(prefix):
+            return
+
+        try:
+            with self._stats_lock:
+                entry = self._prefix_cache.get(prefix)
+                if entry is not None:
+                    self._prefix_cache.move_to_end(prefix)
+            if entry is not None:
+                tokens = entry["tokens"]
+                # input_ids is the whole n_ctx buffer: only its first n_tokens are in the KV cache
+                n_tokens = getattr(self.llm, "n_tokens", 0)
+                evaluated = list(getattr(self.llm, "input_ids", [])[:n_tokens])
+                if n_tokens < len(tokens) or evaluated[:len(tokens)] != tokens:
+                    self.llm.load_state(entry["state"])
+                # Counted only once the prefix is resident (load_state raising skips this)
+                with self._stats_lock:
+                    self.stats["prefix_hits"] += 1
+                    self.stats["prefill_tokens_skipped"] += len(tokens)
+                return
+
+            with self._stats_lock:
+                self.stats["prefix_misses"] += 1
+
+            tokens = self._tokenize(prefix)
+            if len(tokens) < config.LLM_PREFIX_CACHE_MIN_TOKENS:
+                return
+
+            self.llm.reset()
+            self.llm.eval(tokens)
+            state = self.llm.save_state()
+            size = getattr(state, "llama_state_size", 0)
+            scores = getattr(state, "scores", None)
+            if scores is not None:
+                size += scores.nbytes
+            max_bytes = config.LLM_PREFIX_CACHE_MAX_MB * 1024 * 1024
+            with self._stats_lock:
+                self._prefix_cache[prefix] = {"tokens": list(tokens), "state": state, "bytes": size}
+                while self._prefix_cache and (
+                    len(self._prefix_cache) > config.LLM_PREFIX_CACHE_MAX_ENTRIES
+                    or sum(e["bytes"] for e in self._prefix_cache.values()) > max_bytes
+                ):
+                    self._prefix_cache.popitem(last=False)
+
+            logger.info(f"[INFO] Cached prompt prefix: {len(tokens)} tokens, {size / (1024 ** 2):.1f} MB")
+        except Exception as e:
+            # The cache is an optimisation only; fall back to a full prefill.
+            logger.warning(f"[WARNING] Prefix cache unavailable: {e}")
+
+    def _response_cache_key(self, prompt: str, max_tokens: int, temperature: float, grammar: str):
+        """Response cache key for a request, or None when it is not cacheable"""
+        cache = self.response_cache
+        effective_temperature = config.LLM_TEMPERATURE if temperature is None else temperature
+        if cache is None or not cache.accepts(effective_temperature):
+            return None
+        cache.check_model()
+        return cache.key(prompt, max_tokens or config.LLM_MAX_TOKENS, effective_temperature, grammar)
+
+    def cached_response(self, prompt: str, max_tokens: int = None, *, temperature: float = None,
+                        grammar: str = None):
+        """
+        The stored completion for exactly this request, or None. The scheduler
+        checks this before queueing, so a hit never waits behind generations.
+        """
+        key = self._response_cache_key(prompt, max_tokens, temperature, grammar)
+        return self.response_cache.get(key) if key is not None else None
+
+    def generate(self, prompt: str, max_tokens: int = None, *, temperature: float = None,
+                 cache_prefix: str = None, grammar: str = None, lookup_cache: bool = True) -> str:
+        """
+        Generate text using LLM with error handling.
+        `cache_prefix` is the static leading part of the prompt (typically the
+        system preamble) whose KV state may be reused across calls.
+        `grammar` is a GBNF grammar (see utils/json_grammar.py) that constrains
+        sampling, e.g. to schema-valid JSON; generation ends when it completes.
+        With the response cache enabled, low-temperature completions are
+        served from disk when the exact same request was answered before
+        (`lookup_cache=False`: the caller already missed; only store).
+        """
+        self.wait_ready()
+        cache = self.response_cache
+        key = self._response_cache_key(prompt, max_tokens, temperature, grammar)
+        if key is not None and lookup_cache:
+            cached = cache.get(key)
+            if cached is not None:
+                return cached
+
+        if self.pool is not None:
+            try:
+                response = self.pool.generate(prompt, max_tokens, temperature=temperature,
+                                              cache_prefix=cache_prefix, grammar=grammar)
+            except Exception as e:
+                logger.exception(f"LLM pool error: {e}")
+                return GENERATION_ERROR
+        else:
+            if self.fallback_mode or not self.llm:
+                logger.warning("[WARNING] Running in offline mode - model not available")
+                return OFFLINE_MESSAGE
+
+            try:
+                with self._model_lock:
+                    self._use_prefix(prompt, cache_prefix)
+                    output = self.llm(prompt, **self._completion_kwargs(max_tokens, temperature, grammar))
+
+                if not output or 'choices' not in output:
+                    logger.error("Invalid LLM output format")
+                    return INVALID_OUTPUT_MESSAGE
+
+                response = output['choices'][0]['text'].strip()
+
+                # Safety check - remove stop tokens if they leaked through
+                for stop_token in STOP_TOKENS:
+                    if stop_token in response:
+                        response = response.split(stop_token)[0].strip()
+
+            except Exception as e:
+                logger.exception(f"Generation error: {e}")
+                return GENERATION_ERROR
+
+        # Pool workers report failures as these texts; never cache them
+        if key is not None and response not in ("", GENERATION_ERROR, INVALID_OUTPUT_MESSAGE, OFFLINE_MESSAGE):
+            try:
+                cache.put(key, response)
+            except Exception as e:
+                logger.warning(f"[WARNING] Could not store LLM response: {e}")
+        return response
+
+    def generate_stream(self, prompt: str, max_tokens: int = None, *, temperature: float = None,
+                        cache_prefix: str = None):
+        """
+        Yield the completion piece by piece as llama.cpp samples tokens.
+        Stop sequences are handled by llama.cpp, which holds back partial matches.
+        """
+        self.wait_ready()
+        if self.pool is None and (self.fallback_mode or not self.llm):
             logger.warning("[WARNING] Running in offline mode - model not available")
-            return ("[WARNING] AURA is running in offline mode. "
-                   "Please download the model using: python backend/download_models.py")
-        
+            yield OFFLINE_MESSAGE
+            return
+
+        started = time.perf_counter()
+        first_token_at = None
+        pieces = 0
+        if self.pool is not None:
+            source = self.pool.generate_stream(prompt, max_tokens, temperature=temperature, cache_prefix=cache_prefix)
+        else:
+            source = self._local_stream(prompt, max_tokens, temperature, cache_prefix)
         try:
-            output = self.llm(
-                prompt,
-                max_tokens=max_tokens,
-                stop=["<|end|>", "<|user|>", "<|assistant|>"],
-                echo=False,
-                temperature=temperature,
-                top_p=0.8,
-                repeat_penalty=1.2,
-                top_k=40
-            )
-            
-            if not output or 'choices' not in output:
-                logger.error("Invalid LLM output format")
-                return "I encountered an error generating a response."
-            
-            response = output['choices'][0]['text'].strip()
-            
-            # Safety check - remove stop tokens if they leaked through
-            for stop_token in ["<|end|>", "<|user|>", "<|assistant|>"]:
-                if stop_token in response:
-                    response = response.split(stop_token)[0].strip()
-            
-            return response
-            
+            for text in source:
+                if first_token_at is None:
+                    first_token_at = time.perf_counter()
+                pieces += 1
+                yield text
         except Exception as e:
-            logger.exception(f"Generation error: {e}")
-            return "I encountered an error. Please try again."
+            logger.exception(f"Streaming generation error: {e}")
+            if first_token_at is None:
+                yield GENERATION_ERROR
+        finally:
+            source.close()
+            if first_token_at is not None:
+                self._record_stream((first_token_at - started) * 1000, pieces)
+
+    def _local_stream(self, prompt: str, max_tokens: int, temperature: float, cache_prefix: str):
+        # Holds the model lock until the stream is exhausted or closed
+        with self._model_lock:
+            self._use_prefix(prompt, cache_prefix)
+            for chunk in self.llm(prompt, stream=True, **self._completion_kwargs(max_tokens, temperature)):
+                text = chunk['choices'][0].get('text', '') if chunk.get('choices') else ''
+                if text:
+                    yield text
+
+    def _record_stream(self, ttft_ms: float, pieces: int):
+        with self._stats_lock:
+            self.stats["streams"] += 1
+            self.stats["ttft_ms_total"] += ttft_ms
+            self.stats["last_ttft_ms"] = round(ttft_ms, 1)
+            self.stats["stream_tokens"] += pieces
+
+    def get_stats(self) -> dict:
+        """Snapshot of generation metrics for the stats endpoint"""
+        with self._stats_lock:
+            prefix_entries = list(self._prefix_cache.values())
+            streams = self.stats["streams"]
+            stats = {
+                "status": self.status,
+                "load_seconds": self.load_seconds,
+                "model_loaded": self.llm is not None or self.pool is not None,
+                "fallback_mode": self.fallback_mode,
+                "streams": streams,
+                "stream_tokens": self.stats["stream_tokens"],
+                "last_ttft_ms": self.stats["last_ttft_ms"],
+                "avg_ttft_ms": round(self.stats["ttft_ms_total"] / streams, 1) if streams else None,
+                "prefix_cache": {
+                    "enabled": config.LLM_PREFIX_CACHE_ENABLED,
+                    "entries": len(prefix_entries),
+                    "hits": self.stats["prefix_hits"],
+                    "misses": self.stats["prefix_misses"],
+                    "prefill_tokens_skipped": self.stats["prefill_tokens_skipped"],
+                    "memory_mb": round(sum(e["bytes"] for e in prefix_entries) / (1024 ** 2), 1),
+                },
+            }
+        if self.response_cache is not None:
+            stats["response_cache"] = self.response_cache.get_stats()
+        if self.embedding_cache is not None:
+            stats["embedding_cache"] = self.embedding_cache.get_stats()
+        if self.pool is not None:
+            # Prefix caches live in the workers; report pool traffic instead
+            stats["pool"] = self.pool.get_stats()
+        return stats
 
-    def embed(self, text: str) -> list:
+    def count_embedding_tokens(self, text: str) -> int:
+        """Word-piece count under the embedding model's tokenizer (used for chunking)"""
+        self.wait_ready()
+        tokenizer = getattr(self.embedding_model, "tokenizer", None)
+        if tokenizer is None:
+            return estimate_tokens(text)
+        return len(tokenizer.tokenize(text))
+
+    def embed(self, text: str, kind: str = "query") -> list:
         """Generate embeddings for text"""
+        return self.embed_batch([text], kind=kind)[0]
+
+    def embed_batch(self, texts: list, batch_size: int = None, kind: str = "ingest") -> list:
+        """
+        Embed many texts with one encode call; SentenceTransformer splits
+        them into batches of `batch_size` (default EMBED_BATCH_SIZE).
+        Texts already in the embedding cache are not re-encoded; `kind`
+        ("ingest", "query", ...) only labels the cache hit-rate stats.
+        """
+        if not texts:
+            return []
+        self.wait_ready()
         if not self.embedding_model:
             logger.warning("Embedding model not available")
-            return [0.0] * 384
-        
+            return [[0.0] * 384 for _ in texts]
+
         try:
-            embedding = self.embedding_model.encode(text, convert_to_numpy=True)
-            return embedding.tolist()
+            cache = self.embedding_cache
+            vectors = cache.get_many(texts, kind) if cache is not None else [None] * len(texts)
+            missing = [i for i, vector in enumerate(vectors) if vector is None]
+            if missing:
+                # Duplicate texts within one call are encoded once
+                unique = list(dict.fromkeys(texts[i] for i in missing))
+                encoded = self.embedding_model.encode(
+                    unique,
+                    batch_size=batch_size or config.EMBED_BATCH_SIZE,
+                    convert_to_numpy=True,
+                    show_progress_bar=False,
+                ).tolist()
+                by_text = dict(zip(unique, encoded))
+                for i in missing:
+                    vectors[i] = by_text[texts[i]]
+                if cache is not None:
+                    cache.put_many(unique, encoded)
+            return vectors
         except Exception as e:
             logger.exception(f"Embedding error: {e}")
-            return [0.0] * 384
+            return [[0.0] * 384 for _ in texts]
 
-# Global singleton
+# Global singleton, loaded lazily so importing the app stays fast; main.py
+# starts the background load on startup. Pool worker processes build their
+# own local model in llm_pool.serve_worker, so theirs stays an idle client.
+_singleton_kwargs = {"local": False, "load_embeddings": False} if config.LLM_POOL_WORKER else {}
 try:
-    llm = LLM()
+    llm = LLM(lazy=True, **_singleton_kwargs)
 except Exception as e:
     logger.exception(f"Failed to initialize LLM: {e}")
-    llm = LLM()  # This will trigger fallback mode
\ No newline at end of file
+    llm = LLM(**_singleton_kwargs)  # This will trigger fallback mode
\ No newline at end of file
@@ -0,0 +1,182 @@
+"""
+Multi-process inference worker pool.
+
+Each worker process loads the GGUF model with mmap, so the weights live once
+in the OS page cache no matter how many workers (or uvicorn processes) use
+them; only the KV cache and scratch buffers are per worker. Workers get a
+slice of the CPU threads and serve one completion at a time over a local
+multiprocessing.connection socket. API processes talk to them through
+LLMPoolClient instead of loading the model themselves.
+
+Start the pool with `python backend/run_llm_pool.py` and set LLM_POOL_SIZE
+to the same value for the API processes.
+"""
+from contextlib import contextmanager
+from multiprocessing.connection import Client, Listener
+import logging
+import multiprocessing
+import queue
+import threading
+import time
+
+from ..config import config
+
+logger = logging.getLogger(__name__)
+
+
+def worker_address(index: int):
+    return (config.LLM_POOL_HOST, config.LLM_POOL_BASE_PORT + index)
+
+
+def _authkey() -> bytes:
+    return config.SECRET_KEY.encode("utf-8")
+
+
+class LLMPoolClient:
+    """
+    Sends completions to pool workers. Within one API process each worker is
+    lent to a single request at a time; across processes, concurrent clients
+    simply wait in the worker's accept backlog.
+    """
+
+    def __init__(self, size: int = None):
+        size = size or config.LLM_POOL_SIZE
+        self.addresses = [worker_address(i) for i in range(size)]
+        self._free = queue.Queue()
+        for address in self.addresses:
+            self._free.put(address)
+        self._stats_lock = threading.Lock()
+        self.stats = {"requests": 0, "errors": 0, "busy": 0}
+
+    @contextmanager
+    def _connection(self):
+        address = self._free.get()
+        with self._stats_lock:
+            self.stats["requests"] += 1
+            self.stats["busy"] += 1
+        try:
+            conn = Client(address, authkey=_authkey())
+            try:
+                yield conn
+            finally:
+                conn.close()
+        except Exception:
+            with self._stats_lock:
+                self.stats["errors"] += 1
+            raise
+        finally:
+            with self._stats_lock:
+                self.stats["busy"] -= 1
+            self._free.put(address)
+
+    @staticmethod
+    def _request(op: str, prompt: str, max_tokens: int, **kwargs) -> dict:
+        return {"op": op, "prompt": prompt, "max_tokens": max_tokens, **kwargs}
+
+    def generate(self, prompt: str, max_tokens: int = None, *, temperature: float = None,
+                 cache_prefix: str = None, grammar: str = None) -> str:
+        with self._connection() as conn:
+            conn.send(self._request("generate", prompt, max_tokens, temperature=temperature,
+                                    cache_prefix=cache_prefix, grammar=grammar))
+            reply = conn.recv()
+        if "error" in reply:
+            raise RuntimeError(f"LLM worker error: {reply['error']}")
+        return reply["text"]
+
+    def generate_stream(self, prompt: str, max_tokens: int = None, *, temperature: float = None,
+                        cache_prefix: str = None):
+        # Closing this generator early closes the socket, which makes the
+        # worker abandon the completion.
+        with self._connection() as conn:
+            conn.send(self._request("stream", prompt, max_tokens, temperature=temperature,
+                                    cache_prefix=cache_prefix))
+            while True:
+                message = conn.recv()
+                if "error" in message:
+                    raise RuntimeError(f"LLM worker error: {message['error']}")
+                if message.get("done"):
+                    return
+                yield message["piece"]
+
+    def get_stats(self) -> dict:
+        with self._stats_lock:
+            return {"workers": len(self.addresses), **self.stats}
+
+
+def _handle(model, conn, request: dict):
+    op = request.get("op")
+    kwargs = {"temperature": request.get("temperature"), "cache_prefix": request.get("cache_prefix")}
+    if op == "generate":
+        text = model.generate(request["prompt"], request.get("max_tokens"), grammar=request.get("grammar"), **kwargs)
+        conn.send({"text": text})
+    elif op == "stream":
+        stream = model.generate_stream(request["prompt"], request.get("max_tokens"), **kwargs)
+        try:
+            for piece in stream:
+                conn.send({"piece": piece})
+            conn.send({"done": True})
+        finally:
+            stream.close()
+    elif op == "stats":
+        conn.send(model.get_stats())
+    else:
+        conn.send({"error": f"unknown op {op!r}"})
+
+
+def serve_worker(index: int, n_threads: int):
+    """Worker process entry point: load the model locally and serve requests."""
+    from .llm_models import LLM
+
+    model = LLM(local=True, n_threads=n_threads, load_embeddings=False)
+    address = worker_address(index)
+    with Listener(address, authkey=_authkey()) as listener:
+        logger.info(f"[OK] LLM worker {index} listening on {address[0]}:{address[1]} ({n_threads} threads)")
+        while True:
+            try:
+                conn = listener.accept()
+            except Exception as e:
+                logger.warning(f"[WARNING] LLM worker {index} rejected a connection: {e}")
+                continue
+            with conn:
+                try:
+                    _handle(model, conn, conn.recv())
+                except (EOFError, BrokenPipeError, ConnectionResetError):
+                    # Client went away (e.g. a cancelled stream)
+                    pass
+                except Exception as e:
+                    logger.exception(f"LLM worker {index} error: {e}")
+                    try:
+                        conn.send({"error": str(e)})
+                    except Exception:
+                        pass
+
+
+def run_pool(size: int = None, threads_per_worker: int = None):
+    """Start the worker processes and restart any that exit."""
+    size = size or config.LLM_POOL_SIZE
+    threads_per_worker = threads_per_worker or config.LLM_POOL_THREADS_PER_WORKER
+    if size <= 0:
+        raise SystemExit("Set LLM_POOL_SIZE to the number of worker processes to start")
+
+    # spawn: never fork a process that may already hold torch/llama state
+    ctx = multiprocessing.get_context("spawn")
+
+    def start(index):
+        process = ctx.Process(target=serve_worker, args=(index, threads_per_worker),
+                              name=f"aura-llm-worker-{index}", daemon=True)
+        process.start()
+        return process
+
+    print(f"🧠 Starting {size} LLM workers x {threads_per_worker} threads ({config.MODEL_PATH.name})")
+    workers = [start(i) for i in range(size)]
+    try:
+        while True:
+            time.sleep(5)
+            for i, process in enumerate(workers):
+                if not process.is_alive():
+                    logger.warning(f"[WARNING] LLM worker {i} exited ({process.exitcode}); restarting")
+                    workers[i] = start(i)
+    except KeyboardInterrupt:
+        print("Stopping LLM workers...")
+        for process in workers:
+            process.terminate()
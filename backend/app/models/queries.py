@@ -0,0 +1,81 @@
+"""
+Hot-path queries shared by services and routes.
+
+Each function returns a SELECT that runs on sync and async sessions alike,
+so the filters and ORDER BY live in one place next to the indexes in
+sql_models that serve them. tests/test_query_plans.py checks the plan of
+every statement here on each database backend; a query built inline
+elsewhere is not covered by that check.
+"""
+from datetime import datetime
+
+from sqlalchemy import case, func, select
+
+from .sql_models import ChatHistory, Document, Task
+
+# auto_schedule_tasks fills free blocks in this order; unknown priorities last
+PRIORITY_ORDER = {"urgent": 0, "high": 1, "medium": 2, "low": 3}
+
+
+def count_of(statement):
+    """SELECT COUNT(*) over the rows of `statement`"""
+    return select(func.count()).select_from(statement.subquery())
+
+
+def tasks_due_between(user_id: int, start: datetime, end: datetime):
+    """Open tasks due in [start, end), by the (user_id, completed, due_date) index"""
+    return select(Task).where(
+        Task.user_id == user_id,
+        Task.completed == False,  # noqa: E712
+        Task.due_date.isnot(None),
+        Task.due_date >= start,
+        Task.due_date < end,
+    )
+
+
+def unscheduled_tasks(user_id: int):
+    """Open tasks without a due date, most urgent first"""
+    return (
+        select(Task)
+        .where(Task.user_id == user_id, Task.due_date == None, Task.completed == False)  # noqa: E711,E712
+        .order_by(case(PRIORITY_ORDER, value=Task.priority, else_=len(PRIORITY_ORDER)), Task.id)
+    )
+
+
+def pending_tasks(user_id: int, limit: int = 10):
+    """The first `limit` open tasks by due date"""
+    return (
+        select(Task)
+        .where(Task.user_id == user_id, Task.completed == False)  # noqa: E712
+        .order_by(Task.due_date.asc())
+        .limit(limit)
+    )
+
+
+def tasks_completed_between(user_id: int, start: datetime, end: datetime = None):
+    """Tasks completed in [start, end) (end open when None)"""
+    statement = select(Task).where(
+        Task.user_id == user_id,
+        Task.completed == True,  # noqa: E712
+        Task.completed_at >= start,
+    )
+    return statement.where(Task.completed_at < end) if end is not None else statement
+
+
+def recent_chat_turns(user_id: int, limit: int = 10):
+    """The last `limit` chat turns, newest first"""
+    return (
+        select(ChatHistory)
+        .where(ChatHistory.user_id == user_id)
+        .order_by(ChatHistory.timestamp.desc())
+        .limit(limit)
+    )
+
+
+def document_by_filename(filename: str):
+    return select(Document).where(Document.filename == filename).limit(1)
+
+
+def document_by_body_key(key: str):
+    """Any document whose body is blob `key` (is the blob still referenced?)"""
+    return select(Document.id).where(Document.content_blob == key).limit(1)
@@ -0,0 +1,129 @@
+"""
+Persistent cache of LLM completions.
+
+At low temperatures the same prompt keeps producing (almost) the same text,
+so completions are stored in a small SQLite file keyed by a hash of
+everything that determines the output: prompt, max_tokens, temperature,
+grammar and the model file. Entries are evicted least-recently-used and the
+whole cache is dropped when the model file changes.
+"""
+from pathlib import Path
+import hashlib
+import json
+import logging
+import sqlite3
+import threading
+import time
+
+from ..config import config
+
+logger = logging.getLogger(__name__)
+
+
+def model_fingerprint(path: Path = None) -> str:
+    """Identifies the model file; changes whenever the file is replaced."""
+    path = path or config.MODEL_PATH
+    try:
+        stat = path.stat()
+    except OSError:
+        return f"{path.name}:missing"
+    return f"{path.name}:{stat.st_size}:{int(stat.st_mtime)}"
+
+
+class ResponseCache:
+    def __init__(self, path: Path = None, max_entries: int = None, max_temperature: float = None):
+        self.path = path or config.LLM_RESPONSE_CACHE_PATH
+        self.max_entries = max_entries or config.LLM_RESPONSE_CACHE_MAX_ENTRIES
+        self.max_temperature = (
+            max_temperature if max_temperature is not None else config.LLM_RESPONSE_CACHE_MAX_TEMPERATURE
+        )
+        self._lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0, "stores": 0, "evictions": 0, "invalidations": 0}
+
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(str(self.path), check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            "key TEXT PRIMARY KEY, response TEXT NOT NULL, created REAL NOT NULL, last_used REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS ix_responses_last_used ON responses(last_used)")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value TEXT)")
+        self._conn.commit()
+
+        row = self._conn.execute("SELECT value FROM meta WHERE name = 'model'").fetchone()
+        self.fingerprint = row[0] if row else None
+        self.check_model()
+
+    def check_model(self) -> bool:
+        """
+        Invalidation hook: drop every entry if the model file differs from the
+        one the cache was filled with. Cheap enough (one stat) to call before
+        each lookup. Returns True if the cache was cleared.
+        """
+        fingerprint = model_fingerprint()
+        if fingerprint == self.fingerprint:
+            return False
+        with self._lock:
+            cleared = self.fingerprint is not None
+            self._conn.execute("DELETE FROM responses")
+            self._conn.execute("INSERT OR REPLACE INTO meta (name, value) VALUES ('model', ?)", (fingerprint,))
+            self._conn.commit()
+            self.fingerprint = fingerprint
+            if cleared:
+                self.stats["invalidations"] += 1
+                logger.info(f"[INFO] LLM response cache cleared (model changed to {fingerprint})")
+            return cleared
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM responses")
+            self._conn.commit()
+            self.stats["invalidations"] += 1
+
+    def accepts(self, temperature: float) -> bool:
+        return temperature <= self.max_temperature
+
+    def key(self, prompt: str, max_tokens: int, temperature: float, grammar: str = None) -> str:
+        payload = json.dumps([self.fingerprint, prompt, max_tokens, round(temperature, 4), grammar or ""])
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def get(self, key: str):
+        with self._lock:
+            row = self._conn.execute("SELECT response FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.stats["misses"] += 1
+                return None
+            self._conn.execute("UPDATE responses SET last_used = ? WHERE key = ?", (time.time(), key))
+            self._conn.commit()
+            self.stats["hits"] += 1
+            return row[0]
+
+    def put(self, key: str, response: str):
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses (key, response, created, last_used) VALUES (?, ?, ?, ?)",
+                (key, response, now, now),
+            )
+            overflow = self._conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0] - self.max_entries
+            if overflow > 0:
+                self._conn.execute(
+                    "DELETE FROM responses WHERE key IN "
+                    "(SELECT key FROM responses ORDER BY last_used ASC LIMIT ?)",
+                    (overflow,),
+                )
+                self.stats["evictions"] += overflow
+            self._conn.commit()
+            self.stats["stores"] += 1
+
+    def get_stats(self) -> dict:
+        with self._lock:
+            entries = self._conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+            lookups = self.stats["hits"] + self.stats["misses"]
+            return {
+                "entries": entries,
+                "max_entries": self.max_entries,
+                "max_temperature": self.max_temperature,
+                "hit_ratio": round(self.stats["hits"] / lookups, 3) if lookups else None,
+                **self.stats,
+            }
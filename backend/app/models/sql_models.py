@@ -1,14 +1,71 @@
-from sqlalchemy import Column, Integer, String, Text, DateTime, Boolean, ForeignKey, JSON
-from sqlalchemy.orm import relationship
+from sqlalchemy import Column, Integer, String, Text, DateTime, Boolean, ForeignKey, JSON, Index, cast, exists, func, literal, text
+from sqlalchemy.dialects.postgresql import JSONB
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.orm import relationship, deferred
+from sqlalchemy.sql.functions import FunctionElement
 from datetime import datetime
 from ..database import Base
 
+# JSON columns are stored as jsonb on PostgreSQL (binary, indexable)
+JSONType = JSON().with_variant(JSONB(), "postgresql")
+
+# Text search configuration for the PostgreSQL tsvector indexes. Spelled as
+# SQL constants, not bound parameters, so queries match the index expressions.
+SEARCH_CONFIG = text("'english'::regconfig")
+
+
+def search_vector(*weighted_columns):
+    """tsvector over (column, weight) pairs; weights 'A' (highest) to 'D'"""
+    vector = None
+    for column, weight in weighted_columns:
+        part = func.setweight(
+            func.to_tsvector(SEARCH_CONFIG, func.coalesce(column, text("''"))),
+            text(f"'{weight}'"),
+        )
+        vector = part if vector is None else vector.op('||')(part)
+    return vector
+
+
+class json_list_contains(FunctionElement):
+    """
+    `column` (a JSON list serialized into a text column, like Task.tags)
+    contains the string `value`, compared exactly (case-sensitive). A jsonb
+    containment (@>) on PostgreSQL, served by a GIN index; a json_each()
+    lookup on SQLite; elsewhere a LIKE on the quoted value, with LIKE
+    wildcards in the value escaped.
+    """
+    type = Boolean()
+    inherit_cache = True
+    name = "json_list_contains"
+
+
+@compiles(json_list_contains)
+def _json_list_contains_like(element, compiler, **kw):
+    column, value = list(element.clauses)
+    for char in ("\\", "%", "_"):
+        value = func.replace(value, char, "\\" + char)
+    return compiler.process(column.like(literal('%"') + value + literal('"%'), escape="\\"), **kw)
+
+
+@compiles(json_list_contains, "sqlite")
+def _json_list_contains_json_each(element, compiler, **kw):
+    column, value = list(element.clauses)
+    items = func.json_each(column).table_valued("value")
+    return compiler.process(exists().where(items.c.value == value), **kw)
+
+
+@compiles(json_list_contains, "postgresql")
+def _json_list_contains_jsonb(element, compiler, **kw):
+    column, value = list(element.clauses)
+    return compiler.process(cast(column, JSONB).contains(func.jsonb_build_array(value)), **kw)
+
+
 class User(Base):
     __tablename__ = 'users'
     id = Column(Integer, primary_key=True)
     name = Column(String(100))
     preferences = Column(Text, default='{}')
-    settings = Column(JSON, default={})
+    settings = Column(JSONType, default={})
     created_at = Column(DateTime, default=datetime.utcnow)
     
     tasks = relationship("Task", back_populates="user", order_by="Task.due_date")
@@ -37,6 +94,20 @@ class Task(Base):
     user = relationship("User", back_populates="tasks")
     subtasks = relationship("Task", backref="parent", remote_side=[id])
 
+    __table_args__ = (
+        # Open tasks in a due_date range (schedule, chat context, task queries)
+        Index('ix_tasks_user_completed_due', 'user_id', 'completed', 'due_date'),
+        # Tasks completed in a period (focus score, day summary)
+        Index('ix_tasks_user_completed_at', 'user_id', 'completed', 'completed_at'),
+    )
+
+# Tag filters (json_list_contains) on PostgreSQL
+Index('ix_tasks_tags_gin', cast(Task.tags, JSONB), postgresql_using='gin').ddl_if(dialect='postgresql')
+
+# Full-text search on PostgreSQL (models/full_text.py); SQLite uses FTS5 tables
+task_search_vector = search_vector((Task.title, 'A'), (Task.description, 'B'))
+Index('ix_tasks_search', task_search_vector, postgresql_using='gin').ddl_if(dialect='postgresql')
+
 class Reminder(Base):
     __tablename__ = 'reminders'
     id = Column(Integer, primary_key=True)
@@ -54,18 +125,44 @@ class ChatHistory(Base):
     role = Column(String(20))
     content = Column(Text)
     intent = Column(String(50), nullable=True)
-    meta_data = Column(JSON, default={})
+    meta_data = Column(JSONType, default={})
     timestamp = Column(DateTime, default=datetime.utcnow)
 
+    __table_args__ = (
+        Index('ix_chat_history_user_timestamp', 'user_id', 'timestamp'),
+    )
+
+chat_search_vector = search_vector((ChatHistory.content, 'A'))
+Index('ix_chat_history_search', chat_search_vector, postgresql_using='gin').ddl_if(dialect='postgresql')
+
 class Document(Base):
     __tablename__ = 'documents'
     id = Column(Integer, primary_key=True)
     user_id = Column(Integer, ForeignKey('users.id'), default=1)
-    filename = Column(String(200))
-    content = Column(Text)
+    filename = Column(String(200), index=True)
+    content = deferred(Column(Text)) # legacy inline body; new bodies live in the blob store
+    content_blob = Column(String(64), nullable=True, index=True) # blob_store key of the extracted text
     file_type = Column(String(50))
+    content_hash = Column(String(64), index=True) # sha256 of the uploaded bytes
+    file_size = Column(Integer, nullable=True)
     uploaded_at = Column(DateTime, default=datetime.utcnow)
 
+class IngestionJob(Base):
+    __tablename__ = 'ingestion_jobs'
+    id = Column(Integer, primary_key=True)
+    document_id = Column(Integer, ForeignKey('documents.id'), index=True)
+    filename = Column(String(200))
+    status = Column(String(20), default='queued', index=True) # queued, parsing, embedding, done, failed
+    chunks_done = Column(Integer, default=0)
+    counts = Column(JSONType, default={})
+    attempts = Column(Integer, default=0)
+    error = Column(Text, nullable=True)
+    owner = Column(String(100), nullable=True) # worker process running the job (host:pid:nonce)
+    heartbeat_at = Column(DateTime, nullable=True) # refreshed by the owner while the job runs
+    created_at = Column(DateTime, default=datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    finished_at = Column(DateTime, nullable=True)
+
 class RoutineEvent(Base):
     __tablename__ = 'routine_events'
     id = Column(Integer, primary_key=True, index=True)
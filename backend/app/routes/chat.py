@@ -1,11 +1,20 @@
-from fastapi import APIRouter, Depends, HTTPException, Request
-from sqlalchemy.orm import Session
-from datetime import datetime
+from fastapi import APIRouter, Depends, HTTPException, Request, WebSocket, WebSocketDisconnect
+from fastapi.responses import StreamingResponse
+from sqlalchemy import delete
+from sqlalchemy.ext.asyncio import AsyncSession
+import json
 
-from ..database import get_db
+from ..database import get_async_db, AsyncSessionLocal
 from ..models.sql_models import ChatHistory
 from ..models.pydantic_models import ChatMessage, ChatResponse
-from ..services.chat_service import process_chat
+from ..models.llm_models import llm
+from ..services.chat_service import process_chat, stream_chat
+from ..services.llm_scheduler import llm_scheduler, LLMBusyError
+from ..services.intent_classifier import intent_classifier
+from ..services.embedding_service import embedder
+from ..services.reranker import reranker
+from ..services.vector_store import vector_store
+from ..write_queue import write_queue
 from ..utils.security import sanitize_input, limiter
 from ..utils.responses import success_response
 
@@ -14,34 +23,20 @@ router = APIRouter()
 
 @router.post("/chat", response_model=ChatResponse)
 @limiter.limit("5/minute")
-async def chat_endpoint(request: Request, msg: ChatMessage, db: Session = Depends(get_db)):
+async def chat_endpoint(request: Request, msg: ChatMessage, db: AsyncSession = Depends(get_async_db)):
     """
-    Primary chat endpoint. Persists the raw user message and then delegates
-    to the ChatService, which handles tool routing and RAG.
+    Primary chat endpoint. Delegates to the ChatService, which handles tool
+    routing and RAG and persists the turn.
     """
     # Note: Request object is needed for slowapi
     try:
-        # Sanitize input
-        user_message = sanitize_input(msg.message)
-
-        # Save User Message
-        user_msg = ChatHistory(
-            user_id=1,
-            role="user",
-            content=user_message,
-            timestamp=datetime.utcnow(),
-        )
-        db.add(user_msg)
-        db.commit()
-
-        # Process Chat
-        # Based on chat_service.py, process_chat takes (user_id, message_data, db)
-        result = await process_chat(1, msg, db)
+        message = ChatMessage(message=sanitize_input(msg.message), context=msg.context)
+        result = await process_chat(1, message, db)
 
         return result
 
-    except HTTPException:
-        # Let explicit HTTP errors bubble up
+    except (HTTPException, LLMBusyError):
+        # Let explicit HTTP errors and LLM backpressure (429/503) bubble up
         raise
     except Exception as e:
         import logging
@@ -51,17 +46,90 @@ async def chat_endpoint(request: Request, msg: ChatMessage, db: Session = Depend
         raise HTTPException(status_code=500, detail="Internal server error")
 
 
+@router.post("/chat/stream")
+@limiter.limit("5/minute")
+async def chat_stream_endpoint(request: Request, msg: ChatMessage):
+    """
+    Streaming chat endpoint (Server-Sent Events).
+
+    Each event is a JSON object on a `data:` line: a "start" event, one
+    "token" event per generated piece, and a final "done" event with the
+    same payload as POST /chat plus time-to-first-token metrics.
+    """
+    message = ChatMessage(message=sanitize_input(msg.message), context=msg.context)
+    # Reject before the 200 stream starts so clients get a real 429
+    llm_scheduler.check_capacity()
+
+    async def event_source():
+        # The session lives as long as the stream, not the request handler
+        async with AsyncSessionLocal() as db:
+            async for event in stream_chat(1, message, db):
+                yield f"data: {json.dumps(event)}\n\n"
+
+    return StreamingResponse(
+        event_source(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@router.websocket("/chat/ws")
+async def chat_websocket(websocket: WebSocket):
+    """
+    Streaming chat over a WebSocket. The client sends
+    {"message": "...", "context": {...}} and receives the same events as
+    the SSE endpoint, one JSON frame per event.
+    """
+    await websocket.accept()
+    try:
+        while True:
+            payload = await websocket.receive_json()
+            message = ChatMessage(
+                message=sanitize_input(payload.get("message", "")),
+                context=payload.get("context") or {},
+            )
+            # A fresh session per message: sees current settings, holds no connection while idle
+            async with AsyncSessionLocal() as db:
+                async for event in stream_chat(1, message, db):
+                    await websocket.send_json(event)
+    except WebSocketDisconnect:
+        pass
+    except Exception as e:
+        import logging
+
+        logger = logging.getLogger(__name__)
+        logger.error(f"Chat websocket error: {str(e)}", exc_info=True)
+
+
+@router.get("/chat/stats")
+async def chat_stats():
+    """
+    Generation metrics (time-to-first-token, prefix cache), scheduler
+    queue depth / wait times, intent classifier hit rates and embedding
+    batching / ingestion throughput, SQLite write batching.
+    """
+    return success_response(data={
+        **llm.get_stats(),
+        "scheduler": llm_scheduler.get_stats(),
+        "intent_classifier": intent_classifier.get_stats(),
+        "embeddings": embedder.get_stats(),
+        "reranker": reranker.get_stats(),
+        "vector_store": vector_store.get_stats(),
+        "write_queue": write_queue.get_stats(),
+    })
+
+
 @router.delete("/chat/history")
-async def clear_chat_history(db: Session = Depends(get_db)):
+async def clear_chat_history(db: AsyncSession = Depends(get_async_db)):
     """
     Clear all stored chat history for the default user.
     """
     try:
-        deleted = db.query(ChatHistory).filter(ChatHistory.user_id == 1).delete()
-        db.commit()
-        return success_response(data={"deleted": deleted}, message="Chat history cleared.")
+        result = await db.execute(delete(ChatHistory).where(ChatHistory.user_id == 1))
+        await db.commit()
+        return success_response(data={"deleted": result.rowcount}, message="Chat history cleared.")
     except Exception as e:
-        db.rollback()
+        await db.rollback()
         import logging
 
         logger = logging.getLogger(__name__)
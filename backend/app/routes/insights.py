@@ -1,9 +1,8 @@
 from fastapi import APIRouter, Depends, HTTPException
 from sqlalchemy.orm import Session
-from sqlalchemy import and_
 from ..database import get_db
 from ..services.schedule_service import get_analytics
-from ..models.sql_models import Task
+from ..models.queries import count_of, tasks_completed_between
 from datetime import datetime, timedelta
 
 router = APIRouter()
@@ -30,24 +29,12 @@ def get_focus_score(db: Session = Depends(get_db)):
         previous_week_end = today - timedelta(days=7)
         
         # Count completed tasks in current week
-        current_week_completed = db.query(Task).filter(
-            and_(
-                Task.user_id == 1,
-                Task.completed == True,
-                Task.completed_at >= week_start,
-                Task.completed_at < week_end
-            )
-        ).count()
+        current_week_completed = db.scalar(count_of(tasks_completed_between(1, week_start, week_end)))
         
         # Count completed tasks in previous week
-        previous_week_completed = db.query(Task).filter(
-            and_(
-                Task.user_id == 1,
-                Task.completed == True,
-                Task.completed_at >= previous_week_start,
-                Task.completed_at < previous_week_end
-            )
-        ).count()
+        previous_week_completed = db.scalar(
+            count_of(tasks_completed_between(1, previous_week_start, previous_week_end))
+        )
         
         # Calculate trend percentage
         productivity_trend = None
@@ -1,7 +1,10 @@
+import html
+
 from fastapi import APIRouter, Depends, HTTPException
 from sqlalchemy.orm import Session
-from ..database import get_db, collection
-from ..models.sql_models import Task, ChatHistory, Document
+from ..database import get_db
+from ..models.full_text import search_chat_history, search_tasks
+from ..services.rag_service import query_rag_chunks
 
 router = APIRouter()
 
@@ -10,58 +13,43 @@ def search_all(q: str, db: Session = Depends(get_db)):
     if not q:
         return {"tasks": [], "knowledge": []}
     
-    query = q.lower()
+    dialect = db.bind.dialect.name
     results = {"tasks": [], "knowledge": []}
     
-    # 1. Search Tasks (SQL Fuzzy)
-    tasks = db.query(Task).filter(
-        Task.user_id == 1,
-        (Task.title.ilike(f'%{query}%') | Task.description.ilike(f'%{query}%'))
-    ).all()
-    
-    for task in tasks:
+    # 1. Search Tasks (full-text index, best match first)
+    for task, score, snippet in db.execute(search_tasks(dialect, 1, q)):
         results["tasks"].append({
             "id": task.id,
             "title": task.title,
-            "snippet": (task.description[:100] + "...") if task.description else "No description",
+            "snippet": snippet or "No description",
+            "score": score,
             "date": task.created_at.strftime("%Y-%m-%d"),
             "status": "Completed" if task.completed else "Pending",
             "priority": task.priority
         })
         
-    # 2. Search Knowledge (Documents via ChromaDB + Chats via SQL)
+    # 2. Search Knowledge (Documents via hybrid retrieval + Chats via the full-text index)
     
-    # A. Documents (Vector Search)
-    if collection:
-        try:
-            vector_results = collection.query(
-                query_texts=[q],
-                n_results=5
-            )
+    # A. Documents (dense + BM25 over the indexed chunks, so exact words match too)
+    try:
+        for chunk in query_rag_chunks(q, 5):
+            doc_text = chunk["text"]
+            results["knowledge"].append({
+                "type": "document",
+                "title": chunk["metadata"].get('filename', 'Unknown Document'),
+                "snippet": html.escape(doc_text[:150] + "...") if doc_text else "",
+                "score": chunk["score"]
+            })
+    except Exception as e:
+        print(f"Document search failed: {e}")
             
-            if vector_results['documents']:
-                for i, doc_text in enumerate(vector_results['documents'][0]):
-                    meta = vector_results['metadatas'][0][i]
-                    results["knowledge"].append({
-                        "type": "document",
-                        "title": meta.get('filename', 'Unknown Document'),
-                        "snippet": (doc_text[:150] + "...") if doc_text else "",
-                        "score": "High Relevance"
-                    })
-        except Exception as e:
-            print(f"Vector search failed: {e}")
-            
-    # B. Chats (SQL Fallback/Supplement)
-    chats = db.query(ChatHistory).filter(
-        ChatHistory.user_id == 1,
-        ChatHistory.content.ilike(f'%{query}%')
-    ).order_by(ChatHistory.timestamp.desc()).limit(5).all()
-    
-    for chat in chats:
+    # B. Chats
+    for chat, score, snippet in db.execute(search_chat_history(dialect, 1, q, limit=5)):
         results["knowledge"].append({
             "type": "chat",
             "title": f"Chat History ({chat.role})",
-            "snippet": (chat.content[:100] + "...") if len(chat.content) > 100 else chat.content,
+            "snippet": snippet,
+            "score": score,
             "date": chat.timestamp.strftime("%Y-%m-%d %H:%M")
         })
 
@@ -2,7 +2,8 @@ from fastapi import APIRouter, Depends, HTTPException, Query
 from sqlalchemy.orm import Session
 from typing import List, Optional
 from ..database import get_db
-from ..models.sql_models import Task
+from ..models import full_text
+from ..models.sql_models import Task, json_list_contains
 from ..models.pydantic_models import TaskCreate, TaskResponse, TaskUpdate
 from ..services.schedule_service import generate_routine
 from datetime import datetime
@@ -27,7 +28,7 @@ def get_tasks(
             query = query.filter(Task.priority == priority)
         
         if tag:
-            query = query.filter(Task.tags.like(f'%"{tag}"%'))
+            query = query.filter(json_list_contains(Task.tags, tag))
         
         tasks = query.order_by(Task.completed.asc(), Task.due_date.asc()).all()
         
@@ -361,13 +362,8 @@ def delete_task(task_id: int, db: Session = Depends(get_db)):
 @router.get("/tasks/search/{query}")
 def search_tasks(query: str, db: Session = Depends(get_db)):
     try:
-        tasks = db.query(Task).filter(
-            Task.user_id == 1,
-            (Task.title.ilike(f'%{query}%') | Task.description.ilike(f'%{query}%'))
-        ).all()
-        
         result = []
-        for task in tasks:
+        for task, score, snippet in db.execute(full_text.search_tasks(db.bind.dialect.name, 1, query)):
             task_dict = {
                 'id': task.id,
                 'title': task.title,
@@ -380,7 +376,9 @@ def search_tasks(query: str, db: Session = Depends(get_db)):
                 'tags': json.loads(task.tags) if task.tags else [],
                 'recurring': task.recurring,
                 'created_at': task.created_at,
-                'completed_at': task.completed_at
+                'completed_at': task.completed_at,
+                'snippet': snippet,
+                'score': score
             }
             result.append(task_dict)
         
@@ -1,67 +1,146 @@
-from fastapi import APIRouter, UploadFile, File, Depends, BackgroundTasks
-from sqlalchemy.orm import Session
-from ..database import get_db
+from typing import Optional
+from fastapi import APIRouter, Depends, Request
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from ..database import get_async_db
 from ..models.sql_models import Document
-from ..services.rag_service import add_to_rag, delete_document_embeddings
-from ..utils.parser import parse_document
+from ..models.queries import document_by_filename
+from ..services.rag_service import delete_document_embeddings
+from ..services.ingestion_service import ingestion_queue, release_blob_async, source_path
 from ..utils.responses import success_response, error_response
+from ..utils.upload_stream import UploadError, receive_upload
+import asyncio
+import os
 
 router = APIRouter()
 
 
+def _document_data(doc: Document, **extra) -> dict:
+    return {
+        "id": doc.id,
+        "filename": doc.filename,
+        "uploaded_at": doc.uploaded_at.isoformat() if doc.uploaded_at else None,
+        **extra,
+    }
+
+
 @router.post("/upload")
 async def upload_file(
-    background_tasks: BackgroundTasks,
-    file: UploadFile = File(...),
-    db: Session = Depends(get_db),
+    request: Request,
+    replace: bool = False,
+    duplicate: str = "reject",
+    db: AsyncSession = Depends(get_async_db),
 ):
     """
-    Upload a document, store it in SQL, and enqueue background RAG indexing.
-    Uses a consistent response envelope for success/error.
+    Upload a document (multipart field `file`), store it in SQL, and enqueue
+    an ingestion job that parses and indexes it for RAG (progress via
+    `GET /upload/jobs` and the notifications socket).
+
+    The body is streamed to a spool file under UPLOADS_DIR while its sha256
+    is computed; uploads over MAX_UPLOAD_SIZE are cut off early. Identical
+    content already stored under another name is rejected, or with
+    `?duplicate=link` resolved to the existing document, instead of being
+    parsed and embedded again. `link` is only a lookup: nothing is stored
+    under the new filename, and the response returns the existing document
+    (plus `requested_filename`). With `?replace=true` an existing document of
+    the same name is updated and re-indexed incrementally (only changed
+    chunks are embedded); re-uploading unchanged bytes is a no-op.
+    Uses a consistent response envelope for success/error. Database and
+    file work never runs on the event loop (async session, worker threads).
     """
+    upload = None
     try:
-        content = parse_document(file.file, file.content_type)
+        upload = await receive_upload(request)
+        filename = upload.filename
 
         # Check if file already exists to avoid duplicates (optional, but good practice)
-        existing = db.query(Document).filter(Document.filename == file.filename).first()
-        if existing:
+        existing = (await db.scalars(document_by_filename(filename))).first()
+        if existing and not replace:
             return error_response(
                 message="File already exists",
                 code="FILE_ALREADY_EXISTS",
-                details={"filename": file.filename},
+                details={"filename": filename},
+            )
+        if existing and existing.content_hash == upload.sha256:
+            return success_response(data=_document_data(existing), message="File unchanged. Nothing to re-index.")
+
+        same_content = (await db.scalars(
+            select(Document)
+            .where(Document.content_hash == upload.sha256, Document.filename != filename)
+            .limit(1)
+        )).first()
+        if same_content:
+            if duplicate == "link":
+                return success_response(
+                    data=_document_data(same_content, linked=True, requested_filename=filename),
+                    message=f"Identical content already uploaded as {same_content.filename}. Using that document.",
+                )
+            return error_response(
+                message="Identical content already uploaded",
+                code="DUPLICATE_CONTENT",
+                details={
+                    "filename": filename,
+                    "existing_id": same_content.id,
+                    "existing_filename": same_content.filename,
+                },
             )
 
-        doc = Document(filename=file.filename, content=content, file_type=file.content_type)
-        db.add(doc)
-        db.commit()
-        db.refresh(doc)
+        if existing:
+            await asyncio.to_thread(os.replace, upload.path, source_path(existing.id))
+            existing.file_type = upload.content_type
+            existing.content_hash = upload.sha256
+            existing.file_size = upload.size
+            await db.commit()
 
-        # Process RAG in background
-        background_tasks.add_task(add_to_rag, file.filename, content)
+            job = await db.run_sync(ingestion_queue.enqueue, existing)
+
+            return success_response(
+                data=_document_data(existing, job_id=job.id),
+                message="File updated. Re-indexing changed sections in background.",
+            )
+
+        doc = Document(
+            filename=filename, file_type=upload.content_type, content_hash=upload.sha256, file_size=upload.size
+        )
+        db.add(doc)
+        await db.commit()
+        await db.refresh(doc)
+        try:
+            await asyncio.to_thread(os.replace, upload.path, source_path(doc.id))
+        except Exception:
+            await db.delete(doc)
+            await db.commit()
+            raise
+
+        # Parse and index for RAG in the ingestion workers
+        job = await db.run_sync(ingestion_queue.enqueue, doc)
 
         return success_response(
-            data={
-                "id": doc.id,
-                "filename": doc.filename,
-                "uploaded_at": doc.uploaded_at.isoformat() if doc.uploaded_at else None,
-            },
+            data=_document_data(doc, job_id=job.id),
             message="File uploaded. Processing for search in background.",
         )
+    except UploadError as e:
+        return error_response(message=e.message, code=e.code, details=e.details)
     except Exception as e:
         import logging
 
         logger = logging.getLogger(__name__)
         logger.error(f"Upload error: {str(e)}", exc_info=True)
         return error_response(message="Failed to upload file", code="UPLOAD_ERROR", details={"error": str(e)})
+    finally:
+        if upload:
+            # No-op once the spool file has been moved into place
+            await asyncio.to_thread(upload.discard)
 
 
 @router.get("/upload/files")
-async def list_files(db: Session = Depends(get_db)):
+async def list_files(db: AsyncSession = Depends(get_async_db)):
     """
     List all uploaded documents for the current user.
     """
     try:
-        docs = db.query(Document).all()
+        # Only the listed columns: document bodies are never loaded here
+        docs = (await db.execute(select(Document.id, Document.filename, Document.uploaded_at))).all()
         files = [
             {
                 "id": doc.id,
@@ -79,15 +158,32 @@ async def list_files(db: Session = Depends(get_db)):
         return error_response(message="Failed to list files", code="LIST_FILES_ERROR", details={"error": str(e)})
 
 
+@router.get("/upload/jobs")
+async def list_jobs(status: Optional[str] = None, limit: int = 50, db: AsyncSession = Depends(get_async_db)):
+    """
+    Recent ingestion jobs, newest first, optionally filtered by status
+    (queued, parsing, embedding, done, failed).
+    """
+    try:
+        jobs = await db.run_sync(ingestion_queue.list_jobs, status=status, limit=min(max(limit, 1), 500))
+        return success_response(data={"jobs": jobs, "queue": ingestion_queue.get_stats()})
+    except Exception as e:
+        import logging
+
+        logger = logging.getLogger(__name__)
+        logger.error(f"List jobs error: {str(e)}", exc_info=True)
+        return error_response(message="Failed to list ingestion jobs", code="LIST_JOBS_ERROR", details={"error": str(e)})
+
+
 @router.delete("/upload/{doc_id}")
-async def delete_file(doc_id: int, db: Session = Depends(get_db)):
+async def delete_file(doc_id: int, db: AsyncSession = Depends(get_async_db)):
     """
-    Delete a document from SQL and remove its embeddings from ChromaDB.
+    Delete a document from SQL and remove its embeddings and raw upload.
 
     This performs a hard delete of the knowledge base entry for now.
     """
     try:
-        doc = db.query(Document).filter(Document.id == doc_id).first()
+        doc = await db.get(Document, doc_id)
         if not doc:
             return error_response(
                 message="Document not found",
@@ -97,12 +193,15 @@ async def delete_file(doc_id: int, db: Session = Depends(get_db)):
 
         filename = doc.filename
 
-        # Remove embeddings from ChromaDB
-        deleted_count = delete_document_embeddings(filename)
+        # Remove embeddings from the vector store and the raw upload
+        deleted_count = await asyncio.to_thread(delete_document_embeddings, filename)
+        await asyncio.to_thread(source_path(doc_id).unlink, missing_ok=True)
 
-        # Delete SQL record
-        db.delete(doc)
-        db.commit()
+        # Delete SQL record, then the body if no other document shares it
+        body_key = doc.content_blob
+        await db.delete(doc)
+        await db.commit()
+        await release_blob_async(db, body_key)
 
         return success_response(
             data={
@@ -117,5 +216,5 @@ async def delete_file(doc_id: int, db: Session = Depends(get_db)):
 
         logger = logging.getLogger(__name__)
         logger.error(f"Delete file error: {str(e)}", exc_info=True)
-        db.rollback()
+        await db.rollback()
         return error_response(message="Failed to delete document", code="DELETE_DOCUMENT_ERROR", details={"error": str(e)})
\ No newline at end of file
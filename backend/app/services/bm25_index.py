@@ -0,0 +1,139 @@
+"""
+Lexical (BM25) index kept next to the vector store.
+
+Dense MiniLM retrieval is weak on exact tokens such as course codes, names
+and error strings; BM25 over the same chunks catches those. Postings live in
+a SQLite file under DATA_DIR and are updated by rag_service whenever chunks
+are added or removed, using the same chunk ids as the vector store. When
+the tokenizer changes the index is emptied, and main.py's startup
+sync_lexical_index rebuilds it from the vector store.
+"""
+from collections import Counter
+from pathlib import Path
+import logging
+import math
+import re
+import sqlite3
+import threading
+
+from ..config import config
+
+logger = logging.getLogger(__name__)
+
+# Words (letters and digits in any script) joined by . - _ stay together
+# ("cs-101", "err_timeout", "v2.1") and their parts are indexed too.
+_TOKEN_RE = re.compile(r"[^\W_]+(?:[._\-][^\W_]+)*", re.UNICODE)
+TOKENIZER_VERSION = "2"  # bump whenever tokenize() changes
+_STOPWORDS = frozenset(
+    "a an and are as at be by for from has have i in is it its me my of on or our so that the "
+    "this to was we were what when where which who why will with you your".split()
+)
+
+
+def tokenize(text: str) -> list:
+    tokens = []
+    for token in _TOKEN_RE.findall(text.lower()):
+        if token in _STOPWORDS:
+            continue
+        tokens.append(token)
+        parts = re.split(r"[._\-]", token)
+        if len(parts) > 1:
+            tokens.extend(p for p in parts if p and p not in _STOPWORDS)
+    return tokens
+
+
+class BM25Index:
+    def __init__(self, path: Path = None, k1: float = 1.2, b: float = 0.75):
+        self.path = path or config.BM25_INDEX_PATH
+        self.k1 = k1
+        self.b = b
+        self._lock = threading.Lock()
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(str(self.path), check_same_thread=False)
+        self._conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS chunks (
+                chunk_id TEXT PRIMARY KEY, filename TEXT NOT NULL, length INTEGER NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS ix_chunks_filename ON chunks(filename);
+            CREATE TABLE IF NOT EXISTS postings (
+                term TEXT NOT NULL, chunk_id TEXT NOT NULL, tf INTEGER NOT NULL,
+                PRIMARY KEY (term, chunk_id)
+            ) WITHOUT ROWID;
+            CREATE INDEX IF NOT EXISTS ix_postings_chunk ON postings(chunk_id);
+            CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL);
+            """
+        )
+        row = self._conn.execute("SELECT value FROM meta WHERE key = 'tokenizer'").fetchone()
+        if (row[0] if row else None) != TOKENIZER_VERSION:
+            # Postings from another tokenizer would never match new queries
+            if self._conn.execute("SELECT 1 FROM chunks LIMIT 1").fetchone():
+                logger.info("[INFO] Lexical index built with an older tokenizer; rebuilding it")
+            self._conn.execute("DELETE FROM postings")
+            self._conn.execute("DELETE FROM chunks")
+            self._conn.execute(
+                "INSERT OR REPLACE INTO meta (key, value) VALUES ('tokenizer', ?)", (TOKENIZER_VERSION,)
+            )
+        self._conn.commit()
+
+    def _delete(self, chunk_ids: list):
+        for start in range(0, len(chunk_ids), 500):
+            batch = chunk_ids[start:start + 500]
+            marks = ",".join("?" * len(batch))
+            self._conn.execute(f"DELETE FROM postings WHERE chunk_id IN ({marks})", batch)
+            self._conn.execute(f"DELETE FROM chunks WHERE chunk_id IN ({marks})", batch)
+
+    def add(self, chunk_ids: list, texts: list, filename: str):
+        """Index (or re-index) chunks."""
+        chunk_rows, posting_rows = [], []
+        for chunk_id, text in zip(chunk_ids, texts):
+            counts = Counter(tokenize(text))
+            chunk_rows.append((chunk_id, filename, sum(counts.values())))
+            posting_rows.extend((term, chunk_id, tf) for term, tf in counts.items())
+        with self._lock:
+            self._delete(list(chunk_ids))
+            self._conn.executemany("INSERT INTO chunks (chunk_id, filename, length) VALUES (?, ?, ?)", chunk_rows)
+            self._conn.executemany("INSERT INTO postings (term, chunk_id, tf) VALUES (?, ?, ?)", posting_rows)
+            self._conn.commit()
+
+    def delete(self, chunk_ids: list):
+        with self._lock:
+            self._delete(list(chunk_ids))
+            self._conn.commit()
+
+    def delete_document(self, filename: str):
+        with self._lock:
+            ids = [row[0] for row in self._conn.execute("SELECT chunk_id FROM chunks WHERE filename = ?", (filename,))]
+            self._delete(ids)
+            self._conn.commit()
+
+    def count(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM chunks").fetchone()[0]
+
+    def search(self, query: str, k: int = 10) -> list:
+        """Top-k (chunk_id, bm25 score) pairs for `query`, best first."""
+        terms = set(tokenize(query))
+        if not terms:
+            return []
+        with self._lock:
+            n_docs, total_length = self._conn.execute("SELECT COUNT(*), COALESCE(SUM(length), 0) FROM chunks").fetchone()
+            if not n_docs:
+                return []
+            avg_length = total_length / n_docs or 1.0
+            scores = Counter()
+            for term in terms:
+                rows = self._conn.execute(
+                    "SELECT p.chunk_id, p.tf, c.length FROM postings p JOIN chunks c USING (chunk_id) WHERE p.term = ?",
+                    (term,),
+                ).fetchall()
+                if not rows:
+                    continue
+                idf = math.log(1 + (n_docs - len(rows) + 0.5) / (len(rows) + 0.5))
+                for chunk_id, tf, length in rows:
+                    norm = tf + self.k1 * (1 - self.b + self.b * length / avg_length)
+                    scores[chunk_id] += idf * tf * (self.k1 + 1) / norm
+        return scores.most_common(k)
+
+
+bm25_index = BM25Index()
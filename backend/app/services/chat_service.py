@@ -1,20 +1,63 @@
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from ..models.full_text import search_tasks
+from ..models.queries import (
+    count_of, pending_tasks, recent_chat_turns, tasks_completed_between, tasks_due_between,
+)
 from ..models.sql_models import ChatHistory, Task, User
-from ..models.llm_models import llm
-from .rag_service import query_rag
+from ..models.llm_models import STOP_TOKENS
+from .rag_service import query_rag_chunks
 from .schedule_service import generate_daily_schedule, generate_routine
 from .intent_service import detect_intent
+from .intent_classifier import classify_intent, extract_username
+from .prompt_builder import PromptBudget
+from ..config import config
+from .llm_scheduler import llm_scheduler, LLMBusyError
+from ..utils.json_grammar import json_grammar, drop_nulls, load_constrained
+from ..write_queue import write_queue
 from .personalization import update_user_name
 from datetime import datetime, timedelta
 import json
 import re
 import asyncio
 import logging
+import time
 
 logger = logging.getLogger(__name__)
 
 
-def _get_user_temperature(db: Session, user_id: int) -> float:
+def _log_failed_write(future):
+    if future.exception() is not None:
+        logger.error(f"Error saving message: {future.exception()}")
+
+TASK_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "title": {"type": "string"},
+        "time": {"type": "string"},
+        "duration": {"type": "integer"},
+        "priority": {"enum": ["low", "medium", "high", "urgent"]},
+    },
+    "required": ["title"],
+}
+
+# Static system preamble for knowledge queries; the LLM caches its KV state.
+KNOWLEDGE_SYSTEM_PROMPT = """<|system|>
+You are Aura, an advanced personal AI assistant. You are warm, clear, and practical.
+
+You have access to the user's uploaded documents and prior messages.
+If the user asks about something in their documents (Context provided below), use that information.
+If the Context says "No specific documents found", or if the documents don't contain the answer, 
+ANSWER FROM YOUR GENERAL KNOWLEDGE. Do not say "I couldn't find it in your documents" unless 
+the user specifically asked "what does my document say about X".
+
+When the user greets you (e.g. "hi", "hello"), respond naturally and conversationally.
+
+Context from Knowledge Base:
+"""
+
+
+async def _get_user_temperature(db: AsyncSession, user_id: int) -> float:
     """
     Resolve the effective temperature for the current user from the DB,
     falling back to the global configuration default when not set.
@@ -22,7 +65,7 @@ def _get_user_temperature(db: Session, user_id: int) -> float:
     from ..config import config
 
     try:
-        user = db.query(User).filter(User.id == user_id).first()
+        user = await db.get(User, user_id)
         if not user or not user.settings:
             return getattr(config, "LLM_TEMPERATURE", 0.1)
         return float(user.settings.get("ai_temperature", getattr(config, "LLM_TEMPERATURE", 0.1)))
@@ -31,12 +74,12 @@ def _get_user_temperature(db: Session, user_id: int) -> float:
         return getattr(config, "LLM_TEMPERATURE", 0.1)
 
 
-def _get_user_name(db: Session, user_id: int) -> str:
+async def _get_user_name(db: AsyncSession, user_id: int) -> str:
     """
     Resolve the display name for the user from User.name / settings.
     """
     try:
-        user = db.query(User).filter(User.id == user_id).first()
+        user = await db.get(User, user_id)
         if not user:
             return "User"
         if user.name and user.name.strip():
@@ -65,11 +108,12 @@ class ChatService:
             'general_chat': self.handle_general_chat
         }
     
-    async def process_chat(self, user_id: int, message_data: any, db: Session):
+    async def process_chat(self, user_id: int, message_data: any, db: AsyncSession):
         """
         Main chat processing with intelligent Tool Router.
         The bot now acts as an agent that can access schedule, create tasks, and query knowledge.
         """
+        message = None
         try:
             # Handle both string (legacy) and object input
             if isinstance(message_data, str):
@@ -81,52 +125,11 @@ class ChatService:
 
             if not message or not message.strip():
                 return {"response": "I'm listening. How can I help you today?", "action_taken": None}
+
+            # Models still loading: answer "warming up" before touching history
+            llm_scheduler.ensure_ready()
             
-            self.save_message(user_id, "user", message, db)
-            
-            message_lower = message.lower()
-            
-            # ===== TOOL ROUTER: Intelligent Agent Logic =====
-            
-            # 1. Schedule/Calendar Query Detection
-            schedule_keywords = ['schedule', 'calendar', 'what am i doing', 'what\'s on my schedule', 
-                                'what do i have', 'am i free', 'free time', 'what am i scheduled',
-                                'my day', 'appointments', 'meetings']
-            if any(keyword in message_lower for keyword in schedule_keywords):
-                logger.info(f"Detected schedule query: {message}")
-                result = await self.handle_query_schedule(user_id, message, db, None)
-                self.save_message(user_id, "assistant", result['response'], db, intent='query_schedule')
-                result['suggestions'] = self.generate_suggestions('query_schedule', db, user_id)
-                return result
-            
-            # 2. Task Creation Detection
-            task_keywords = ['remind me', 'add task', 'create task', 'schedule a task', 
-                           'add to my list', 'set a reminder', 'i need to', 'help me', 'remind',
-                           'todo', 'to-do', 'buy', 'get', 'finish']
-            if any(keyword in message_lower for keyword in task_keywords):
-                logger.info(f"Detected task creation: {message}")
-                # Use intent detection to extract task details
-                intent_result = detect_intent(message)
-                result = await self.handle_task_create(user_id, message, db, intent_result)
-                self.save_message(user_id, "assistant", result['response'], db, intent='add_task')
-                result['suggestions'] = self.generate_suggestions('add_task', db, user_id)
-                return result
-            
-            # 3. Knowledge Base Query Detection (Question patterns)
-            question_patterns = ['how', 'what is', 'what are', 'explain', 'tell me about', 
-                               'summarize', 'what did', 'what does', 'describe', 'who', 'when', 
-                               'where', 'why', 'can you', 'do you know']
-            if any(message_lower.startswith(pattern) or f' {pattern} ' in message_lower 
-                   for pattern in question_patterns):
-                logger.info(f"Detected knowledge query: {message}")
-                result = await self.handle_query_knowledge(user_id, message, db, None)
-                self.save_message(user_id, "assistant", result['response'], db, intent='query_knowledge')
-                result['suggestions'] = self.generate_suggestions('query_knowledge', db, user_id)
-                return result
-            
-            # 4. Standard Intent Detection (fallback for other intents)
-            intent_result = detect_intent(message)
-            intent = intent_result.get('intent', 'general_chat')
+            intent, intent_result = await asyncio.to_thread(self.route_intent, message)
             
             # Route to appropriate handler
             if intent == 'general_chat':
@@ -139,20 +142,154 @@ class ChatService:
                 else:
                     result = handler(user_id, message, db, intent_result)
                 
-            self.save_message(user_id, "assistant", result['response'], db, intent=intent)
+            # Both turns are persisted together, in one batched transaction
+            self.save_turn(user_id, message, result['response'], intent=intent)
             result['suggestions'] = self.generate_suggestions(intent, db, user_id)
             
             return result
             
+        except LLMBusyError:
+            raise
         except Exception as e:
             logger.error(f"Chat processing error: {str(e)}", exc_info=True)
+            if message and message.strip():
+                self.save_turn(user_id, message)
             return {
                 "response": "I encountered an error. Please try again.",
                 "action_taken": "error",
                 "data": {"error": str(e)}
             }
     
-    async def handle_task_create(self, user_id: int, message: str, db: Session, intent_data: dict):
+    def route_intent(self, message: str):
+        """
+        TOOL ROUTER: Intelligent Agent Logic.
+        Cheap keyword checks run first, then the embedding classifier; the LLM
+        intent detector is only used when neither is confident.
+        Returns (intent, intent_result).
+        """
+        message_lower = message.lower()
+
+        # 1. Schedule/Calendar Query Detection
+        schedule_keywords = ['schedule', 'calendar', 'what am i doing', 'what\'s on my schedule', 
+                            'what do i have', 'am i free', 'free time', 'what am i scheduled',
+                            'my day', 'appointments', 'meetings']
+        if any(keyword in message_lower for keyword in schedule_keywords):
+            logger.info(f"Detected schedule query: {message}")
+            return 'query_schedule', None
+
+        # 2. Task Creation Detection
+        task_keywords = ['remind me', 'add task', 'create task', 'schedule a task', 
+                       'add to my list', 'set a reminder', 'i need to', 'help me', 'remind',
+                       'todo', 'to-do', 'buy', 'get', 'finish']
+        if any(keyword in message_lower for keyword in task_keywords):
+            logger.info(f"Detected task creation: {message}")
+            # Use intent detection to extract task details
+            return 'add_task', detect_intent(message)
+
+        # 3. Knowledge Base Query Detection (Question patterns)
+        question_patterns = ['how', 'what is', 'what are', 'explain', 'tell me about', 
+                           'summarize', 'what did', 'what does', 'describe', 'who', 'when', 
+                           'where', 'why', 'can you', 'do you know']
+        if any(message_lower.startswith(pattern) or f' {pattern} ' in message_lower 
+               for pattern in question_patterns):
+            logger.info(f"Detected knowledge query: {message}")
+            return 'query_knowledge', None
+
+        # 4. Embedding classifier, falling back to LLM intent detection
+        intent_result = classify_intent(message)
+        return intent_result.get('intent', 'general_chat'), intent_result
+
+    async def stream_chat(self, user_id: int, message_data: any, db: AsyncSession):
+        """
+        Streaming variant of process_chat. Yields event dicts:
+        {"type": "start"}, then {"type": "token", "content": ...} for each
+        generated piece, and finally {"type": "done", ...} carrying the same
+        fields as the blocking endpoint plus latency metrics.
+
+        Only free-form intents (general chat, knowledge queries) are streamed
+        token by token; tool intents finish in one step and emit just "done".
+        Both turns are persisted once the stream has finished.
+        """
+        started = time.perf_counter()
+        if isinstance(message_data, str):
+            message = message_data
+            context = {}
+        else:
+            message = message_data.message
+            context = message_data.context or {}
+
+        if not message or not message.strip():
+            yield {"type": "done", "response": "I'm listening. How can I help you today?", "action_taken": None}
+            return
+
+        try:
+            llm_scheduler.ensure_ready()
+        except LLMBusyError as e:
+            yield {"type": "error", "response": str(e), "action_taken": "error",
+                   "status": e.status_code, "reason": e.status}
+            return
+
+        intent = 'general_chat'
+        pieces = []
+        result = None
+        try:
+            intent, intent_result = await asyncio.to_thread(self.route_intent, message)
+            yield {"type": "start", "intent": intent}
+
+            if intent == 'general_chat':
+                prompt, cache_prefix = await self.build_general_chat_prompt(user_id, message, db, context)
+                data = {}
+            elif intent == 'query_knowledge':
+                prompt, rag_context, found_docs = await self.build_knowledge_prompt(message)
+                cache_prefix = KNOWLEDGE_SYSTEM_PROMPT
+                data = {"found": found_docs, "context_length": len(rag_context)}
+            else:
+                prompt = None
+
+            if prompt is None:
+                handler = self.intents.get(intent, self.handle_general_chat)
+                if asyncio.iscoroutinefunction(handler):
+                    result = await handler(user_id, message, db, intent_result)
+                else:
+                    result = handler(user_id, message, db, intent_result)
+            else:
+                temperature = await _get_user_temperature(db, user_id)
+                ttft_ms = None
+                async for piece in llm_scheduler.stream(
+                    prompt, max_tokens=500, temperature=temperature, cache_prefix=cache_prefix
+                ):
+                    if ttft_ms is None:
+                        ttft_ms = (time.perf_counter() - started) * 1000
+                        logger.info(f"Chat stream TTFT: {ttft_ms:.0f} ms (intent={intent})")
+                    pieces.append(piece)
+                    yield {"type": "token", "content": piece}
+
+                response = "".join(pieces)
+                for token in STOP_TOKENS:
+                    response = response.replace(token, "")
+                data["metrics"] = {
+                    "ttft_ms": round(ttft_ms, 1) if ttft_ms is not None else None,
+                    "total_ms": round((time.perf_counter() - started) * 1000, 1),
+                    "pieces": len(pieces),
+                }
+                result = {"response": response.strip(), "action_taken": intent, "data": data}
+
+            result['suggestions'] = self.generate_suggestions(intent, db, user_id)
+            yield {"type": "done", **result}
+
+        except LLMBusyError as e:
+            yield {"type": "error", "response": str(e), "action_taken": "error",
+                   "status": e.status_code, "reason": e.status}
+        except Exception as e:
+            logger.error(f"Chat stream error: {str(e)}", exc_info=True)
+            yield {"type": "error", "response": "I encountered an error. Please try again.", "action_taken": "error"}
+        finally:
+            # Persist the turn once streaming ends, including partial replies
+            # from clients that disconnected mid-stream.
+            reply = result['response'] if result else "".join(pieces).strip()
+            self.save_turn(user_id, message, reply, intent=intent)
+
+    async def handle_task_create(self, user_id: int, message: str, db: AsyncSession, intent_data: dict):
         """Create task programmatically using TaskService"""
         try:
             entities = intent_data.get('entities', {})
@@ -171,17 +308,14 @@ Extract task details.
 <|end|>
 <|assistant|>"""
                 
+                temperature = await _get_user_temperature(db, user_id)
+                extraction = await llm_scheduler.generate_async(
+                    extract_prompt, max_tokens=200, temperature=temperature, grammar=json_grammar(TASK_SCHEMA)
+                )
                 try:
-                    temperature = _get_user_temperature(db, user_id)
-                    extraction = await asyncio.to_thread(
-                        llm.generate, extract_prompt, max_tokens=200, temperature=temperature
-                    )
-                    # Try to parse JSON from extraction
-                    import json
-                    extracted_data = json.loads(extraction.strip().replace('```json', '').replace('```', ''))
-                    entities.update(extracted_data)
-                except:
-                    # Fallback: use message as title
+                    entities.update(drop_nulls(load_constrained(extraction)))
+                except ValueError:
+                    # Model unavailable (offline/error text): use message as title
                     entities['title'] = message[:100]
             
             # Parse due date
@@ -227,8 +361,8 @@ Extract task details.
             )
             
             db.add(new_task)
-            db.commit()
-            db.refresh(new_task)
+            await db.commit()
+            await db.refresh(new_task)
             
             response = f"I have added '{new_task.title}' to your list."
             if due_date:
@@ -240,44 +374,38 @@ Extract task details.
                 "data": {"task_id": new_task.id, "title": new_task.title}
             }
             
+        except LLMBusyError:
+            raise
         except Exception as e:
             logger.error(f"Task creation error: {str(e)}", exc_info=True)
             return {"response": f"I couldn't create the task. Error: {str(e)}", "action_taken": "error"}
     
-    async def handle_task_query(self, user_id: int, message: str, db: Session, intent_data: dict = None):
+    async def handle_task_query(self, user_id: int, message: str, db: AsyncSession, intent_data: dict = None):
         try:
             message_lower = message.lower()
             
             if any(word in message_lower for word in ['today', 'due today']):
-                tasks = db.query(Task).filter(
-                    Task.user_id == user_id,
-                    Task.completed == False,
-                    Task.due_date >= datetime.now().replace(hour=0, minute=0, second=0),
-                    Task.due_date < datetime.now().replace(hour=23, minute=59, second=59)
-                ).all()
+                tasks = (await db.scalars(tasks_due_between(
+                    user_id,
+                    datetime.now().replace(hour=0, minute=0, second=0),
+                    datetime.now().replace(hour=23, minute=59, second=59)
+                ))).all()
                 header = "tasks due today"
             elif any(word in message_lower for word in ['tomorrow']):
                 tomorrow = datetime.now() + timedelta(days=1)
-                tasks = db.query(Task).filter(
-                    Task.user_id == user_id,
-                    Task.completed == False,
-                    Task.due_date >= tomorrow.replace(hour=0, minute=0, second=0),
-                    Task.due_date < tomorrow.replace(hour=23, minute=59, second=59)
-                ).all()
+                tasks = (await db.scalars(tasks_due_between(
+                    user_id,
+                    tomorrow.replace(hour=0, minute=0, second=0),
+                    tomorrow.replace(hour=23, minute=59, second=59)
+                ))).all()
                 header = "tasks due tomorrow"
             elif any(word in message_lower for word in ['week', 'this week']):
-                tasks = db.query(Task).filter(
-                    Task.user_id == user_id,
-                    Task.completed == False,
-                    Task.due_date >= datetime.now(),
-                    Task.due_date < datetime.now() + timedelta(days=7)
-                ).all()
+                tasks = (await db.scalars(tasks_due_between(
+                    user_id, datetime.now(), datetime.now() + timedelta(days=7)
+                ))).all()
                 header = "tasks this week"
             else:
-                tasks = db.query(Task).filter(
-                    Task.user_id == user_id,
-                    Task.completed == False
-                ).order_by(Task.due_date.asc()).limit(10).all()
+                tasks = (await db.scalars(pending_tasks(user_id, limit=10))).all()
                 header = "pending tasks"
             
             if not tasks:
@@ -324,21 +452,21 @@ Extract task details.
             logger.error(f"Task query error: {str(e)}", exc_info=True)
             return {"response": "I couldn't retrieve your tasks.", "action_taken": "error"}
     
-    async def handle_task_update(self, user_id: int, message: str, db: Session, intent_data: dict = None):
+    async def handle_task_update(self, user_id: int, message: str, db: AsyncSession, intent_data: dict = None):
         try:
             message_lower = message.lower()
             
             if 'complete' in message_lower or 'done' in message_lower:
-                tasks = db.query(Task).filter(
+                tasks = (await db.scalars(select(Task).where(
                     Task.user_id == user_id,
                     Task.completed == False
-                ).all()
+                ))).all()
                 
                 for task in tasks:
                     if task.title.lower() in message_lower:
                         task.completed = True
                         task.completed_at = datetime.now()
-                        db.commit()
+                        await db.commit()
                         return {
                             "response": f"✅ Marked '{task.title}' as complete!",
                             "action_taken": "task_completed",
@@ -353,14 +481,14 @@ Extract task details.
             logger.error(f"Task update error: {str(e)}", exc_info=True)
             return {"response": "I couldn't update the task.", "action_taken": "error"}
     
-    async def handle_task_delete(self, user_id: int, message: str, db: Session, intent_data: dict = None):
+    async def handle_task_delete(self, user_id: int, message: str, db: AsyncSession, intent_data: dict = None):
         try:
-            tasks = db.query(Task).filter(Task.user_id == user_id).all()
+            tasks = (await db.scalars(select(Task).where(Task.user_id == user_id))).all()
             
             for task in tasks:
                 if task.title.lower() in message.lower():
-                    db.delete(task)
-                    db.commit()
+                    await db.delete(task)
+                    await db.commit()
                     return {
                         "response": f"🗑️ Deleted task: '{task.title}'",
                         "action_taken": "task_deleted",
@@ -373,7 +501,7 @@ Extract task details.
             logger.error(f"Task delete error: {str(e)}", exc_info=True)
             return {"response": "I couldn't delete the task.", "action_taken": "error"}
     
-    async def handle_query_schedule(self, user_id: int, message: str, db: Session, intent_data: dict = None):
+    async def handle_query_schedule(self, user_id: int, message: str, db: AsyncSession, intent_data: dict = None):
         """Handle schedule queries - fetch and format routine data using ScheduleService"""
         try:
             message_lower = message.lower()
@@ -389,7 +517,7 @@ Extract task details.
                 target_date = datetime.now()
             
             # Call ScheduleService to get today's routine
-            routine = generate_routine(user_id, db, target_date)
+            routine = await db.run_sync(lambda session: generate_routine(user_id, session, target_date))
             timeline = routine.get('timeline', [])
             
             # Filter out free blocks for summary
@@ -451,47 +579,50 @@ Extract task details.
                 "action_taken": "error"
             }
     
-    async def handle_query_knowledge(self, user_id: int, message: str, db: Session, intent_data: dict = None):
-        """Handle knowledge base queries using RAG Service"""
-        try:
-            # Extract the actual query (remove phrases like "summarize", "what did", etc.)
-            query = message.lower()
-            query = re.sub(r'(summarize|what did|what does|tell me about|explain|how)', '', query)
-            query = query.strip()
-            
-            # Call RAG Service to query knowledge base
-            rag_context = query_rag(query if query else message)
-            
-            if not rag_context or rag_context.strip() == "":
-                # Fallback to general knowledge if no documents found
-                rag_context = "No specific documents found in knowledge base."
-                found_docs = False
-            else:
-                found_docs = True
-            
-            # Use LLM to generate a natural response based on RAG context
-            prompt = f"""<|system|>
-You are Aura, an advanced personal AI assistant. You are warm, clear, and practical.
-
-You have access to the user's uploaded documents and prior messages.
-If the user asks about something in their documents (Context provided below), use that information.
-If the Context says "No specific documents found", or if the documents don't contain the answer, 
-ANSWER FROM YOUR GENERAL KNOWLEDGE. Do not say "I couldn't find it in your documents" unless 
-the user specifically asked "what does my document say about X".
-
-When the user greets you (e.g. "hi", "hello"), respond naturally and conversationally.
+    async def build_knowledge_prompt(self, message: str):
+        """Build the RAG-grounded prompt. Returns (prompt, rag_context, found_docs)."""
+        # Extract the actual query (remove phrases like "summarize", "what did", etc.)
+        query = message.lower()
+        query = re.sub(r'(summarize|what did|what does|tell me about|explain|how)', '', query)
+        query = query.strip()
+        
+        budget = PromptBudget()
+        budget.take("system", KNOWLEDGE_SYSTEM_PROMPT)
+        budget.take("template", "\n<|end|>\n<|user|>\n\n<|end|>\n<|assistant|>")
+        message = budget.take("message", message, config.PROMPT_BUDGET_MESSAGE)
 
-Context from Knowledge Base:
-{rag_context}
+        # Call RAG Service to query knowledge base; chunks come back best first,
+        # so the lowest-scoring ones are dropped if they don't fit.
+        chunks = await asyncio.to_thread(query_rag_chunks, query if query else message)
+        chunks.sort(key=lambda c: c["score"], reverse=True)
+        kept = budget.take_items("rag", [c["text"] for c in chunks], budget.remaining, drop_from="end")
+        rag_context = "\n".join(kept)
+        
+        if not rag_context or rag_context.strip() == "":
+            # Fallback to general knowledge if no documents found
+            rag_context = "No specific documents found in knowledge base."
+            found_docs = False
+        else:
+            found_docs = True
+        
+        # Use LLM to generate a natural response based on RAG context
+        prompt = KNOWLEDGE_SYSTEM_PROMPT + f"""{rag_context}
 <|end|>
 <|user|>
 {message}
 <|end|>
 <|assistant|>"""
+        budget.log(prompt, "query_knowledge")
+        return prompt, rag_context, found_docs
+
+    async def handle_query_knowledge(self, user_id: int, message: str, db: AsyncSession, intent_data: dict = None):
+        """Handle knowledge base queries using RAG Service"""
+        try:
+            prompt, rag_context, found_docs = await self.build_knowledge_prompt(message)
             
-            temperature = _get_user_temperature(db, user_id)
-            response = await asyncio.to_thread(
-                llm.generate, prompt, max_tokens=500, temperature=temperature
+            temperature = await _get_user_temperature(db, user_id)
+            response = await llm_scheduler.generate_async(
+                prompt, max_tokens=500, temperature=temperature, cache_prefix=KNOWLEDGE_SYSTEM_PROMPT
             )
             response = response.replace("<|end|>", "").replace("<|user|>", "").replace("<|assistant|>", "").strip()
             
@@ -501,6 +632,8 @@ Context from Knowledge Base:
                 "data": {"found": found_docs, "context_length": len(rag_context)}
             }
             
+        except LLMBusyError:
+            raise
         except Exception as e:
             logger.error(f"Knowledge query error: {str(e)}", exc_info=True)
             return {
@@ -508,16 +641,12 @@ Context from Knowledge Base:
                 "action_taken": "error"
             }
     
-    async def handle_day_summary(self, user_id: int, message: str, db: Session, intent_data: dict = None):
+    async def handle_day_summary(self, user_id: int, message: str, db: AsyncSession, intent_data: dict = None):
         try:
-            schedule = generate_daily_schedule(user_id, db)
+            schedule = await db.run_sync(lambda session: generate_daily_schedule(user_id, session))
             
             today_start = datetime.now().replace(hour=0, minute=0, second=0)
-            completed_today = db.query(Task).filter(
-                Task.user_id == user_id,
-                Task.completed == True,
-                Task.completed_at >= today_start
-            ).count()
+            completed_today = await db.scalar(count_of(tasks_completed_between(user_id, today_start)))
             
             prompt = f"""Generate a friendly daily summary for the user:
             - Total tasks: {schedule['overview']['total']}
@@ -527,11 +656,8 @@ Context from Knowledge Base:
             
             Keep it encouraging and concise."""
             
-            # Run LLM in thread
-            temperature = _get_user_temperature(db, user_id)
-            summary = await asyncio.to_thread(
-                llm.generate, prompt, max_tokens=200, temperature=temperature
-            )
+            temperature = await _get_user_temperature(db, user_id)
+            summary = await llm_scheduler.generate_async(prompt, max_tokens=200, temperature=temperature)
             
             return {
                 "response": summary,
@@ -542,11 +668,13 @@ Context from Knowledge Base:
                 }
             }
             
+        except LLMBusyError:
+            raise
         except Exception as e:
             logger.error(f"Day summary error: {str(e)}", exc_info=True)
             return {"response": "I couldn't generate your day summary.", "action_taken": "error"}
     
-    async def handle_reminder(self, user_id: int, message: str, db: Session, intent_data: dict):
+    async def handle_reminder(self, user_id: int, message: str, db: AsyncSession, intent_data: dict):
         from .reminder_service import schedule_reminder
         entities = intent_data.get('entities', {})
         time_str = entities.get('time')
@@ -564,8 +692,8 @@ Context from Knowledge Base:
                     priority="high"
                 )
                 db.add(task)
-                db.commit()
-                db.refresh(task)
+                await db.commit()
+                await db.refresh(task)
                 
                 schedule_reminder(task.id, reminder_time)
                 return {"response": f"⏰ Reminder set for '{title}' at {reminder_time.strftime('%I:%M %p')}", "action_taken": "reminder_set"}
@@ -575,14 +703,11 @@ Context from Knowledge Base:
         
         return {"response": "When should I remind you?", "action_taken": "ask_slot"}
     
-    async def handle_search(self, user_id: int, message: str, db: Session, intent_data: dict = None):
+    async def handle_search(self, user_id: int, message: str, db: AsyncSession, intent_data: dict = None):
         try:
             search_term = message.lower().replace('search', '').replace('find', '').strip()
             
-            tasks = db.query(Task).filter(
-                Task.user_id == user_id,
-                (Task.title.ilike(f'%{search_term}%') | Task.description.ilike(f'%{search_term}%'))
-            ).all()
+            tasks = (await db.scalars(search_tasks(db.bind.dialect.name, user_id, search_term))).all()
             
             if tasks:
                 response = f"Found {len(tasks)} tasks matching '{search_term}':"
@@ -601,7 +726,7 @@ Context from Knowledge Base:
             logger.error(f"Search error: {str(e)}", exc_info=True)
             return {"response": "I couldn't complete the search.", "action_taken": "error"}
     
-    async def handle_change_name(self, user_id: int, message: str, db: Session, intent_data: dict = None):
+    async def handle_change_name(self, user_id: int, message: str, db: AsyncSession, intent_data: dict = None):
         """
         Handle requests like 'Call me Rylix from now on'.
         """
@@ -610,10 +735,7 @@ Context from Knowledge Base:
             candidate = entities.get("username")
 
             if not candidate:
-                # Simple regex fallback
-                match = re.search(r"call me ([A-Za-z][A-Za-z0-9_\-\s']{0,40})", message, re.IGNORECASE)
-                if match:
-                    candidate = match.group(1).strip()
+                candidate = extract_username(message)
 
             if not candidate:
                 return {
@@ -621,7 +743,7 @@ Context from Knowledge Base:
                     "action_taken": "ask_name"
                 }
 
-            new_name = update_user_name(user_id, candidate, db)
+            new_name = await db.run_sync(lambda session: update_user_name(user_id, candidate, session))
             return {
                 "response": f"Got it, I’ll call you {new_name} from now on.",
                 "action_taken": "name_updated",
@@ -634,18 +756,15 @@ Context from Knowledge Base:
                 "action_taken": "error"
             }
     
-    def get_user_context(self, user_id: int, db: Session) -> str:
+    async def get_user_context(self, user_id: int, db: AsyncSession) -> str:
         """Get user's tasks and routine for context"""
         try:
             now = datetime.now()
             today = now.date()
             
             # 1. Get Current Routine Status
-            schedule = generate_daily_schedule(user_id, db) # Basic stats
-            
             # We need the detailed timeline to find current activity
-            from .schedule_service import generate_routine
-            routine = generate_routine(user_id, db, now)
+            routine = await db.run_sync(lambda session: generate_routine(user_id, session, now))
             timeline = routine.get('timeline', [])
             
             current_activity = "Free Time"
@@ -661,12 +780,11 @@ Context from Knowledge Base:
                     next_activity = f"{event['title']} at {start.strftime('%I:%M %p')}"
             
             # 2. Get Tasks
-            today_tasks = db.query(Task).filter(
-                Task.user_id == user_id,
-                Task.completed == False,
-                Task.due_date >= datetime.combine(today, datetime.min.time()),
-                Task.due_date < datetime.combine(today + timedelta(days=1), datetime.min.time())
-            ).limit(5).all()
+            today_tasks = (await db.scalars(tasks_due_between(
+                user_id,
+                datetime.combine(today, datetime.min.time()),
+                datetime.combine(today + timedelta(days=1), datetime.min.time())
+            ).limit(5))).all()
             
             parts = []
             parts.append(f"Current Time: {now.strftime('%I:%M %p')}")
@@ -683,22 +801,13 @@ Context from Knowledge Base:
             logger.error(f"Context Error: {str(e)}", exc_info=True)
             return ""
     
-    def get_recent_history(self, user_id: int, db: Session, limit: int = 10) -> str:
+    async def get_recent_turns(self, user_id: int, db: AsyncSession, limit: int = 10) -> list:
         """
-        Return a short, linearized view of the most recent conversation turns.
-        This helps the LLM stay grounded in the current thread without exceeding
-        the context window.
+        Return the most recent conversation turns as "User: ..." / "Aura: ..."
+        lines in chronological order, so callers can drop the oldest first.
         """
         try:
-            history = (
-                db.query(ChatHistory)
-                .filter(ChatHistory.user_id == user_id)
-                .order_by(ChatHistory.timestamp.desc())
-                .limit(limit)
-                .all()
-            )
-            if not history:
-                return ""
+            history = (await db.scalars(recent_chat_turns(user_id, limit))).all()
 
             # Reverse to chronological order
             history = list(reversed(history))
@@ -709,57 +818,99 @@ Context from Knowledge Base:
                 if not content:
                     continue
                 lines.append(f"{role}: {content}")
-            return "\n".join(lines)
+            return lines
         except Exception as e:
             logger.error(f"History context error: {str(e)}", exc_info=True)
-            return ""
+            return []
+
+    async def get_recent_history(self, user_id: int, db: AsyncSession, limit: int = 10) -> str:
+        """
+        Return a short, linearized view of the most recent conversation turns.
+        This helps the LLM stay grounded in the current thread without exceeding
+        the context window.
+        """
+        return "\n".join(await self.get_recent_turns(user_id, db, limit))
     
-    async def handle_general_chat(self, user_id: int, message: str, db: Session, context: dict = None):
-        try:
-            # Get user context (tasks)
-            task_context = self.get_user_context(user_id, db)
-            user_name = context.get('user_name', 'User') if context else 'User'
-            
-            # Get RAG Context
-            rag_context = query_rag(message)
-            # Get recent conversation history
-            conversation_history = self.get_recent_history(user_id, db, limit=10)
-            
-            # Phi-3 prompt format
-            prompt = "<|system|>\n"
-            prompt += (
-                f"You are Aura, an advanced, context-aware AI assistant talking to {user_name}.\n"
-                "Your personality: thoughtful, calm, and efficient. You explain things clearly without rambling,\n"
-                "and you adapt your tone to be encouraging but not overly formal.\n\n"
-                "HARD RULES:\n"
-                "- Never mention your internal tools, retrieval system, model name, vector stores, or embeddings.\n"
-                "- If you use information from the user's documents, refer to it naturally (e.g. "
-                "\"from your notes\" or \"in what you shared\") without describing how you accessed it.\n"
-                "- For simple greetings (\"hi\", \"hello\"), respond naturally and briefly.\n"
-                "- Prefer concrete, helpful suggestions over vague advice.\n"
-                "- Do NOT output internal tokens like BEGININPUT or ENDINPUT.\n\n"
+    def general_chat_system_prompt(self, user_name: str) -> str:
+        """Static persona/rules preamble; only varies with the user's name"""
+        return "<|system|>\n" + (
+            f"You are Aura, an advanced, context-aware AI assistant talking to {user_name}.\n"
+            "Your personality: thoughtful, calm, and efficient. You explain things clearly without rambling,\n"
+            "and you adapt your tone to be encouraging but not overly formal.\n\n"
+            "HARD RULES:\n"
+            "- Never mention your internal tools, retrieval system, model name, vector stores, or embeddings.\n"
+            "- If you use information from the user's documents, refer to it naturally (e.g. "
+            "\"from your notes\" or \"in what you shared\") without describing how you accessed it.\n"
+            "- For simple greetings (\"hi\", \"hello\"), respond naturally and briefly.\n"
+            "- Prefer concrete, helpful suggestions over vague advice.\n"
+            "- Do NOT output internal tokens like BEGININPUT or ENDINPUT.\n\n"
+        )
+
+    async def build_general_chat_prompt(self, user_id: int, message: str, db: AsyncSession, context: dict = None):
+        """
+        Assemble the Phi-3 prompt for open conversation. Returns (prompt, system_prompt).
+
+        Sections are budgeted in priority order (system, message, schedule,
+        RAG, history) so the prompt plus LLM_MAX_TOKENS always fits the
+        context window: RAG chunks are dropped lowest score first and history
+        oldest turn first.
+        """
+        user_name = context.get('user_name', 'User') if context else 'User'
+        system_prompt = self.general_chat_system_prompt(user_name)
+
+        budget = PromptBudget()
+        budget.take("system", system_prompt)
+        budget.take("template", "<|end|>\n<|user|>\n<|end|>\n<|assistant|>")
+        message = budget.take("message", message, config.PROMPT_BUDGET_MESSAGE)
+
+        # Get user context (tasks)
+        task_context = await self.get_user_context(user_id, db)
+        if task_context:
+            task_context = budget.take(
+                "schedule", f"User schedule/tasks context: {task_context}\n", config.PROMPT_BUDGET_SCHEDULE
             )
+        
+        # Get RAG Context
+        chunks = await asyncio.to_thread(query_rag_chunks, message)
+        chunks.sort(key=lambda c: c["score"], reverse=True)
+        rag_header = "Additional context from the user's documents (use only if relevant):\n"
+        rag_chunks = budget.take_items(
+            "rag", [c["text"] for c in chunks], config.PROMPT_BUDGET_RAG, drop_from="end", header=rag_header
+        )
 
-            if task_context:
-                prompt += f"User schedule/tasks context: {task_context}\n"
+        # Get recent conversation history
+        history_header = "Recent conversation (most recent last):\n"
+        history = budget.take_items(
+            "history", await self.get_recent_turns(user_id, db, limit=10), config.PROMPT_BUDGET_HISTORY,
+            drop_from="start", header=history_header,
+        )
+        
+        # Phi-3 prompt format
+        prompt = system_prompt
 
-            if conversation_history:
-                prompt += "Recent conversation (most recent last):\n"
-                prompt += conversation_history + "\n"
+        if task_context:
+            prompt += task_context
 
-            if rag_context:
-                prompt += (
-                    "Additional context from the user's documents (use only if relevant):\n"
-                    f"{rag_context}\n"
-                )
+        if history:
+            prompt += history_header
+            prompt += "\n".join(history) + "\n"
+
+        if rag_chunks:
+            prompt += rag_header
+            prompt += "\n".join(rag_chunks) + "\n"
+
+        prompt += "<|end|>\n"
+        prompt += f"<|user|>\n{message}<|end|>\n<|assistant|>"
+        budget.log(prompt, "general_chat")
+        return prompt, system_prompt
 
-            prompt += "<|end|>\n"
-            prompt += f"<|user|>\n{message}<|end|>\n<|assistant|>"
+    async def handle_general_chat(self, user_id: int, message: str, db: AsyncSession, context: dict = None):
+        try:
+            prompt, system_prompt = await self.build_general_chat_prompt(user_id, message, db, context)
             
-            # Run LLM in thread
-            temperature = _get_user_temperature(db, user_id)
-            response = await asyncio.to_thread(
-                llm.generate, prompt, max_tokens=500, temperature=temperature
+            temperature = await _get_user_temperature(db, user_id)
+            response = await llm_scheduler.generate_async(
+                prompt, max_tokens=500, temperature=temperature, cache_prefix=system_prompt
             )
             
             # Post-processing: Strip tags
@@ -771,23 +922,23 @@ Context from Knowledge Base:
                 "data": {}
             }
             
+        except LLMBusyError:
+            raise
         except Exception as e:
             logger.error(f"General chat error: {str(e)}", exc_info=True)
             return {"response": "I'm having trouble thinking right now.", "action_taken": "error"}
 
-    def save_message(self, user_id: int, role: str, content: str, db: Session, intent: str = None):
-        try:
-            history = ChatHistory(
-                user_id=user_id,
-                role=role,
-                content=content,
-                intent=intent,
-                timestamp=datetime.utcnow()
-            )
-            db.add(history)
-            db.commit()
-        except Exception as e:
-            logger.error(f"Error saving message: {str(e)}", exc_info=True)
+    def save_turn(self, user_id: int, message: str, reply: str = None, intent: str = None):
+        """
+        Queue the user message (and the reply, if any) on the write queue;
+        they are committed together with whatever other writes are pending.
+        """
+        rows = [ChatHistory(user_id=user_id, role="user", content=message, timestamp=datetime.utcnow())]
+        if reply:
+            rows.append(ChatHistory(
+                user_id=user_id, role="assistant", content=reply, intent=intent, timestamp=datetime.utcnow()
+            ))
+        write_queue.add(*rows).add_done_callback(_log_failed_write)
 
     def format_due_date(self, due_date: datetime) -> str:
         now = datetime.now()
@@ -802,7 +953,7 @@ Context from Knowledge Base:
         else:
             return due_date.strftime("%B %d, %Y")
     
-    def generate_suggestions(self, intent: str, db: Session, user_id: int):
+    def generate_suggestions(self, intent: str, db: AsyncSession, user_id: int):
         suggestions = {
             'task_create': [
                 "Show my tasks for today",
@@ -829,5 +980,8 @@ Context from Knowledge Base:
 
 chat_service = ChatService()
 
-async def process_chat(user_id: int, message: str, db: Session):
+async def process_chat(user_id: int, message: str, db: AsyncSession):
     return await chat_service.process_chat(user_id, message, db)
+
+def stream_chat(user_id: int, message: str, db: AsyncSession):
+    return chat_service.stream_chat(user_id, message, db)
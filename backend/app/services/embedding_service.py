@@ -0,0 +1,104 @@
+from concurrent.futures import Future
+import logging
+import queue
+import threading
+import time
+
+from ..config import config
+from ..models.llm_models import llm
+
+logger = logging.getLogger(__name__)
+
+
+class MicroBatchEmbedder:
+    """
+    Merges concurrent single-text embedding requests into batched encodes.
+
+    Callers block in embed(); a background thread takes the first waiting
+    request, keeps collecting for up to EMBED_MICROBATCH_WINDOW_MS (or until
+    EMBED_MICROBATCH_MAX texts) and answers them all with one
+    LLM.embed_batch call. A lone request pays at most the window in latency;
+    parallel chat and search requests share a single forward pass.
+    """
+
+    def __init__(self, window_ms: float = None, max_batch: int = None):
+        self.window = (window_ms if window_ms is not None else config.EMBED_MICROBATCH_WINDOW_MS) / 1000
+        self.max_batch = max_batch or config.EMBED_MICROBATCH_MAX
+        self._queue = queue.Queue()
+        self._thread = None
+        self._start_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self.stats = {
+            "requests": 0,
+            "batches": 0,
+            "max_batch_seen": 0,
+            "ingest_chunks": 0,
+            "ingest_seconds": 0.0,
+            "last_ingest_chunks_per_s": None,
+        }
+
+    def _ensure_thread(self):
+        if self._thread is not None:
+            return
+        with self._start_lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="embed-batcher", daemon=True)
+                self._thread.start()
+
+    def embed(self, text: str) -> list:
+        """Embedding for one text, computed together with concurrent requests."""
+        self._ensure_thread()
+        future = Future()
+        self._queue.put((text, future))
+        return future.result()
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self.window
+            while len(batch) < self.max_batch:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+
+            try:
+                vectors = llm.embed_batch([text for text, _ in batch], kind="query")
+                for (_, future), vector in zip(batch, vectors):
+                    future.set_result(vector)
+            except Exception as e:
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+
+            with self._stats_lock:
+                self.stats["requests"] += len(batch)
+                self.stats["batches"] += 1
+                self.stats["max_batch_seen"] = max(self.stats["max_batch_seen"], len(batch))
+
+    def record_ingestion(self, chunks: int, seconds: float):
+        """Track bulk-ingestion throughput (chunks embedded per second)."""
+        with self._stats_lock:
+            self.stats["ingest_chunks"] += chunks
+            self.stats["ingest_seconds"] += seconds
+            if seconds > 0:
+                self.stats["last_ingest_chunks_per_s"] = round(chunks / seconds, 1)
+
+    def get_stats(self) -> dict:
+        with self._stats_lock:
+            batches = self.stats["batches"]
+            ingest_seconds = self.stats["ingest_seconds"]
+            return {
+                "window_ms": self.window * 1000,
+                "avg_batch": round(self.stats["requests"] / batches, 2) if batches else None,
+                "ingest_chunks_per_s": (
+                    round(self.stats["ingest_chunks"] / ingest_seconds, 1) if ingest_seconds else None
+                ),
+                **self.stats,
+            }
+
+
+embedder = MicroBatchEmbedder()
@@ -0,0 +1,375 @@
+"""
+Persisted document-ingestion jobs.
+
+An upload saves the raw file under UPLOADS_DIR, creates an IngestionJob
+row and returns; a small pool of worker threads then parses and indexes it,
+moving the job through queued -> parsing -> embedding -> done. Parsed
+blocks stream straight into the chunker, so a job is "embedding" as soon as
+the first page is out. Failures are retried with exponential backoff up to
+INGEST_MAX_ATTEMPTS before the job is marked failed; files that cannot be
+parsed fail at once. The parsed text is compressed into the blob store as
+it streams by; Document rows only keep its key. Because jobs live in SQL,
+unfinished ones are queued again on startup, and add_to_rag's chunk
+checkpoints mean a resumed job only embeds what it had not stored yet.
+
+Several processes (workers of one host, or several hosts on a shared
+PostgreSQL database) may see the same jobs. A worker claims a job with a
+single UPDATE ... WHERE status = 'queued', so only one of them ever runs
+it, and records itself as the owner. While the job runs the owner bumps
+heartbeat_at every INGEST_HEARTBEAT_S; a parsing/embedding job whose
+heartbeat is older than INGEST_STALE_AFTER_S lost its owner (crash,
+restart) and is queued again for whoever picks it up. Every later write
+to a job is conditional on the owner too, so a worker that stalled past
+that point finds the job gone and stops instead of overwriting the new
+owner's progress.
+
+Every state change and every indexed page is broadcast on the
+notifications WebSocket as {"type": "ingestion", "job": {...}}.
+"""
+from collections import defaultdict
+from datetime import datetime, timedelta
+from pathlib import Path
+import asyncio
+import json
+import logging
+import os
+import queue
+import socket
+import threading
+import time
+import uuid
+
+from sqlalchemy import func, or_, select, text, update
+from sqlalchemy.orm import undefer
+
+from ..config import config
+from ..database import SessionLocal
+from ..models.blob_store import blob_store
+from ..models.queries import document_by_body_key
+from ..models.sql_models import Document, IngestionJob
+from ..websocket_manager import manager
+from ..utils.parser import ParseError, iter_document
+from .rag_service import add_to_rag, delete_document_embeddings
+
+logger = logging.getLogger(__name__)
+
+RUNNING_STATUSES = ("parsing", "embedding")
+
+
+class JobLostError(Exception):
+    """The job was taken over by another worker; this one must stop running it."""
+
+
+def source_path(document_id: int) -> Path:
+    """Where the raw upload of a document is kept for (re-)parsing"""
+    return config.UPLOADS_DIR / f"document_{document_id}.upload"
+
+
+def release_blob(db, key: str):
+    """Delete a document body from the blob store once no document references it"""
+    if key and db.execute(document_by_body_key(key)).first() is None:
+        blob_store.delete(key)
+
+
+async def release_blob_async(db, key: str):
+    """release_blob for an AsyncSession; the file is deleted off the event loop"""
+    if key and (await db.execute(document_by_body_key(key))).first() is None:
+        await asyncio.to_thread(blob_store.delete, key)
+
+
+def move_bodies_to_blob_store(batch_size: int = 50):
+    """
+    One-off migration: move document bodies still stored inline in the
+    documents table into the blob store, then (SQLite) VACUUM to give the
+    space back.
+    """
+    db = SessionLocal()
+    moved = 0
+    try:
+        while True:
+            ids = [
+                row.id for row in db.query(Document.id)
+                .filter(Document.content.isnot(None), Document.content_blob.is_(None))
+                .limit(batch_size)
+            ]
+            if not ids:
+                break
+            for document in db.query(Document).filter(Document.id.in_(ids)).options(undefer(Document.content)):
+                document.content_blob = blob_store.put(document.content)
+                document.content = None
+            db.commit()
+            moved += len(ids)
+        if moved:
+            if db.get_bind().dialect.name == "sqlite":
+                db.execute(text("VACUUM"))
+            print(f"Moved {moved} document bodies to the blob store")
+    except Exception as e:
+        db.rollback()
+        print(f"Error moving document bodies to the blob store: {e}")
+    finally:
+        db.close()
+
+
+def job_to_dict(job: IngestionJob) -> dict:
+    return {
+        "id": job.id,
+        "document_id": job.document_id,
+        "filename": job.filename,
+        "status": job.status,
+        "chunks_done": job.chunks_done or 0,
+        "counts": job.counts or {},
+        "attempts": job.attempts or 0,
+        "error": job.error,
+        "created_at": job.created_at.isoformat() if job.created_at else None,
+        "updated_at": job.updated_at.isoformat() if job.updated_at else None,
+        "finished_at": job.finished_at.isoformat() if job.finished_at else None,
+    }
+
+
+class IngestionQueue:
+    def __init__(self, workers: int = None, session_factory=None):
+        self.workers = workers or config.INGEST_WORKERS
+        self.session_factory = session_factory or SessionLocal
+        # Unique per process, so a restarted process never mistakes old claims for its own
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self._queue = queue.Queue()
+        self._queued_ids = set()  # job ids in self._queue, so sweeps don't add duplicates
+        self._queued_lock = threading.Lock()
+        self._threads = []
+        self._start_lock = threading.Lock()
+        # Jobs for the same document never run concurrently (shared manifest)
+        self._document_locks = defaultdict(threading.Lock)
+        self._document_locks_guard = threading.Lock()
+
+    def start(self):
+        """Start the workers and the heartbeat thread, and queue the waiting jobs."""
+        with self._start_lock:
+            if self._threads:
+                return
+            for i in range(self.workers):
+                thread = threading.Thread(target=self._worker, name=f"ingest-{i}", daemon=True)
+                thread.start()
+                self._threads.append(thread)
+            threading.Thread(target=self._heartbeat_loop, name="ingest-heartbeat", daemon=True).start()
+
+        self.recover()
+
+    def recover(self, waiting_since: datetime = None) -> int:
+        """
+        Re-queue running jobs whose owner stopped heartbeating, then queue the
+        waiting jobs here (those last touched before `waiting_since`, if
+        given). Queuing a job another process also has is harmless: only one
+        of them claims it. Returns the number of jobs taken over.
+        """
+        stale_before = datetime.utcnow() - timedelta(seconds=config.INGEST_STALE_AFTER_S)
+        db = self.session_factory()
+        try:
+            taken_over = db.execute(
+                update(IngestionJob)
+                .where(
+                    IngestionJob.status.in_(RUNNING_STATUSES),
+                    or_(IngestionJob.heartbeat_at.is_(None), IngestionJob.heartbeat_at < stale_before),
+                )
+                .values(status="queued", owner=None)
+            ).rowcount
+            db.commit()
+            waiting = select(IngestionJob.id).where(IngestionJob.status == "queued")
+            if waiting_since is not None:
+                waiting = waiting.where(IngestionJob.updated_at < waiting_since)
+            job_ids = db.scalars(waiting.order_by(IngestionJob.id)).all()
+        finally:
+            db.close()
+        for job_id in job_ids:
+            self._put(job_id)
+        if taken_over:
+            logger.info(f"[INFO] Resuming {taken_over} ingestion job(s) whose worker is gone")
+        return taken_over
+
+    def heartbeat(self) -> int:
+        """Mark the jobs this process is running as alive; returns how many"""
+        db = self.session_factory()
+        try:
+            touched = db.execute(
+                update(IngestionJob)
+                .where(IngestionJob.owner == self.owner, IngestionJob.status.in_(RUNNING_STATUSES))
+                .values(heartbeat_at=datetime.utcnow())
+            ).rowcount
+            db.commit()
+            return touched
+        finally:
+            db.close()
+
+    def _heartbeat_loop(self):
+        while True:
+            time.sleep(config.INGEST_HEARTBEAT_S)
+            try:
+                self.heartbeat()
+                # Jobs queued by a process that died before running them
+                self.recover(waiting_since=datetime.utcnow() - timedelta(seconds=config.INGEST_STALE_AFTER_S))
+            except Exception as e:
+                logger.warning(f"[WARNING] Ingestion heartbeat failed: {e}")
+
+    def enqueue(self, db, document: Document) -> IngestionJob:
+        job = IngestionJob(document_id=document.id, filename=document.filename, status="queued")
+        db.add(job)
+        db.commit()
+        db.refresh(job)
+        self._put(job.id)
+        self._publish(job)
+        return job
+
+    def _put(self, job_id: int):
+        with self._queued_lock:
+            if job_id in self._queued_ids:
+                return
+            self._queued_ids.add(job_id)
+        self._queue.put(job_id)
+
+    def _publish(self, job: IngestionJob):
+        manager.broadcast_sync(json.dumps({"type": "ingestion", "job": job_to_dict(job)}))
+
+    def _document_lock(self, document_id: int) -> threading.Lock:
+        with self._document_locks_guard:
+            return self._document_locks[document_id]
+
+    def _worker(self):
+        while True:
+            job_id = self._queue.get()
+            with self._queued_lock:
+                self._queued_ids.discard(job_id)
+            try:
+                self._run(job_id)
+            except JobLostError as e:
+                logger.warning(f"[WARNING] {e}")
+            except Exception as e:
+                logger.error(f"Ingestion worker error on job {job_id}: {e}", exc_info=True)
+            finally:
+                self._queue.task_done()
+
+    def _set(self, db, job: IngestionJob, **fields):
+        """Update a job we own; raises JobLostError if another worker has taken it over"""
+        updated = db.execute(
+            update(IngestionJob)
+            .where(IngestionJob.id == job.id, IngestionJob.owner == self.owner)
+            .values(heartbeat_at=datetime.utcnow(), **fields)
+        ).rowcount
+        db.commit()
+        if not updated:
+            raise JobLostError(f"Ingestion job {job.id} was taken over by another worker; stopping")
+        self._publish(job)
+
+    def _claim(self, db, job_id: int) -> bool:
+        """Atomically move a queued job to parsing under our name; False if someone else has it"""
+        claimed = db.execute(
+            update(IngestionJob)
+            .where(IngestionJob.id == job_id, IngestionJob.status == "queued")
+            .values(
+                status="parsing", owner=self.owner, heartbeat_at=datetime.utcnow(),
+                attempts=func.coalesce(IngestionJob.attempts, 0) + 1, error=None,
+            )
+        ).rowcount
+        db.commit()
+        return claimed == 1
+
+    def _run(self, job_id: int):
+        db = self.session_factory()
+        try:
+            job = db.get(IngestionJob, job_id)
+            if job is None:
+                return
+            with self._document_lock(job.document_id):
+                if not self._claim(db, job_id):
+                    return
+                db.refresh(job)
+                self._publish(job)
+                document = db.get(Document, job.document_id)
+                if document is None:
+                    self._set(db, job, status="failed", error="Document was deleted", finished_at=datetime.utcnow())
+                    return
+                source = source_path(document.id)
+                body = None
+                if source.exists():
+                    body = blob_store.writer()
+                    content = self._parse(db, job, source, document.file_type, body)
+                else:
+                    # Uploaded before raw files were kept: index the stored text
+                    if document.content_blob:
+                        content = blob_store.iter_text(document.content_blob)
+                    else:
+                        content = document.content or ""
+                    self._set(db, job, status="embedding", chunks_done=0)
+
+                try:
+                    counts = add_to_rag(
+                        document.filename, content, progress=lambda done: self._set(db, job, chunks_done=done)
+                    )
+                except Exception:
+                    if body is not None:
+                        body.abort()
+                    raise
+                if body is not None:
+                    previous = document.content_blob
+                    document.content_blob = body.close()
+                    document.content = None
+                    db.commit()
+                    if previous != document.content_blob:
+                        release_blob(db, previous)
+
+                if db.query(Document.id).filter(Document.id == job.document_id).first() is None:
+                    # Deleted while we were indexing: don't leave orphaned chunks
+                    delete_document_embeddings(job.filename)
+                    self._set(db, job, status="failed", error="Document was deleted", finished_at=datetime.utcnow())
+                    return
+                self._set(db, job, status="done", counts=counts, chunks_done=counts["chunks"],
+                          finished_at=datetime.utcnow())
+        except JobLostError:
+            db.rollback()
+            raise
+        except ParseError as e:
+            db.rollback()
+            job = db.get(IngestionJob, job_id)
+            if job is None:
+                return
+            logger.error(f"Cannot parse {job.filename}: {e}")
+            self._set(db, job, status="failed", error=str(e), finished_at=datetime.utcnow())
+        except Exception as e:
+            db.rollback()
+            self._retry_or_fail(db, job_id, e)
+        finally:
+            db.close()
+
+    def _parse(self, db, job: IngestionJob, source: Path, content_type: str, body):
+        """Stream parsed blocks into the chunker, compressing a copy into the blob store"""
+        for block in iter_document(source, content_type):
+            if job.status == "parsing":
+                self._set(db, job, status="embedding", chunks_done=0)
+            body.write(block)
+            yield block
+
+    def _retry_or_fail(self, db, job_id: int, error: Exception):
+        job = db.get(IngestionJob, job_id)
+        if job is None:
+            return
+        attempts = job.attempts or 0
+        if attempts < config.INGEST_MAX_ATTEMPTS:
+            delay = config.INGEST_RETRY_BACKOFF_S * 2 ** (attempts - 1)
+            logger.warning(f"[WARNING] Ingestion of {job.filename} failed ({error}); retrying in {delay}s")
+            self._set(db, job, status="queued", owner=None, error=str(error))
+            timer = threading.Timer(delay, self._put, args=[job_id])
+            timer.daemon = True
+            timer.start()
+        else:
+            logger.error(f"Ingestion of {job.filename} failed after {attempts} attempts: {error}")
+            self._set(db, job, status="failed", error=str(error), finished_at=datetime.utcnow())
+
+    def list_jobs(self, db, status: str = None, limit: int = 50) -> list:
+        query = db.query(IngestionJob)
+        if status:
+            query = query.filter(IngestionJob.status == status)
+        return [job_to_dict(job) for job in query.order_by(IngestionJob.id.desc()).limit(limit).all()]
+
+    def get_stats(self) -> dict:
+        return {"workers": len(self._threads), "queued": self._queue.qsize()}
+
+
+ingestion_queue = IngestionQueue()
@@ -0,0 +1,290 @@
+from collections import Counter, defaultdict
+from datetime import datetime
+from typing import Dict, Optional, Tuple
+import json
+import logging
+import re
+import threading
+import time
+
+import numpy as np
+
+from ..config import config
+from ..models.llm_models import llm
+from .intent_service import detect_intent, INTENTS
+from .embedding_service import embedder
+
+logger = logging.getLogger(__name__)
+
+# Labelled examples for the nearest-centroid classifier. Extra examples can be
+# added without a code change in config.INTENT_EXAMPLES_PATH, using the same
+# {"intent": ["example", ...]} shape; disagreements with the LLM are logged to
+# config.INTENT_MISCLASSIFICATION_LOG to help grow that file.
+SEED_EXAMPLES = {
+    "query_schedule": [
+        "What am I doing today?",
+        "Do I have free time at 4?",
+        "What's happening this afternoon?",
+        "Am I busy tomorrow morning?",
+        "When is my next class?",
+        "What's next on my agenda?",
+        "Is my evening open?",
+    ],
+    "add_task": [
+        "Remind me to call John at 5pm",
+        "Add a task to buy groceries",
+        "I have to submit the report by Friday",
+        "Put dentist appointment on Monday at 10",
+        "Note down: pay the electricity bill",
+        "Schedule gym for tomorrow at 7am",
+        "Create a reminder to water the plants",
+    ],
+    "query_knowledge": [
+        "Summarize the PDF I uploaded",
+        "What does my document say about deadlines?",
+        "Explain recursion in Python",
+        "Who won the 2022 World Cup?",
+        "What is the capital of France?",
+        "Give me the key points from my notes",
+        "Define photosynthesis",
+    ],
+    "general_chat": [
+        "Hi",
+        "Hello there",
+        "How are you?",
+        "Tell me a joke",
+        "Thanks a lot!",
+        "Good morning",
+        "I'm feeling tired today",
+        "You're awesome",
+    ],
+    "task_query": [
+        "What tasks do I have?",
+        "Show my tasks",
+        "List my pending tasks",
+        "Which tasks are due this week?",
+        "Anything overdue?",
+        "Show tasks due tomorrow",
+    ],
+    "day_summary": [
+        "Summarize my day",
+        "Give me a daily overview",
+        "How productive was I today?",
+        "Daily recap please",
+        "How did my day go?",
+    ],
+    "search": [
+        "Search for budget",
+        "Find the task about the presentation",
+        "Look up anything mentioning invoices",
+        "Search my notes for machine learning",
+        "Find meeting notes",
+    ],
+    "change_name": [
+        "Call me Rylix from now on",
+        "My name is Sam",
+        "Please call me Alex",
+        "I'd like you to call me Captain",
+        "Change my name to Priya",
+    ],
+}
+
+
+# Intents whose handlers act on entities from the message. The classifier only
+# picks the label, so these still go to the LLM for extraction unless the
+# entities can be read off the message directly.
+ENTITY_INTENTS = {"add_task", "task_create", "task_update", "task_delete", "reminder", "change_name"}
+
+# "Call me Rylix from now on", "My name is Mary Jane": the first word after the
+# phrase, plus any capitalised words that follow it
+_NAME_RE = re.compile(
+    r"\b(?i:call me|my name is|change my name to|rename me to)\s+([A-Za-z][\w'-]*(?:\s+[A-Z][\w'-]*){0,2})"
+)
+
+
+def extract_username(message: str) -> Optional[str]:
+    match = _NAME_RE.search(message)
+    return match.group(1) if match else None
+
+
+def _local_entities(intent: str, message: str) -> Optional[dict]:
+    """Entities read straight off the message, or None if the LLM must extract them"""
+    if intent not in ENTITY_INTENTS:
+        return {}
+    if intent == "change_name":
+        username = extract_username(message)
+        return {"username": username} if username else None
+    return None
+
+
+def _normalize(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.where(norms == 0, 1.0, norms)
+
+
+class IntentClassifier:
+    """
+    Nearest-centroid intent classifier over the MiniLM sentence embeddings.
+
+    Each intent is represented by the normalised mean embedding of its
+    examples; a message gets the label of the most similar centroid. The
+    prediction is only trusted when both the similarity and its margin over
+    the runner-up clear the configured thresholds.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self._labels = None
+        self._centroids = None
+        self.stats = {
+            "fast": 0,
+            "extracted": 0,
+            "fallback": 0,
+            "unavailable": 0,
+            "llm_agreed": 0,
+            "llm_disagreed": 0,
+            "fast_ms_total": 0.0,
+        }
+        self.confusion = defaultdict(Counter)  # classifier guess -> LLM label, on fallbacks
+
+    def _examples(self) -> Dict[str, list]:
+        examples = {intent: list(texts) for intent, texts in SEED_EXAMPLES.items()}
+        path = config.INTENT_EXAMPLES_PATH
+        if path.exists():
+            try:
+                with open(path, "r", encoding="utf-8") as f:
+                    extra = json.load(f)
+                for intent, texts in extra.items():
+                    if intent in INTENTS:
+                        examples.setdefault(intent, []).extend(texts)
+            except Exception as e:
+                logger.warning(f"Could not load intent examples from {path}: {e}")
+        return examples
+
+    def _build(self) -> bool:
+        llm.wait_ready()
+        if not llm.embedding_model:
+            return False
+        examples = self._examples()
+        labels, centroids = [], []
+        for intent, texts in examples.items():
+            if not texts:
+                continue
+            vectors = _normalize(np.asarray(llm.embed_batch(texts, kind="intent_examples")))
+            centroid = vectors.mean(axis=0)
+            centroids.append(centroid / (np.linalg.norm(centroid) or 1.0))
+            labels.append(intent)
+        self._labels = labels
+        self._centroids = np.vstack(centroids)
+        logger.info(f"Intent classifier built from {sum(len(t) for t in examples.values())} examples")
+        return True
+
+    def reload(self):
+        """Rebuild centroids on next use (e.g. after editing the examples file)."""
+        with self._lock:
+            self._centroids = None
+
+    def predict(self, message: str) -> Optional[Tuple[str, float, float]]:
+        """Return (intent, similarity, margin over runner-up), or None if unavailable."""
+        with self._lock:
+            if self._centroids is None and not self._build():
+                return None
+            labels, centroids = self._labels, self._centroids
+
+        vector = _normalize(np.asarray([embedder.embed(message)]))[0]
+        scores = centroids @ vector
+        order = np.argsort(scores)[::-1]
+        best = float(scores[order[0]])
+        runner_up = float(scores[order[1]]) if len(order) > 1 else 0.0
+        return labels[order[0]], best, best - runner_up
+
+    def count(self, key: str, amount: float = 1):
+        """Bump a stats counter (classify_intent runs on many threads)"""
+        with self._stats_lock:
+            self.stats[key] += amount
+
+    def record_fallback(self, message: str, prediction: Tuple[str, float, float], llm_intent: str):
+        guess, score, margin = prediction
+        agreed = guess == llm_intent
+        with self._stats_lock:
+            self.stats["llm_agreed" if agreed else "llm_disagreed"] += 1
+            self.confusion[guess][llm_intent] += 1
+        if agreed:
+            return
+
+        logger.info(
+            f"Intent classifier disagreed with LLM: guessed {guess} ({score:.2f}, margin {margin:.2f}), "
+            f"LLM said {llm_intent}: {message!r}"
+        )
+        try:
+            with open(config.INTENT_MISCLASSIFICATION_LOG, "a", encoding="utf-8") as f:
+                f.write(json.dumps({
+                    "timestamp": datetime.utcnow().isoformat(),
+                    "message": message,
+                    "predicted": guess,
+                    "score": round(score, 4),
+                    "margin": round(margin, 4),
+                    "llm_intent": llm_intent,
+                }) + "\n")
+        except Exception as e:
+            logger.warning(f"Could not write intent misclassification log: {e}")
+
+    def get_stats(self) -> dict:
+        with self._stats_lock:
+            stats = dict(self.stats)
+            confusion = {guess: dict(counts) for guess, counts in self.confusion.items()}
+        fast = stats["fast"]
+        compared = stats["llm_agreed"] + stats["llm_disagreed"]
+        return {
+            "enabled": config.INTENT_CLASSIFIER_ENABLED,
+            "fast": fast,
+            "extracted": stats["extracted"],
+            "fallback": stats["fallback"],
+            "unavailable": stats["unavailable"],
+            "avg_fast_ms": round(stats["fast_ms_total"] / fast, 2) if fast else None,
+            "llm_agreement": round(stats["llm_agreed"] / compared, 3) if compared else None,
+            "confusion": confusion,
+        }
+
+
+intent_classifier = IntentClassifier()
+
+
+def classify_intent(message: str) -> Dict:
+    """
+    Fast intent detection: answer from the embedding classifier when it is
+    confident and fall back to the LLM (detect_intent) otherwise.
+    For ENTITY_INTENTS the classifier's label is kept but the entities come
+    from the LLM, unless they can be read off the message directly.
+    """
+    if not config.INTENT_CLASSIFIER_ENABLED:
+        return detect_intent(message)
+
+    started = time.perf_counter()
+    try:
+        prediction = intent_classifier.predict(message)
+    except Exception as e:
+        logger.error(f"Intent classifier error: {e}", exc_info=True)
+        prediction = None
+
+    if prediction is None:
+        intent_classifier.count("unavailable")
+        return detect_intent(message)
+
+    intent, score, margin = prediction
+    if score >= config.INTENT_CLASSIFIER_THRESHOLD and margin >= config.INTENT_CLASSIFIER_MARGIN:
+        logger.info(f"Intent classifier: {intent} ({score:.2f}, margin {margin:.2f})")
+        entities = _local_entities(intent, message)
+        if entities is None:
+            intent_classifier.count("extracted")
+            result = detect_intent(message)
+            return {**result, "intent": intent, "confidence": round(score, 3)}
+        intent_classifier.count("fast")
+        intent_classifier.count("fast_ms_total", (time.perf_counter() - started) * 1000)
+        return {"intent": intent, "entities": entities, "sentiment": "neutral", "confidence": round(score, 3)}
+
+    intent_classifier.count("fallback")
+    result = detect_intent(message)
+    intent_classifier.record_fallback(message, prediction, result.get("intent", "general_chat"))
+    return result
@@ -1,7 +1,8 @@
 import json
 from datetime import datetime
 from typing import Dict
-from ..models.llm_models import llm
+from .llm_scheduler import llm_scheduler
+from ..utils.json_grammar import json_grammar, drop_nulls, load_constrained
 import re
 
 def extract_json_from_text(text: str) -> Dict:
@@ -16,15 +17,35 @@ def extract_json_from_text(text: str) -> Dict:
     except Exception:
         return None
 
-def detect_intent(message: str) -> Dict:
-    """
-    Detect intent using LLM exclusively.
-    Returns a dictionary with 'intent', 'entities', and 'sentiment'.
-    """
-    max_retries = 2
-    current_time = datetime.now().strftime("%Y-%m-%d %H:%M")
-    
-    base_prompt = f"""<|system|>
+INTENTS = [
+    "query_schedule", "add_task", "query_knowledge", "general_chat",
+    "task_query", "day_summary", "search", "change_name",
+]
+
+# Output schema; generation is grammar-constrained to it (see utils/json_grammar.py)
+INTENT_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "intent": {"enum": INTENTS},
+        "entities": {
+            "type": "object",
+            "properties": {
+                "title": {"type": "string"},
+                "time": {"type": "string"},
+                "duration": {"type": "integer"},
+                "category": {"enum": ["Personal", "Work", "College", "Health"]},
+                "username": {"type": "string"},
+            },
+            "required": [],
+        },
+        "sentiment": {"enum": ["positive", "neutral", "negative"]},
+    },
+    "required": ["intent", "entities", "sentiment"],
+}
+
+# Static part of the classification prompt. It never changes between calls,
+# so the LLM keeps its evaluated KV state cached (see LLM.generate cache_prefix).
+INTENT_SYSTEM_PROMPT = """<|system|>
 You are an intent classification engine. Output ONLY valid JSON.
 Extract:
 - intent: One of: query_schedule, add_task, query_knowledge, general_chat, task_query, day_summary, search, change_name
@@ -40,50 +61,58 @@ Intent Classification Rules:
 - search: Searching for specific information
 - general_chat: General conversation, greetings, jokes (e.g. "Hi", "How are you", "Tell me a joke")
 
-Current Time: {current_time}
-
 Example Input: "What am I doing today?"
-Example Output: {{"intent": "query_schedule", "entities": {{}}, "sentiment": "neutral"}}
+Example Output: {"intent": "query_schedule", "entities": {"title": null, "time": null, "duration": null, "category": null, "username": null}, "sentiment": "neutral"}
 
 Example Input: "Remind me to call John at 5pm"
-Example Output: {{"intent": "add_task", "entities": {{"title": "Call John", "time": "2025-11-23 17:00"}}, "sentiment": "neutral"}}
+Example Output: {"intent": "add_task", "entities": {"title": "Call John", "time": "2025-11-23 17:00", "duration": null, "category": "Personal", "username": null}, "sentiment": "neutral"}
 
 Example Input: "Who won the 2022 World Cup?"
-Example Output: {{"intent": "query_knowledge", "entities": {{}}, "sentiment": "neutral"}}
+Example Output: {"intent": "query_knowledge", "entities": {"title": null, "time": null, "duration": null, "category": null, "username": null}, "sentiment": "neutral"}
 
 Example Input: "Help me organize my work"
-Example Output: {{"intent": "add_task", "entities": {{"title": "Organize work"}}, "sentiment": "neutral"}}
+Example Output: {"intent": "add_task", "entities": {"title": "Organize work", "time": null, "duration": null, "category": "Work", "username": null}, "sentiment": "neutral"}
 
 Example Input: "Call me Rylix from now on"
-Example Output: {{"intent": "change_name", "entities": {{"username": "Rylix"}}, "sentiment": "positive"}}
+Example Output: {"intent": "change_name", "entities": {"title": null, "time": null, "duration": null, "category": null, "username": "Rylix"}, "sentiment": "positive"}
+"""
+
+def detect_intent(message: str) -> Dict:
+    """
+    Detect intent using LLM exclusively.
+    Returns a dictionary with 'intent', 'entities', and 'sentiment'.
+    Sampling is constrained to INTENT_SCHEMA, so a single generation always
+    yields valid JSON and stops at the closing brace.
+    """
+    current_time = datetime.now().strftime("%Y-%m-%d %H:%M")
+    
+    base_prompt = (
+        INTENT_SYSTEM_PROMPT
+        + f"""
+Current Time: {current_time}
 <|end|>
 <|user|>
 {message}
 <|end|>
 <|assistant|>"""
+    )
 
-    for attempt in range(max_retries):
-        try:
-            response = llm.generate(base_prompt, max_tokens=200)
-            
-            # Try to extract and parse JSON
-            data = extract_json_from_text(response)
-            
-            if data:
-                # Normalize keys
-                if 'due_date' in data.get('entities', {}):
-                    data['entities']['time'] = data['entities']['due_date']
-                return data
-            
-            print(f"Attempt {attempt + 1}: Invalid JSON from LLM. Retrying...")
-            
-        except Exception as e:
-            print(f"Attempt {attempt + 1}: Error - {e}")
+    response = llm_scheduler.generate(
+        base_prompt, max_tokens=200, cache_prefix=INTENT_SYSTEM_PROMPT, grammar=json_grammar(INTENT_SCHEMA)
+    )
+
+    # Only fails when the model is unavailable (offline/error message)
+    try:
+        data = load_constrained(response)
+    except ValueError:
+        data = extract_json_from_text(response)
+    if data:
+        data['entities'] = drop_nulls(data.get('entities'))
+        return data
 
-    # Fallback if all retries fail
-    print("All intent detection attempts failed. Defaulting to general_chat.")
+    print("Intent detection failed. Defaulting to general_chat.")
     return {
         "intent": "general_chat",
         "entities": {},
         "sentiment": "neutral"
-    }
\ No newline at end of file
+    }
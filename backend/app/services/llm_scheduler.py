@@ -0,0 +1,310 @@
+import asyncio
+import heapq
+import itertools
+import logging
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, TimeoutError as FutureTimeout
+
+from ..config import config
+from ..models.llm_models import llm
+
+logger = logging.getLogger(__name__)
+
+# Priority lanes: lower value is served first.
+INTERACTIVE = 0
+BACKGROUND = 1
+LANE_NAMES = {INTERACTIVE: "interactive", BACKGROUND: "background"}
+
+
+class LLMBusyError(Exception):
+    """Raised when the LLM cannot take a request right now."""
+    status_code = 503
+    retry_after = 5
+    status = "busy"
+    message = "AURA is busy, please retry shortly"
+
+
+class LLMQueueFullError(LLMBusyError):
+    """Admission control rejected the request because its lane is full."""
+    status_code = 429
+
+
+class LLMDeadlineExceededError(LLMBusyError):
+    """The request waited in the queue past its deadline and was dropped."""
+    status_code = 503
+
+
+class LLMWarmingUpError(LLMBusyError):
+    """The models are still loading in the background."""
+    status_code = 503
+    retry_after = 10
+    status = "warming_up"
+    message = "AURA is warming up, please retry shortly"
+
+
+class _Job:
+    def __init__(self, fn, args, kwargs, priority: int, deadline: float):
+        self.fn = fn
+        self.args = args
+        self.kwargs = kwargs
+        self.priority = priority
+        self.enqueued_at = time.monotonic()
+        self.deadline = self.enqueued_at + deadline if deadline else None
+        self.future = Future()
+
+    def remaining(self):
+        if self.deadline is None:
+            return None
+        return max(self.deadline - time.monotonic(), 0.0)
+
+
+class LLMScheduler:
+    """
+    Single entry point for LLM work.
+
+    Requests go into a bounded priority queue and are executed by a fixed
+    number of worker threads (one per model instance), so concurrent handlers
+    never fight over the llama.cpp context or oversubscribe CPU threads.
+    Interactive chat is always dequeued before background work, requests
+    that wait past their deadline are dropped, and a full lane is rejected
+    immediately instead of piling up.
+    """
+
+    def __init__(self, workers: int = None):
+        self.workers = workers or config.LLM_SCHEDULER_WORKERS
+        self.limits = {
+            INTERACTIVE: config.LLM_QUEUE_MAX_INTERACTIVE,
+            BACKGROUND: config.LLM_QUEUE_MAX_BACKGROUND,
+        }
+        self.deadlines = {
+            INTERACTIVE: config.LLM_INTERACTIVE_DEADLINE_S,
+            BACKGROUND: config.LLM_BACKGROUND_DEADLINE_S,
+        }
+        self._heap = []
+        self._seq = itertools.count()
+        self._depth = {INTERACTIVE: 0, BACKGROUND: 0}
+        self._cond = threading.Condition()
+        self._threads = []
+        self._running = 0
+        self._waits = {INTERACTIVE: deque(maxlen=500), BACKGROUND: deque(maxlen=500)}
+        self.stats = {"admitted": 0, "rejected": 0, "expired": 0, "completed": 0, "failed": 0}
+
+    def _ensure_workers(self):
+        if self._threads:
+            return
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._worker, name=f"llm-worker-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    # ----- admission -----
+
+    def ensure_ready(self):
+        """Raise LLMWarmingUpError (and kick off loading) until the models are loaded."""
+        if not llm.ready:
+            llm.start_loading()
+            raise LLMWarmingUpError(f"Models are {llm.status.replace('_', ' ')}")
+
+    def check_capacity(self, priority: int = INTERACTIVE):
+        """
+        Raise LLMWarmingUpError while the models are loading, or
+        LLMQueueFullError if a request in this lane would be rejected.
+        """
+        self.ensure_ready()
+        with self._cond:
+            if self._depth[priority] >= self.limits[priority]:
+                self.stats["rejected"] += 1
+                raise LLMQueueFullError(
+                    f"LLM queue is full ({LANE_NAMES[priority]} lane); please retry shortly"
+                )
+
+    def submit(self, fn, *args, priority: int = INTERACTIVE, deadline: float = None, **kwargs) -> _Job:
+        """Queue `fn(*args, **kwargs)` for a worker thread and return the job."""
+        self._ensure_workers()
+        job = _Job(fn, args, kwargs, priority, deadline if deadline is not None else self.deadlines[priority])
+        with self._cond:
+            self.check_capacity(priority)
+            heapq.heappush(self._heap, (priority, next(self._seq), job))
+            self._depth[priority] += 1
+            self.stats["admitted"] += 1
+            self._cond.notify()
+        return job
+
+    # ----- execution -----
+
+    def _worker(self):
+        while True:
+            with self._cond:
+                while not self._heap:
+                    self._cond.wait()
+                _, _, job = heapq.heappop(self._heap)
+                self._depth[job.priority] -= 1
+
+            if not job.future.set_running_or_notify_cancel():
+                # The caller gave up (deadline) before we got to it.
+                continue
+
+            waited = time.monotonic() - job.enqueued_at
+            with self._cond:
+                self._waits[job.priority].append(waited)
+                if job.deadline is not None and time.monotonic() > job.deadline:
+                    self.stats["expired"] += 1
+                    expired = True
+                else:
+                    self._running += 1
+                    expired = False
+            if expired:
+                job.future.set_exception(LLMDeadlineExceededError("LLM request expired in queue"))
+                continue
+
+            try:
+                job.future.set_result(job.fn(*job.args, **job.kwargs))
+                outcome = "completed"
+            except BaseException as e:
+                job.future.set_exception(e)
+                outcome = "failed"
+            with self._cond:
+                self._running -= 1
+                self.stats[outcome] += 1
+
+    def _drop(self, job: _Job) -> bool:
+        """Cancel a job that is still queued and free its slot; False once it has started."""
+        with self._cond:
+            if not job.future.cancel():
+                return False
+            entries = [entry for entry in self._heap if entry[2] is not job]
+            if len(entries) < len(self._heap):
+                # Not popped by a worker yet, which would have counted it already
+                self._heap = entries
+                heapq.heapify(self._heap)
+                self._depth[job.priority] -= 1
+            return True
+
+    def _expire(self, job: _Job):
+        """Called when a caller's deadline passes; drops the job if still queued."""
+        if self._drop(job):
+            with self._cond:
+                self.stats["expired"] += 1
+            raise LLMDeadlineExceededError("LLM request expired in queue")
+
+    def run(self, fn, *args, priority: int = INTERACTIVE, deadline: float = None, **kwargs):
+        """Blocking submit-and-wait, for synchronous callers."""
+        job = self.submit(fn, *args, priority=priority, deadline=deadline, **kwargs)
+        try:
+            return job.future.result(timeout=job.remaining())
+        except FutureTimeout:
+            self._expire(job)
+            # Already running: the deadline only bounds queueing time.
+            return job.future.result()
+
+    async def run_async(self, fn, *args, priority: int = INTERACTIVE, deadline: float = None, **kwargs):
+        """Awaitable submit-and-wait that never blocks the event loop."""
+        job = self.submit(fn, *args, priority=priority, deadline=deadline, **kwargs)
+        waiter = asyncio.wrap_future(job.future)
+        try:
+            return await asyncio.wait_for(asyncio.shield(waiter), timeout=job.remaining())
+        except asyncio.TimeoutError:
+            self._expire(job)
+            return await waiter
+
+    # ----- LLM helpers -----
+
+    def generate(self, prompt: str, max_tokens: int = None, *, temperature: float = None,
+                 cache_prefix: str = None, grammar: str = None, priority: int = INTERACTIVE,
+                 deadline: float = None) -> str:
+        # Response cache hits are answered here, without queueing behind generations
+        cached = llm.cached_response(prompt, max_tokens, temperature=temperature, grammar=grammar)
+        if cached is not None:
+            return cached
+        return self.run(
+            llm.generate, prompt, max_tokens, temperature=temperature, cache_prefix=cache_prefix,
+            grammar=grammar, lookup_cache=False, priority=priority, deadline=deadline,
+        )
+
+    async def generate_async(self, prompt: str, max_tokens: int = None, *, temperature: float = None,
+                             cache_prefix: str = None, grammar: str = None, priority: int = INTERACTIVE,
+                             deadline: float = None) -> str:
+        cached = await asyncio.to_thread(
+            llm.cached_response, prompt, max_tokens, temperature=temperature, grammar=grammar
+        )
+        if cached is not None:
+            return cached
+        return await self.run_async(
+            llm.generate, prompt, max_tokens, temperature=temperature, cache_prefix=cache_prefix,
+            grammar=grammar, lookup_cache=False, priority=priority, deadline=deadline,
+        )
+
+    async def stream(self, prompt: str, max_tokens: int = None, *, temperature: float = None,
+                     cache_prefix: str = None, priority: int = INTERACTIVE, deadline: float = None):
+        """
+        Async generator over LLM.generate_stream. The whole stream runs as one
+        scheduled job; pieces are handed to the event loop as they arrive. If
+        the consumer stops early (e.g. the client disconnected) the job ends
+        at the next token and frees the worker.
+        """
+        loop = asyncio.get_running_loop()
+        queue: asyncio.Queue = asyncio.Queue()
+        cancelled = threading.Event()
+        done = object()
+
+        def produce():
+            stream = llm.generate_stream(prompt, max_tokens, temperature=temperature, cache_prefix=cache_prefix)
+            try:
+                for piece in stream:
+                    if cancelled.is_set():
+                        break
+                    loop.call_soon_threadsafe(queue.put_nowait, piece)
+            finally:
+                stream.close()
+
+        job = self.submit(produce, priority=priority, deadline=deadline)
+        # Fires however the job ends (finished, failed, expired or cancelled),
+        # always after every piece it produced has been queued.
+        job.future.add_done_callback(lambda _: loop.call_soon_threadsafe(queue.put_nowait, done))
+        try:
+            while True:
+                started = job.future.running() or job.future.done()
+                try:
+                    piece = await asyncio.wait_for(queue.get(), timeout=None if started else job.remaining())
+                except asyncio.TimeoutError:
+                    # Raises if the job is still queued; otherwise it has just started.
+                    self._expire(job)
+                    continue
+                if piece is done:
+                    break
+                yield piece
+            # Surface errors raised by the job itself (e.g. expiry in the worker)
+            job.future.result()
+        finally:
+            # Consumer gone: a queued job gives up its slot, a running one stops
+            # at the next token
+            self._drop(job)
+            cancelled.set()
+
+    # ----- metrics -----
+
+    def get_stats(self) -> dict:
+        with self._cond:
+            lanes = {}
+            for priority, name in LANE_NAMES.items():
+                waits = sorted(self._waits[priority])
+                lanes[name] = {
+                    "queued": self._depth[priority],
+                    "limit": self.limits[priority],
+                    "wait_ms_avg": round(sum(waits) / len(waits) * 1000, 1) if waits else None,
+                    "wait_ms_p95": round(waits[min(len(waits) - 1, int(len(waits) * 0.95))] * 1000, 1) if waits else None,
+                    "wait_ms_max": round(waits[-1] * 1000, 1) if waits else None,
+                }
+            return {
+                "workers": self.workers,
+                "models": llm.status,
+                "running": self._running,
+                "queue_depth": sum(self._depth.values()),
+                "lanes": lanes,
+                **self.stats,
+            }
+
+
+llm_scheduler = LLMScheduler()
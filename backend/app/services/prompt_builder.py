@@ -0,0 +1,110 @@
+from typing import List
+import logging
+
+from ..config import config
+from ..models.llm_models import llm
+
+logger = logging.getLogger(__name__)
+
+# Tokens kept free besides the generation budget (BOS, tokenizer boundary
+# effects when sections are joined).
+SAFETY_MARGIN = 16
+
+
+class PromptBudget:
+    """
+    Token accounting for one prompt.
+
+    The usable prompt size is the context window minus the tokens reserved
+    for generation. Sections are added in priority order; each one is capped
+    by its own budget and by whatever is left, so a low-priority section is
+    trimmed first when the prompt runs long. Every section records how many
+    tokens it used and how much was dropped, for the per-request log line.
+    """
+
+    def __init__(self, max_new_tokens: int = None, context_window: int = None):
+        self.max_new_tokens = max_new_tokens or config.LLM_MAX_TOKENS
+        self.limit = (context_window or config.LLM_CONTEXT_WINDOW) - self.max_new_tokens - SAFETY_MARGIN
+        self.used = 0
+        self.sections = {}
+
+    @property
+    def remaining(self) -> int:
+        return max(self.limit - self.used, 0)
+
+    def _record(self, name: str, tokens: int, kept: int = None, total: int = None):
+        self.used += tokens
+        self.sections[name] = {"tokens": tokens}
+        if total is not None:
+            self.sections[name].update(kept=kept, total=total)
+
+    def take(self, name: str, text: str, budget: int = None) -> str:
+        """
+        Add a single block of text, truncating its tail to fit. Without a
+        budget the text is taken whole (e.g. the system prompt) and only
+        counted.
+        """
+        tokens = llm.count_tokens(text)
+        if budget is not None:
+            budget = min(budget, self.remaining)
+            if tokens > budget:
+                text = truncate_to_tokens(text, budget)
+                tokens = llm.count_tokens(text)
+        self._record(name, tokens)
+        return text
+
+    def take_items(self, name: str, items: List[str], budget: int, *, drop_from: str = "end",
+                   separator: str = "\n", header: str = "") -> List[str]:
+        """
+        Add a list of items (history turns, RAG chunks), dropping whole items
+        until they fit. `drop_from="start"` keeps the newest contiguous run of
+        a chronological list (oldest dropped first); `"end"` keeps a best-first
+        list greedily, skipping lower-ranked items that no longer fit.
+        The header is only charged when at least one item is kept.
+        """
+        budget = min(budget, self.remaining)
+        header_cost = llm.count_tokens(header)
+        kept, tokens = [], header_cost
+        order = range(len(items) - 1, -1, -1) if drop_from == "start" else range(len(items))
+        for i in order:
+            cost = llm.count_tokens(items[i] + separator)
+            if tokens + cost > budget:
+                if drop_from == "start":
+                    break
+                continue
+            kept.append(i)
+            tokens += cost
+        kept.sort()
+
+        tokens = tokens if kept else 0
+        self._record(name, tokens, kept=len(kept), total=len(items))
+        return [items[i] for i in kept]
+
+    def log(self, prompt: str, label: str) -> int:
+        """Count the assembled prompt and log the per-section breakdown."""
+        total = llm.count_tokens(prompt) + 1  # + BOS
+        parts = []
+        for name, info in self.sections.items():
+            part = f"{name}={info['tokens']}"
+            if "total" in info:
+                part += f" ({info['kept']}/{info['total']})"
+            parts.append(part)
+        logger.info(
+            f"Prompt tokens [{label}]: {total}/{self.limit} + {self.max_new_tokens} generation | "
+            + ", ".join(parts)
+        )
+        if total > self.limit + SAFETY_MARGIN:
+            logger.warning(f"Prompt [{label}] exceeds its budget ({total} > {self.limit})")
+        return total
+
+
+def truncate_to_tokens(text: str, budget: int) -> str:
+    """Cut `text` down to at most `budget` tokens, keeping its beginning."""
+    if budget <= 0:
+        return ""
+    tokens = llm.count_tokens(text)
+    while tokens > budget and text:
+        # Shrink proportionally, slightly overshooting so this converges fast
+        text = text[:int(len(text) * budget / tokens * 0.95)]
+        tokens = llm.count_tokens(text)
+    return text
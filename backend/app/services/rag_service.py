@@ -1,88 +1,281 @@
-from ..database import collection
+from .vector_store import vector_store
 from ..models.llm_models import llm
 from ..config import config
-import uuid
+from .embedding_service import embedder
+from .bm25_index import bm25_index
+from .reranker import reranker, mmr
+from ..utils.chunker import iter_chunks
+from pathlib import Path
+import hashlib
+import json
+import os
+import time
 
 
-def add_to_rag(filename: str, content: str):
+def _pages(items, size: int):
+    """Group an iterator into lists of at most `size` items"""
+    page = []
+    for item in items:
+        page.append(item)
+        if len(page) >= size:
+            yield page
+            page = []
+    if page:
+        yield page
+
+
+def _document_key(filename: str) -> str:
+    return hashlib.sha1(filename.encode("utf-8")).hexdigest()[:12]
+
+
+def _manifest_path(filename: str) -> Path:
+    return config.RAG_MANIFEST_DIR / f"{_document_key(filename)}.json"
+
+
+def _checkpoint_path(filename: str) -> Path:
+    return config.RAG_MANIFEST_DIR / f"{_document_key(filename)}.partial.json"
+
+
+def load_manifest(filename: str) -> list:
+    """
+    Chunk ids of a document in document order, from its manifest. Documents
+    indexed before manifests existed fall back to the ids in the vector store.
+    """
+    path = _manifest_path(filename)
+    if path.exists():
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)["chunks"]
+    return vector_store.ids_for(filename)
+
+
+def load_checkpoint(filename: str) -> list:
+    """Chunk ids already stored by an interrupted indexing run, in order"""
+    path = _checkpoint_path(filename)
+    if not path.exists():
+        return []
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)["chunks"]
+
+
+def _save_manifest(filename: str, chunk_ids: list, path: Path = None):
+    path = path or _manifest_path(filename)
+    tmp = path.with_suffix(".tmp")
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump({"filename": filename, "chunks": chunk_ids, "updated": time.time()}, f)
+    os.replace(tmp, path)
+
+
+def _chunk_ids(filename: str, chunks):
     """
-    Chunk a document, embed chunks, and add them to the Chroma collection.
-    Uses configuration values for chunking to avoid magic numbers.
+    Deterministic ids: document key + content hash, with an occurrence
+    suffix when the same text appears more than once in a document.
+    Yields (chunk_id, text).
     """
-    if collection is None:
-        print("ChromaDB collection not initialized")
-        return
+    prefix = _document_key(filename)
+    seen = {}
+    for text in chunks:
+        digest = hashlib.sha256(text.encode("utf-8")).hexdigest()[:24]
+        occurrence = seen.get(digest, 0)
+        seen[digest] = occurrence + 1
+        yield (f"{prefix}:{digest}" if occurrence == 0 else f"{prefix}:{digest}:{occurrence}"), text
+
+
+def add_to_rag(filename: str, content, progress=None) -> dict:
+    """
+    Index (or re-index) a document in the vector store.
+
+    `content` is the document text or an iterable of text blocks (pages).
+    Chunks are produced lazily, one page of RAG_INGEST_PAGE_SIZE chunks at a
+    time, so memory stays flat however large the document is. Chunk ids are
+    content hashes, so on re-index only new or changed chunks are embedded
+    and upserted, chunks that merely moved get their position updated, and
+    chunks no longer present are deleted. Returns counts of each plus the
+    total number of chunks.
 
+    After every page the ids stored so far are checkpointed, so a run that
+    is interrupted (crash, restart) resumes without re-embedding them.
+    `progress(chunks_done)` is called after every page. Errors are raised
+    to the caller.
+    """
+    counts = {"chunks": 0, "added": 0, "unchanged": 0, "moved": 0, "deleted": 0}
     try:
-        # Chunk text with overlap for better context
-        chunk_size = getattr(config, "RAG_CHUNK_SIZE", 500)
-        overlap = getattr(config, "RAG_CHUNK_OVERLAP", 50)
-        chunks = []
-
-        if len(content) <= chunk_size:
-            chunks = [content]
-        else:
-            start = 0
-            while start < len(content):
-                end = start + chunk_size
-                chunks.append(content[start:end])
-                start += max(chunk_size - overlap, 1)
-
-        # Generate unique IDs
-        ids = [f"{filename}_{i}_{uuid.uuid4().hex[:8]}" for i in range(len(chunks))]
-        metadatas = [{"filename": filename, "chunk_index": i} for i in range(len(chunks))]
-
-        # Get embeddings
-        embeddings = [llm.embed(chunk) for chunk in chunks]
-
-        collection.add(
-            ids=ids,
-            documents=chunks,
-            embeddings=embeddings,
-            metadatas=metadatas,
+        previous = load_manifest(filename)
+        checkpoint = load_checkpoint(filename)
+        previous_index = {chunk_id: i for i, chunk_id in enumerate(previous)}
+        # Chunks stored by an interrupted run are already at their new position
+        previous_index.update({chunk_id: i for i, chunk_id in enumerate(checkpoint)})
+
+        chunks = iter_chunks(
+            content,
+            max_tokens=config.RAG_CHUNK_TOKENS,
+            overlap_tokens=config.RAG_CHUNK_OVERLAP_TOKENS,
+            count_tokens=llm.count_embedding_tokens,
         )
-        print(f"Successfully added {len(chunks)} chunks to RAG for {filename}")
+        manifest = []
+        embed_seconds = 0.0
+        for page in _pages(_chunk_ids(filename, chunks), config.RAG_INGEST_PAGE_SIZE):
+            new_ids, new_docs, new_meta = [], [], []
+            moved_ids, moved_meta = [], []
+            for chunk_id, text in page:
+                index = len(manifest)
+                manifest.append(chunk_id)
+                metadata = {"filename": filename, "chunk_index": index}
+                if chunk_id not in previous_index:
+                    new_ids.append(chunk_id)
+                    new_docs.append(text)
+                    new_meta.append(metadata)
+                elif previous_index[chunk_id] != index:
+                    moved_ids.append(chunk_id)
+                    moved_meta.append(metadata)
+                else:
+                    counts["unchanged"] += 1
+
+            if new_ids:
+                started = time.perf_counter()
+                embeddings = llm.embed_batch(new_docs)
+                embed_seconds += time.perf_counter() - started
+                vector_store.upsert(new_ids, embeddings, new_docs, new_meta)
+                bm25_index.add(new_ids, new_docs, filename)
+                counts["added"] += len(new_ids)
+            if moved_ids:
+                # Same text at a new position: fix the metadata, keep the vector
+                vector_store.update_metadata(moved_ids, moved_meta)
+                counts["moved"] += len(moved_ids)
+
+            _save_manifest(filename, manifest, _checkpoint_path(filename))
+            if progress:
+                progress(len(manifest))
+
+        stale = list(set(previous_index) - set(manifest))
+        vector_store.delete(stale)
+        bm25_index.delete(stale)
+        counts["deleted"] = len(stale)
+        counts["chunks"] = len(manifest)
+        _save_manifest(filename, manifest)
+        _checkpoint_path(filename).unlink(missing_ok=True)
+
+        if counts["added"]:
+            embedder.record_ingestion(counts["added"], embed_seconds)
+        rate = counts["added"] / embed_seconds if embed_seconds > 0 else 0.0
+        print(f"Indexed {filename}: {len(manifest)} chunks ({counts['added']} embedded in "
+              f"{embed_seconds:.2f}s, {rate:.1f} chunks/s; {counts['moved']} moved, "
+              f"{counts['unchanged']} unchanged, {counts['deleted']} deleted)")
 
     except Exception as e:
         print(f"Error adding to RAG: {e}")
+        raise
+    return counts
 
 
 def delete_document_embeddings(filename: str) -> int:
     """
-    Remove all embeddings from the Chroma collection that belong to a document.
+    Remove all embeddings from the vector store that belong to a document.
 
-    We delete by metadata.filename which we set when adding chunks.
+    We delete by metadata.filename which we set when adding chunks, and drop
+    the document's chunk manifest and lexical index entries.
 
-    Returns the number of deleted items if available, otherwise 0.
+    Returns the number of deleted items.
     """
-    if collection is None:
-        print("ChromaDB collection not initialized")
-        return 0
-
     try:
-        # Some Chroma backends may not return a count; in that case just perform delete.
-        result = collection.delete(where={"filename": filename})
-        # result can be None or a dict depending on backend version
-        if isinstance(result, dict):
-            return int(result.get("count", 0))
-        return 0
+        _manifest_path(filename).unlink(missing_ok=True)
+        _checkpoint_path(filename).unlink(missing_ok=True)
+        bm25_index.delete_document(filename)
+        return vector_store.delete_document(filename)
     except Exception as e:
         print(f"Error deleting embeddings for {filename}: {e}")
         return 0
 
 
-def query_rag(query: str, k: int = None) -> str:
-    if collection is None:
-        return ""
+def sync_lexical_index():
+    """
+    Backfill the BM25 index from the vector store when it is empty (e.g. for
+    documents indexed before the lexical index existed).
+    """
+    try:
+        if bm25_index.count() or not vector_store.count():
+            return
+        total = 0
+        for page in vector_store.iter_pages(1000):
+            by_file = {}
+            for chunk in page:
+                by_file.setdefault(chunk["metadata"].get("filename", ""), []).append(chunk)
+            for filename, chunks in by_file.items():
+                bm25_index.add([c["id"] for c in chunks], [c["text"] for c in chunks], filename)
+            total += len(page)
+        print(f"Lexical index rebuilt from {total} chunks")
+    except Exception as e:
+        print(f"Error rebuilding lexical index: {e}")
+
+
+def _fuse(dense: list, lexical: list, top_k: int) -> list:
+    """
+    Reciprocal-rank fusion: each list contributes 1 / (RAG_RRF_K + rank).
+    Chunks found only lexically are fetched from the vector store.
+    """
+    fused = {}
+    for rank, chunk in enumerate(dense, start=1):
+        fused[chunk["id"]] = {**chunk, "score": 1.0 / (config.RAG_RRF_K + rank), "dense_rank": rank}
+    for rank, (chunk_id, _) in enumerate(lexical, start=1):
+        entry = fused.setdefault(chunk_id, {"id": chunk_id, "text": None, "metadata": {}, "score": 0.0})
+        entry["score"] += 1.0 / (config.RAG_RRF_K + rank)
+        entry["lexical_rank"] = rank
+
+    ranked = sorted(fused.values(), key=lambda c: c["score"], reverse=True)[:top_k]
+    missing = [c["id"] for c in ranked if c["text"] is None]
+    if missing:
+        by_id = {found["id"]: found for found in vector_store.get(missing)}
+        for chunk in ranked:
+            if chunk["text"] is None and chunk["id"] in by_id:
+                chunk["text"], chunk["metadata"] = by_id[chunk["id"]]["text"], by_id[chunk["id"]]["metadata"]
+    return [c for c in ranked if c["text"] is not None]
 
+
+def _first_stage(query: str, n: int) -> list:
+    """
+    Candidate retrieval: `n` dense hits, fused by reciprocal rank with `n`
+    BM25 hits when RAG_HYBRID_ENABLED (exact codes, names and error strings
+    that MiniLM misses still surface). Best first.
+    """
+    # Concurrent queries share one encode call via the micro-batcher
+    dense = vector_store.query(embedder.embed(query), n)
+    if not config.RAG_HYBRID_ENABLED:
+        return dense
+    return _fuse(dense, bm25_index.search(query, n), n)
+
+
+def query_rag_chunks(query: str, k: int = None) -> list:
+    """
+    Return the top-k chunks for `query`, best first, as dicts with `id`,
+    `text`, `score` (higher is more relevant), `source` and `metadata`.
+
+    Two stages: RAG_CANDIDATES first-stage candidates are rescored by the
+    local cross-encoder (when RERANK_ENABLED), then maximal marginal
+    relevance picks k of them so overlapping chunks of one passage don't
+    fill every slot. `retrieval_score` keeps the first-stage score.
+    """
     try:
         top_k = k if k is not None else getattr(config, "RAG_TOP_K", 3)
-        query_emb = llm.embed(query)
-        results = collection.query(query_embeddings=[query_emb], n_results=top_k)
+        candidates = _first_stage(query, max(top_k, config.RAG_CANDIDATES))
+        if not candidates:
+            return []
+        for chunk in candidates:
+            chunk["retrieval_score"] = chunk["score"]
+            chunk["source"] = chunk["metadata"].get("filename")
+
+        relevance = reranker.score(query, [c["text"] for c in candidates]) if config.RERANK_ENABLED else None
+        if relevance is None:
+            # No cross-encoder: scale first-stage scores to [0, 1] for MMR
+            low, high = min(c["score"] for c in candidates), max(c["score"] for c in candidates)
+            relevance = [(c["score"] - low) / (high - low) if high > low else 1.0 for c in candidates]
+        for chunk, score in zip(candidates, relevance):
+            chunk["score"] = score
+        candidates.sort(key=lambda c: c["score"], reverse=True)
 
-        if results.get("documents") and results["documents"][0]:
-            return "\n".join(results["documents"][0])
-        return ""
+        return mmr(candidates, top_k)
     except Exception as e:
         print(f"Error querying RAG: {e}")
-        return ""
\ No newline at end of file
+        return []
+
+
+def query_rag(query: str, k: int = None) -> str:
+    return "\n".join(chunk["text"] for chunk in query_rag_chunks(query, k))
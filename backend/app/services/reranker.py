@@ -0,0 +1,116 @@
+import logging
+import math
+import threading
+import time
+
+import numpy as np
+
+from ..config import config
+from ..models.llm_models import llm
+
+logger = logging.getLogger(__name__)
+
+
+class CrossEncoderReranker:
+    """
+    Second-stage relevance scoring with a small local cross-encoder.
+
+    The model reads (query, chunk) pairs jointly, which ranks far better
+    than bi-encoder cosine similarity, and is cheap enough on CPU for a few
+    dozen candidates per query. main.py loads it in the background at
+    startup, next to the LLM and embedder, so the first query does not pay
+    for it; a query that arrives earlier waits for that load. If it cannot
+    be loaded, callers keep the first-stage order.
+    """
+
+    def __init__(self, model_name: str = None):
+        self.model_name = model_name or config.RERANK_MODEL
+        self.model = None
+        self._load_lock = threading.Lock()
+        self._loaded = False
+        self._load_thread = None
+        self._predict_lock = threading.Lock()
+        self.stats = {"queries": 0, "pairs": 0, "ms_total": 0.0}
+
+    def _load(self):
+        with self._load_lock:
+            if self._loaded:
+                return
+            try:
+                from sentence_transformers import CrossEncoder
+
+                logger.info(f"[INFO] Loading reranker {self.model_name}...")
+                self.model = CrossEncoder(self.model_name, device="cpu", max_length=512)
+                logger.info("[OK] Reranker loaded")
+            except Exception as e:
+                logger.warning(f"[WARNING] Reranker unavailable, using first-stage ranking: {e}")
+            self._loaded = True
+
+    def start_loading(self):
+        """Load the model in a background thread (no-op if already started)."""
+        with self._load_lock:
+            if self._loaded or self._load_thread is not None:
+                return
+            self._load_thread = threading.Thread(target=self._load, name="reranker-loader", daemon=True)
+            self._load_thread.start()
+
+    def score(self, query: str, texts: list):
+        """Relevance in [0, 1] for each text, or None if no model is available."""
+        if not texts:
+            return []
+        if not self._loaded:
+            self._load()
+        if self.model is None:
+            return None
+
+        started = time.perf_counter()
+        with self._predict_lock:
+            logits = self.model.predict(
+                [(query, text) for text in texts],
+                batch_size=config.RERANK_BATCH_SIZE,
+                show_progress_bar=False,
+            )
+        self.stats["queries"] += 1
+        self.stats["pairs"] += len(texts)
+        self.stats["ms_total"] += (time.perf_counter() - started) * 1000
+        return [1.0 / (1.0 + math.exp(-float(logit))) for logit in logits]
+
+    def get_stats(self) -> dict:
+        queries = self.stats["queries"]
+        return {
+            "model": self.model_name if self.model is not None else None,
+            "avg_ms": round(self.stats["ms_total"] / queries, 1) if queries else None,
+            **self.stats,
+        }
+
+
+def mmr(chunks: list, k: int, lambda_: float = None) -> list:
+    """
+    Maximal marginal relevance: repeatedly pick the chunk with the best
+    `lambda * relevance - (1 - lambda) * max similarity to already picked`,
+    so overlapping chunks of the same passage don't crowd out other sources.
+    Chunks need a "score" in [0, 1]; similarity is cosine over the (cached)
+    chunk embeddings.
+    """
+    if len(chunks) <= 1:
+        return chunks[:k]
+    lambda_ = config.RAG_MMR_LAMBDA if lambda_ is None else lambda_
+
+    vectors = np.asarray(llm.embed_batch([c["text"] for c in chunks], kind="rerank"), dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    vectors = vectors / np.where(norms == 0, 1.0, norms)
+    similarity = vectors @ vectors.T
+    relevance = np.asarray([c["score"] for c in chunks], dtype=np.float32)
+
+    selected = [int(np.argmax(relevance))]
+    remaining = [i for i in range(len(chunks)) if i != selected[0]]
+    while remaining and len(selected) < k:
+        redundancy = similarity[np.ix_(remaining, selected)].max(axis=1)
+        marginal = lambda_ * relevance[remaining] - (1 - lambda_) * redundancy
+        best = remaining[int(np.argmax(marginal))]
+        selected.append(best)
+        remaining.remove(best)
+    return [chunks[i] for i in selected]
+
+
+reranker = CrossEncoderReranker()
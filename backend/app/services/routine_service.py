@@ -1,7 +1,20 @@
-import json
 from datetime import datetime, timedelta
 from typing import List, Dict
-from ..models.llm_models import llm
+from .llm_scheduler import llm_scheduler, BACKGROUND
+from ..utils.json_grammar import json_grammar, load_constrained
+
+ROUTINE_SCHEMA = {
+    "type": "array",
+    "items": {
+        "type": "object",
+        "properties": {
+            "title": {"type": "string"},
+            "start": {"type": "string"},
+            "end": {"type": "string"},
+            "type": {"enum": ["task"]},
+        },
+    },
+}
 
 def generate_routine_from_text(timetable_text: str) -> List[Dict]:
     """
@@ -31,16 +44,12 @@ Example Output: [
 <|end|>
 <|assistant|>"""
 
-        response = llm.generate(prompt, max_tokens=500)
+        response = llm_scheduler.generate(
+            prompt, max_tokens=500, grammar=json_grammar(ROUTINE_SCHEMA), priority=BACKGROUND
+        )
         
-        # Clean response
-        response = response.strip()
-        if "```json" in response:
-            response = response.split("```json")[1].split("```")[0].strip()
-        elif "```" in response:
-            response = response.split("```")[1].split("```")[0].strip()
-            
-        events = json.loads(response)
+        # Grammar-constrained, so this only fails if the model is unavailable
+        events = load_constrained(response)
         
         # Post-processing: Add Prep Time and Meals
         final_routine = []
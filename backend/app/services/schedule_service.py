@@ -1,5 +1,6 @@
 from sqlalchemy.orm import Session
 from ..models.sql_models import Task, RoutineEvent
+from ..models.queries import tasks_due_between, unscheduled_tasks
 from datetime import datetime, timedelta
 from typing import Dict
 import json
@@ -132,13 +133,7 @@ def generate_routine(user_id: int, db: Session, date: datetime = None) -> Dict:
     # Use date-only comparison to ensure we get all tasks for the day regardless of time
     day_end = base_date + timedelta(days=1)
     
-    scheduled_tasks = db.query(Task).filter(
-        Task.user_id == user_id,
-        Task.due_date.isnot(None),  # Must have a due_date
-        Task.due_date >= base_date,
-        Task.due_date < day_end,
-        Task.completed == False
-    ).all()
+    scheduled_tasks = db.scalars(tasks_due_between(user_id, base_date, day_end)).all()
     
     for task in scheduled_tasks:
         duration = task.duration_minutes or 30
@@ -231,18 +226,8 @@ def auto_schedule_tasks(user_id: int, db: Session, date: datetime = None) -> Dic
     """
     Automatically assign unscheduled tasks to free blocks.
     """
-    # 1. Get Unscheduled Tasks (High priority first)
-    unscheduled = db.query(Task).filter(
-        Task.user_id == user_id,
-        Task.due_date == None,
-        Task.completed == False
-    ).order_by(
-        # Custom sort: Urgent > High > Medium > Low
-        Task.priority == 'urgent',
-        Task.priority == 'high',
-        Task.priority == 'medium',
-        Task.priority == 'low'
-    ).all()
+    # 1. Get Unscheduled Tasks (Urgent > High > Medium > Low)
+    unscheduled = db.scalars(unscheduled_tasks(user_id)).all()
     
     if not unscheduled:
         return {"status": "no_tasks", "message": "No unscheduled tasks found."}
@@ -0,0 +1,458 @@
+"""
+Vector storage behind one small interface.
+
+rag_service and the search route only need a handful of operations: upsert
+chunks with their embeddings, fix metadata, delete by id or document, fetch
+by id, page through everything, and nearest-neighbour search. Two backends
+implement them:
+
+- ChromaVectorStore: the persistent Chroma collection used so far.
+- FlatVectorStore: a built-in exact (brute-force) index. Vectors live in a
+  memory-mapped float16 or int8 matrix, ids/texts/metadata in a SQLite side
+  table. For a per-user corpus a single matrix-vector product is faster
+  than Chroma's query path and the OS pages the matrix in on demand. Once
+  the index reaches VECTOR_HNSW_MIN_VECTORS an in-memory HNSW graph
+  (hnswlib, installed with Chroma) is built in the background and kept up
+  to date; until it is ready queries use the exact scan.
+
+VECTOR_STORE picks the backend; if Chroma cannot be initialised the flat
+index is used instead of leaving search disabled.
+"""
+from abc import ABC, abstractmethod
+from pathlib import Path
+import json
+import logging
+import sqlite3
+import threading
+
+import numpy as np
+
+from ..config import config
+
+logger = logging.getLogger(__name__)
+
+try:
+    import hnswlib
+except ImportError:
+    hnswlib = None
+
+
+def _unit_rows(vectors) -> np.ndarray:
+    vectors = np.atleast_2d(np.asarray(vectors, dtype=np.float32))
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.where(norms == 0, 1.0, norms)
+
+
+class VectorStore(ABC):
+    """
+    Interface shared by the backends. Chunks are dicts with `id`, `text`,
+    `metadata` and, for query results, `score` (cosine similarity, higher is
+    more relevant). Metadata must contain the document `filename`.
+    """
+
+    name = "base"
+
+    @abstractmethod
+    def upsert(self, ids: list, embeddings, documents: list, metadatas: list):
+        ...
+
+    @abstractmethod
+    def update_metadata(self, ids: list, metadatas: list):
+        ...
+
+    @abstractmethod
+    def delete(self, ids: list) -> int:
+        ...
+
+    @abstractmethod
+    def delete_document(self, filename: str) -> int:
+        ...
+
+    @abstractmethod
+    def get(self, ids: list) -> list:
+        ...
+
+    @abstractmethod
+    def ids_for(self, filename: str) -> list:
+        ...
+
+    @abstractmethod
+    def iter_pages(self, page_size: int = 1000):
+        """Yield every stored chunk, in lists of at most `page_size`."""
+
+    @abstractmethod
+    def count(self) -> int:
+        ...
+
+    @abstractmethod
+    def query(self, embedding, k: int) -> list:
+        ...
+
+    def get_stats(self) -> dict:
+        return {"backend": self.name, "vectors": self.count()}
+
+
+class ChromaVectorStore(VectorStore):
+    name = "chroma"
+
+    def __init__(self, path: Path = None, collection_name: str = "documents"):
+        import chromadb
+
+        self.client = chromadb.PersistentClient(path=str(path or config.CHROMA_PATH))
+        self.collection = self.client.get_or_create_collection(name=collection_name)
+
+    @staticmethod
+    def _chunks(ids, documents, metadatas) -> list:
+        return [
+            {"id": chunk_id, "text": text, "metadata": metadata or {}}
+            for chunk_id, text, metadata in zip(ids, documents, metadatas)
+        ]
+
+    def upsert(self, ids, embeddings, documents, metadatas):
+        if not ids:
+            return
+        # Unit vectors, as in the flat index: query() turns L2 distance into cosine
+        embeddings = _unit_rows(embeddings).tolist()
+        self.collection.upsert(ids=ids, embeddings=embeddings, documents=documents, metadatas=metadatas)
+
+    def update_metadata(self, ids, metadatas):
+        self.collection.update(ids=ids, metadatas=metadatas)
+
+    def delete(self, ids) -> int:
+        for start in range(0, len(ids), 500):
+            self.collection.delete(ids=ids[start:start + 500])
+        return len(ids)
+
+    def delete_document(self, filename) -> int:
+        return self.delete(self.ids_for(filename))
+
+    def get(self, ids) -> list:
+        if not ids:
+            return []
+        found = self.collection.get(ids=list(ids), include=["documents", "metadatas"])
+        return self._chunks(found["ids"], found["documents"], found["metadatas"])
+
+    def ids_for(self, filename) -> list:
+        return list(self.collection.get(where={"filename": filename}, include=[]).get("ids") or [])
+
+    def iter_pages(self, page_size=1000):
+        offset = 0
+        while True:
+            batch = self.collection.get(include=["documents", "metadatas"], limit=page_size, offset=offset)
+            ids = batch.get("ids") or []
+            if not ids:
+                return
+            yield self._chunks(ids, batch["documents"], batch["metadatas"])
+            offset += len(ids)
+
+    def count(self) -> int:
+        return self.collection.count()
+
+    def query(self, embedding, k) -> list:
+        n = min(k, self.count())
+        if n <= 0:
+            return []
+        results = self.collection.query(query_embeddings=[_unit_rows(embedding)[0].tolist()], n_results=n)
+        chunks = self._chunks(results["ids"][0], results["documents"][0], results["metadatas"][0])
+        for chunk, distance in zip(chunks, results["distances"][0]):
+            # Squared L2 between unit vectors (MiniLM embeddings are normalised) -> cosine
+            chunk["score"] = 1.0 - float(distance) / 2.0
+        return chunks
+
+
+class FlatVectorStore(VectorStore):
+    """
+    Exact cosine search over a memory-mapped matrix of unit vectors.
+
+    Row i of `vectors.<dtype>` belongs to the SQLite row with `row = i`;
+    rows of deleted chunks are reused by later inserts. int8 storage scales
+    each vector so its largest component is 127 (a quarter of float32) and
+    re-normalises rows while scanning, so only the rounding error remains.
+    """
+
+    name = "flat"
+    _GROWTH = 1024  # minimum rows added when the matrix file grows
+    _SCAN_BLOCK = 4096  # rows converted to float32 at a time during a scan (stays in cache)
+
+    def __init__(self, path: Path = None, dtype: str = None, hnsw_min_vectors: int = None):
+        self.path = Path(path or config.VECTOR_INDEX_PATH)
+        self.path.mkdir(parents=True, exist_ok=True)
+        self.hnsw_min_vectors = config.VECTOR_HNSW_MIN_VECTORS if hnsw_min_vectors is None else hnsw_min_vectors
+        self._lock = threading.RLock()
+        self._conn = sqlite3.connect(str(self.path / "rows.db"), check_same_thread=False)
+        self._conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS rows (
+                row INTEGER PRIMARY KEY, chunk_id TEXT NOT NULL UNIQUE,
+                filename TEXT, document TEXT NOT NULL, metadata TEXT NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS ix_rows_filename ON rows(filename);
+            CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL);
+            """
+        )
+        meta = dict(self._conn.execute("SELECT key, value FROM meta").fetchall())
+        requested = dtype or config.VECTOR_INDEX_DTYPE
+        stored = meta.get("dtype")
+        if stored and stored != requested:
+            logger.warning(f"[WARNING] Vector index stored as {stored}; ignoring VECTOR_INDEX_DTYPE={requested}")
+        self.dtype = np.dtype(stored or requested)
+        if self.dtype not in (np.float16, np.int8):
+            raise ValueError(f"Unsupported vector index dtype: {self.dtype}")
+        self.dim = int(meta["dim"]) if "dim" in meta else None
+
+        self._row_of = dict(self._conn.execute("SELECT chunk_id, row FROM rows"))
+        self._high = max(self._row_of.values(), default=-1) + 1  # rows in use are all < _high
+        self._alive = np.zeros(self._high, dtype=bool)
+        self._alive[list(self._row_of.values())] = True
+        self._free = [int(r) for r in np.flatnonzero(~self._alive)][::-1]
+        self._matrix = None
+        self._hnsw = None
+        self._hnsw_state = "none"  # "none", "building", "ready" or "failed"
+        self._hnsw_dirty = set()  # rows changed while the graph is being built
+        if self.dim is not None:
+            self._open_matrix()
+
+    # -- storage --
+
+    @property
+    def _matrix_path(self) -> Path:
+        return self.path / f"vectors.{self.dtype.name}"
+
+    def _open_matrix(self, min_rows: int = 0):
+        row_bytes = self.dim * self.dtype.itemsize
+        path = self._matrix_path
+        capacity = path.stat().st_size // row_bytes if path.exists() else 0
+        if capacity < max(min_rows, self._high, 1):
+            capacity = max(min_rows, self._high, capacity * 2, self._GROWTH)
+            if self._matrix is not None:
+                self._matrix.flush()
+            with open(path, "ab") as f:
+                f.truncate(capacity * row_bytes)
+            if self._hnsw is not None:
+                self._hnsw.resize_index(capacity)
+        self._matrix = np.memmap(path, dtype=self.dtype, mode="r+", shape=(capacity, self.dim))
+
+    def _encode(self, vectors: np.ndarray) -> np.ndarray:
+        if self.dtype == np.int8:
+            peak = np.abs(vectors).max(axis=1, keepdims=True)
+            return np.rint(vectors * (127 / np.where(peak == 0, 1.0, peak))).astype(np.int8)
+        return vectors.astype(np.float16)
+
+    def _decode(self, rows: np.ndarray) -> np.ndarray:
+        rows = np.asarray(rows, dtype=np.float32)
+        return _unit_rows(rows) if self.dtype == np.int8 else rows
+
+    def _set_meta(self, key: str, value):
+        self._conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, str(value)))
+
+    def _allocate(self) -> int:
+        if self._free:
+            return self._free.pop()
+        self._high += 1
+        if len(self._alive) < self._high:
+            self._alive = np.concatenate([self._alive, np.zeros(max(self._GROWTH, len(self._alive)), dtype=bool)])
+        return self._high - 1
+
+    # -- writes --
+
+    def upsert(self, ids, embeddings, documents, metadatas):
+        vectors = _unit_rows(embeddings)
+        if not ids:
+            return
+        with self._lock:
+            if self.dim is None:
+                self.dim = vectors.shape[1]
+                self._set_meta("dim", self.dim)
+                self._set_meta("dtype", self.dtype.name)
+            elif vectors.shape[1] != self.dim:
+                raise ValueError(f"Embedding dimension {vectors.shape[1]} does not match index dimension {self.dim}")
+
+            rows = []
+            for chunk_id in ids:
+                if chunk_id not in self._row_of:
+                    self._row_of[chunk_id] = self._allocate()
+                rows.append(self._row_of[chunk_id])
+            if self._matrix is None or self._high > len(self._matrix):
+                self._open_matrix(self._high)
+
+            rows = np.asarray(rows)
+            self._matrix[rows] = self._encode(vectors)
+            self._matrix.flush()
+            self._alive[rows] = True
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO rows (row, chunk_id, filename, document, metadata) VALUES (?, ?, ?, ?, ?)",
+                [
+                    (int(row), chunk_id, (metadata or {}).get("filename"), text, json.dumps(metadata or {}))
+                    for row, chunk_id, text, metadata in zip(rows, ids, documents, metadatas)
+                ],
+            )
+            self._conn.commit()
+            if self._hnsw is not None:
+                self._hnsw.add_items(self._decode(self._matrix[rows]), rows)
+            elif self._hnsw_state == "building":
+                self._hnsw_dirty.update(int(r) for r in rows)
+
+    def update_metadata(self, ids, metadatas):
+        with self._lock:
+            self._conn.executemany(
+                "UPDATE rows SET filename = ?, metadata = ? WHERE chunk_id = ?",
+                [((m or {}).get("filename"), json.dumps(m or {}), chunk_id) for chunk_id, m in zip(ids, metadatas)],
+            )
+            self._conn.commit()
+
+    def delete(self, ids) -> int:
+        with self._lock:
+            rows = [self._row_of.pop(chunk_id) for chunk_id in ids if chunk_id in self._row_of]
+            if not rows:
+                return 0
+            for start in range(0, len(rows), 500):
+                batch = rows[start:start + 500]
+                self._conn.execute(f"DELETE FROM rows WHERE row IN ({','.join('?' * len(batch))})", batch)
+            self._conn.commit()
+            self._alive[rows] = False
+            self._free.extend(rows)
+            if self._hnsw is not None:
+                for row in rows:
+                    self._hnsw.mark_deleted(row)
+            elif self._hnsw_state == "building":
+                self._hnsw_dirty.update(rows)
+            return len(rows)
+
+    def delete_document(self, filename) -> int:
+        return self.delete(self.ids_for(filename))
+
+    # -- reads --
+
+    def _fetch(self, column: str, keys: list) -> dict:
+        found = {}
+        for start in range(0, len(keys), 500):
+            batch = keys[start:start + 500]
+            cursor = self._conn.execute(
+                f"SELECT row, chunk_id, document, metadata FROM rows WHERE {column} IN ({','.join('?' * len(batch))})",
+                batch,
+            )
+            for row, chunk_id, text, metadata in cursor:
+                found[row if column == "row" else chunk_id] = {
+                    "id": chunk_id, "text": text, "metadata": json.loads(metadata)
+                }
+        return found
+
+    def get(self, ids) -> list:
+        with self._lock:
+            found = self._fetch("chunk_id", list(ids))
+        return [found[chunk_id] for chunk_id in ids if chunk_id in found]
+
+    def ids_for(self, filename) -> list:
+        with self._lock:
+            return [row[0] for row in self._conn.execute("SELECT chunk_id FROM rows WHERE filename = ?", (filename,))]
+
+    def iter_pages(self, page_size=1000):
+        last = -1
+        while True:
+            with self._lock:
+                batch = self._conn.execute(
+                    "SELECT row, chunk_id, document, metadata FROM rows WHERE row > ? ORDER BY row LIMIT ?",
+                    (last, page_size),
+                ).fetchall()
+            if not batch:
+                return
+            yield [{"id": chunk_id, "text": text, "metadata": json.loads(m)} for _, chunk_id, text, m in batch]
+            last = batch[-1][0]
+
+    def count(self) -> int:
+        return len(self._row_of)
+
+    def _start_hnsw_build(self):
+        """Build the graph in the background; queries keep scanning until it is ready."""
+        self._hnsw_state = "building"
+        self._hnsw_dirty = set()
+        live = np.flatnonzero(self._alive[:self._high])
+        threading.Thread(target=self._build_hnsw, args=(self._matrix, live), daemon=True).start()
+
+    def _build_hnsw(self, matrix: np.memmap, live: np.ndarray):
+        try:
+            index = hnswlib.Index(space="ip", dim=self.dim)
+            index.init_index(max_elements=len(matrix), ef_construction=200, M=16)
+            for start in range(0, len(live), self._SCAN_BLOCK):
+                rows = live[start:start + self._SCAN_BLOCK]
+                index.add_items(self._decode(matrix[rows]), rows)
+
+            with self._lock:
+                # Catch up with writes made during the build
+                if len(self._matrix) > len(matrix):
+                    index.resize_index(len(self._matrix))
+                indexed = set(live.tolist())
+                for row in self._hnsw_dirty:
+                    if self._alive[row]:
+                        index.add_items(self._decode(self._matrix[[row]]), [row])
+                    elif row in indexed:
+                        index.mark_deleted(row)
+                self._hnsw, self._hnsw_state = index, "ready"
+                self._hnsw_dirty = set()
+            logger.info(f"[OK] Built HNSW graph over {len(live)} vectors")
+        except Exception as e:
+            self._hnsw_state = "failed"
+            logger.warning(f"[WARNING] HNSW build failed, using exact search: {e}")
+
+    def _scan(self, query: np.ndarray, k: int):
+        scores = np.empty(self._high, dtype=np.float32)
+        for start in range(0, self._high, self._SCAN_BLOCK):
+            block = np.asarray(self._matrix[start:min(start + self._SCAN_BLOCK, self._high)], dtype=np.float32)
+            block_scores = block @ query
+            if self.dtype == np.int8:
+                # Cheaper to divide the scores than to normalise the block
+                block_scores /= np.maximum(np.sqrt(np.einsum("ij,ij->i", block, block)), 1e-12)
+            scores[start:start + len(block)] = block_scores
+        scores[~self._alive[:self._high]] = -np.inf
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return top, scores[top]
+
+    def query(self, embedding, k) -> list:
+        query = _unit_rows(embedding)[0]
+        with self._lock:
+            k = min(k, self.count())
+            if k <= 0:
+                return []
+            if hnswlib is not None and self._hnsw_state == "none" and self.count() >= self.hnsw_min_vectors:
+                self._start_hnsw_build()
+            if self._hnsw is not None:
+                self._hnsw.set_ef(max(64, 2 * k))
+                labels, distances = self._hnsw.knn_query(query, k=k)
+                rows, scores = labels[0], 1.0 - distances[0]
+            else:
+                rows, scores = self._scan(query, k)
+            found = self._fetch("row", [int(r) for r in rows])
+
+        results = []
+        for row, score in zip(rows, scores):
+            if int(row) in found:
+                results.append({**found[int(row)], "score": float(score)})
+        return results
+
+    def get_stats(self) -> dict:
+        with self._lock:
+            return {
+                "backend": self.name,
+                "vectors": self.count(),
+                "dim": self.dim,
+                "dtype": self.dtype.name,
+                "matrix_bytes": self._matrix.nbytes if self._matrix is not None else 0,
+                "hnsw": self._hnsw_state,
+            }
+
+
+def create_vector_store(backend: str = None) -> VectorStore:
+    """The configured backend, falling back to the flat index if Chroma fails"""
+    backend = (backend or config.VECTOR_STORE).lower()
+    if backend == "chroma":
+        try:
+            return ChromaVectorStore()
+        except Exception as e:
+            logger.error(f"[ERROR] ChromaDB initialization failed, using built-in vector index: {e}")
+    elif backend != "flat":
+        logger.warning(f"[WARNING] Unknown VECTOR_STORE '{backend}', using built-in vector index")
+    return FlatVectorStore()
+
+
+vector_store = create_vector_store()
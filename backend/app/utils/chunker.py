@@ -0,0 +1,119 @@
+from typing import Callable, Iterable, Iterator, Union
+import re
+import zlib
+
+# Paragraphs are runs of text separated by blank lines
+_PARAGRAPH_RE = re.compile(r"\S(?:[^\n]|\n(?![ \t]*\n))*")
+# Sentence ends: terminal punctuation (optionally closed by quotes/brackets) then whitespace
+_SENTENCE_RE = re.compile(r"(?<=[.!?])[\"')\]]*\s+")
+# Markdown headings and short ALL-CAPS title lines
+_HEADING_RE = re.compile(r"^(#{1,6}\s+\S|[A-Z][A-Z0-9 .:&/-]{2,79}$)")
+# Past min_tokens, a chunk also ends after any sentence whose hash is 0 mod this
+_CUT_EVERY = 4
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough word-piece count for when no tokenizer is available"""
+    return int(len(text.split()) * 1.3) + 1
+
+
+def _is_heading(line: str) -> bool:
+    return len(line) <= 80 and bool(_HEADING_RE.match(line))
+
+
+def _units(blocks: Iterable[str]):
+    """Yield (text, separator, starts_section) for every sentence, lazily."""
+    for block in blocks:
+        for match in _PARAGRAPH_RE.finditer(block):
+            paragraph = match.group().strip()
+            first_line, _, rest = paragraph.partition("\n")
+            if _is_heading(first_line.strip()):
+                # A heading line, possibly followed directly by its body text
+                yield first_line.strip(), "\n\n", True
+                paragraph = rest.strip()
+            separator = "\n\n"
+            for sentence in _SENTENCE_RE.split(paragraph):
+                sentence = " ".join(sentence.split())
+                if sentence:
+                    yield sentence, separator, False
+                    separator = " "
+
+
+def _split_long(text: str, max_tokens: int, count_tokens: Callable[[str], int]):
+    """Hard-split a single over-long sentence on word boundaries."""
+    words = text.split()
+    piece = []
+    for word in words:
+        piece.append(word)
+        if len(piece) > 1 and count_tokens(" ".join(piece)) > max_tokens:
+            piece.pop()
+            yield " ".join(piece)
+            piece = [word]
+    if piece:
+        yield " ".join(piece)
+
+
+def _tail(text: str, max_tokens: int, count_tokens: Callable[[str], int]) -> str:
+    """The longest run of trailing words of `text` within `max_tokens` tokens"""
+    words = text.split()
+    n = 0
+    while n < len(words) and count_tokens(" ".join(words[len(words) - n - 1:])) <= max_tokens:
+        n += 1
+    return " ".join(words[len(words) - n:])
+
+
+def _is_cut_point(sentence: str) -> bool:
+    return zlib.crc32(sentence.encode("utf-8")) % _CUT_EVERY == 0
+
+
+def iter_chunks(content: Union[str, Iterable[str]], max_tokens: int, overlap_tokens: int = 0,
+                count_tokens: Callable[[str], int] = estimate_tokens, min_tokens: int = None) -> Iterator[str]:
+    """
+    Split text into chunks of at most `max_tokens` tokens, as a generator.
+
+    `content` is a string or an iterable of text blocks (e.g. pages), which
+    are consumed lazily so large documents never have to be fully chunked in
+    memory. Chunks break on sentence and paragraph boundaries and a heading
+    always starts a new chunk. Consecutive chunks within a section share up
+    to `overlap_tokens` tokens: the next chunk starts with the trailing words
+    of the previous one, mid-sentence if need be.
+
+    Boundaries are content-defined rather than greedy: once a chunk holds
+    `min_tokens` (default half of `max_tokens`) it ends before the next
+    paragraph (every parser block starts one) or after a sentence picked by
+    its hash. An edit therefore only changes the chunks around it; the cuts
+    after it fall in the same places, so re-indexing keeps their ids.
+    """
+    blocks = [content] if isinstance(content, str) else content
+    min_tokens = max_tokens // 2 if min_tokens is None else min_tokens
+    current = []  # [(text, separator, tokens)]
+    size = 0
+    cut_after = False  # the last sentence is a content-defined cut point
+
+    def render(units):
+        return "".join(sep + text for text, sep, _ in units).strip()
+
+    for text, separator, starts_section in _units(blocks):
+        tokens = count_tokens(text)
+        pieces = [(text, tokens)]
+        if tokens > max_tokens:
+            pieces = [(p, count_tokens(p)) for p in _split_long(text, max_tokens, count_tokens)]
+
+        for piece, tokens in pieces:
+            early = size >= min_tokens and (cut_after or separator == "\n\n")
+            if current and (starts_section or early or size + tokens > max_tokens):
+                chunk = render(current)
+                yield chunk
+                current, size = [], 0
+                tail = _tail(chunk, overlap_tokens, count_tokens) if overlap_tokens and not starts_section else ""
+                if tail:
+                    tail_size = count_tokens(tail)
+                    if tail_size + tokens <= max_tokens:
+                        current, size = [(tail, "", tail_size)], tail_size
+            current.append((piece, separator, tokens))
+            size += tokens
+            cut_after = _is_cut_point(piece)
+            separator, starts_section = " ", False
+
+    if current:
+        yield render(current)
@@ -0,0 +1,143 @@
+import json
+import re
+from functools import lru_cache
+
+# Shared terminal rules (adapted from llama.cpp's json.gbnf). Whitespace is
+# capped at one character so a constrained generation cannot pad forever;
+# strings exclude raw control characters, which JSON does not allow.
+_PRIMITIVES = r'''
+ws ::= [ \t\n]?
+string ::= "\"" ( [^"\\\x7F\x00-\x1F] | "\\" (["\\/bfnrt] | "u" [0-9a-fA-F] [0-9a-fA-F] [0-9a-fA-F] [0-9a-fA-F]) )* "\""
+integer ::= "-"? ([0-9] | [1-9] [0-9]*)
+number ::= integer ("." [0-9]+)? ([eE] [-+]? [0-9]+)?
+boolean ::= "true" | "false"
+null ::= "null"
+'''
+
+_TYPE_RULES = {"string": "string", "integer": "integer", "number": "number", "boolean": "boolean", "null": "null"}
+
+
+def _literal(text: str) -> str:
+    """GBNF literal matching `text` exactly"""
+    return '"' + text.replace("\\", "\\\\").replace('"', '\\"') + '"'
+
+
+def schema_to_gbnf(schema: dict) -> str:
+    """
+    Convert a (small) JSON schema into a GBNF grammar for llama.cpp.
+
+    Supports object/array/string/integer/number/boolean/null, `enum` and
+    type lists. Object properties are emitted in schema order; properties not
+    listed in `required` are still emitted but may be `null`, which keeps the
+    grammar simple and the output easy to post-process.
+    """
+    rules = {}
+
+    def add(name: str, body: str) -> str:
+        name = re.sub(r"[^a-zA-Z0-9-]", "-", name)
+        base, n = name, 1
+        while name in rules and rules[name] != body:
+            n += 1
+            name = f"{base}{n}"
+        rules[name] = body
+        return name
+
+    def visit(node: dict, name: str) -> str:
+        if "enum" in node:
+            return "(" + " | ".join(_literal(json.dumps(v)) for v in node["enum"]) + ")"
+
+        kind = node.get("type")
+        if isinstance(kind, list):
+            return "(" + " | ".join(visit({**node, "type": k}, name) for k in kind) + ")"
+
+        if kind == "object":
+            properties = node.get("properties", {})
+            required = set(node.get("required", properties))
+            pairs = []
+            for key, sub in properties.items():
+                value = visit(sub, f"{name}-{key}")
+                if key not in required:
+                    value = f"({value} | null)"
+                pairs.append(f'{_literal(json.dumps(key))} ws ":" ws {value}')
+            if pairs:
+                body = '"{" ws ' + ' "," ws '.join(pairs) + ' ws "}"'
+            else:
+                body = '"{" ws "}"'
+            return add(name, body)
+
+        if kind == "array":
+            item = visit(node.get("items", {"type": "string"}), f"{name}-item")
+            return add(name, f'"[" ws ({item} (ws "," ws {item})*)? ws "]"')
+
+        if kind in _TYPE_RULES:
+            return _TYPE_RULES[kind]
+
+        raise ValueError(f"Unsupported schema node: {node}")
+
+    root = visit(schema, "root")
+    if root != "root":
+        rules["root"] = root
+
+    lines = [f"root ::= {rules.pop('root')}"]
+    lines += [f"{name} ::= {body}" for name, body in rules.items()]
+    return "\n".join(lines) + "\n" + _PRIMITIVES.strip() + "\n"
+
+
+@lru_cache(maxsize=32)
+def _grammar_for(schema_json: str) -> str:
+    return schema_to_gbnf(json.loads(schema_json))
+
+
+def json_grammar(schema: dict) -> str:
+    """Cached schema_to_gbnf for schemas that are reused on every request"""
+    return _grammar_for(json.dumps(schema))
+
+
+def _close_truncated(text: str):
+    """
+    `text` cut short inside a top-level array or object, closed after its
+    last complete element; None if it is not such a prefix.
+    """
+    closers, in_string, escaped = [], False, False
+    cut = None
+    for i, ch in enumerate(text):
+        if in_string:
+            if escaped:
+                escaped = False
+            elif ch == "\\":
+                escaped = True
+            elif ch == '"':
+                in_string = False
+        elif ch == '"':
+            in_string = True
+        elif ch in "{[":
+            closers.append("}" if ch == "{" else "]")
+        elif ch in "}]" and closers:
+            closers.pop()
+        elif ch == "," and len(closers) == 1:
+            cut = i
+    if not closers or cut is None:
+        return None
+    return text[:cut] + closers[0]
+
+
+def load_constrained(text: str):
+    """
+    json.loads for grammar-constrained output. A generation that hit
+    max_tokens is a valid prefix but not valid JSON: it is cut back to the
+    last complete top-level element (array item or object member) and
+    closed. Raises ValueError if nothing usable is left, e.g. for the
+    offline fallback text.
+    """
+    try:
+        return json.loads(text)
+    except ValueError:
+        repaired = _close_truncated(text.strip())
+        if repaired is None:
+            raise
+        return json.loads(repaired)
+
+
+def drop_nulls(data: dict) -> dict:
+    """Remove keys a constrained generation filled with null"""
+    return {k: v for k, v in (data or {}).items() if v is not None}
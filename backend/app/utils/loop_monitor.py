@@ -0,0 +1,71 @@
+"""
+Event-loop lag monitor.
+
+A background task sleeps for a fixed interval and measures how late it
+wakes up: any delay beyond the interval is time the loop spent running
+something else without yielding, i.e. blocking code on the event loop.
+Lag percentiles over the recent window and a count of stalls above
+LOOP_LAG_WARN_MS are reported by /api/health; each stall is logged.
+
+With LOOP_LAG_DEBUG=true asyncio's debug mode is switched on as well, so
+every callback slower than the threshold is logged with the task that ran
+it, which points at the culprit.
+"""
+from collections import deque
+import asyncio
+import logging
+import time
+
+from ..config import config
+
+logger = logging.getLogger(__name__)
+
+
+class LoopLagMonitor:
+    def __init__(self, interval_ms: float = None, warn_ms: float = None, window: int = 1200):
+        self.interval_s = (interval_ms or config.LOOP_LAG_INTERVAL_MS) / 1000
+        self.warn_ms = warn_ms or config.LOOP_LAG_WARN_MS
+        self._samples = deque(maxlen=window)
+        self._stalls = 0
+        self._max_ms = 0.0
+        self._task = None
+
+    def start(self):
+        """Start measuring on the running loop (call from a coroutine)"""
+        if self._task is not None:
+            return
+        loop = asyncio.get_running_loop()
+        if config.LOOP_LAG_DEBUG:
+            loop.set_debug(True)
+            loop.slow_callback_duration = self.warn_ms / 1000
+        self._task = loop.create_task(self._run())
+
+    async def _run(self):
+        while True:
+            started = time.perf_counter()
+            await asyncio.sleep(self.interval_s)
+            lag_ms = max(0.0, (time.perf_counter() - started - self.interval_s) * 1000)
+            self._samples.append(lag_ms)
+            self._max_ms = max(self._max_ms, lag_ms)
+            if lag_ms >= self.warn_ms:
+                self._stalls += 1
+                logger.warning(f"[WARNING] Event loop blocked for {lag_ms:.0f} ms")
+
+    def get_stats(self) -> dict:
+        samples = sorted(self._samples)
+
+        def percentile(p: float) -> float:
+            return round(samples[min(len(samples) - 1, int(p * len(samples)))], 2) if samples else 0.0
+
+        return {
+            "lag_p50_ms": percentile(0.50),
+            "lag_p99_ms": percentile(0.99),
+            "lag_max_window_ms": round(samples[-1], 2) if samples else 0.0,
+            "lag_max_ms": round(self._max_ms, 2),
+            "stalls": self._stalls,
+            "stall_threshold_ms": self.warn_ms,
+            "window_s": round(len(samples) * self.interval_s, 1),
+        }
+
+
+loop_monitor = LoopLagMonitor()
@@ -1,92 +1,258 @@
-from typing import BinaryIO
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from pathlib import Path
+from typing import Iterable, Iterator, Union
+from xml.etree.ElementTree import iterparse
 import logging
+import multiprocessing
+import threading
+import zipfile
+
+from ..config import config
 
 logger = logging.getLogger(__name__)
 
-def parse_document(file: BinaryIO, content_type: str) -> str:
-    """Parse document and extract text with proper error handling"""
+PDF_TYPES = {'application/pdf'}
+DOCX_TYPES = {
+    'application/vnd.openxmlformats-officedocument.wordprocessingml.document',
+    'application/msword'
+}
+TEXT_BLOCK_CHARS = 1 << 20  # characters read per block from text files and emitted per DOCX block
+
+_W = '{http://schemas.openxmlformats.org/wordprocessingml/2006/main}'
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+class ParseError(Exception):
+    """The file cannot be parsed (corrupt, unsupported); retrying won't help."""
+
+
+def _get_pool() -> ProcessPoolExecutor:
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            # spawn: never fork a process that may already hold torch/llama state
+            _pool = ProcessPoolExecutor(
+                max_workers=config.PARSE_WORKERS,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+        return _pool
+
+
+def _discard_pool(pool: ProcessPoolExecutor):
+    """A worker died (e.g. crashed on a malformed file); start fresh next time."""
+    global _pool
+    with _pool_lock:
+        if _pool is pool:
+            _pool = None
+    pool.shutdown(wait=False, cancel_futures=True)
+
+
+def _paragraph_blocks(pieces: Iterable[str]) -> Iterator[str]:
+    """
+    Re-cut arbitrary text pieces at paragraph (or line, or word) breaks so no
+    paragraph is split across two blocks handed to the chunker.
+    """
+    carry = ""
+    for piece in pieces:
+        text = carry + piece
+        cut = text.rfind("\n\n")
+        if cut < 0:
+            cut = text.rfind("\n")
+        if cut < 0:
+            cut = max(text.rfind(" "), 0)
+        carry = text[cut:]
+        if cut:
+            yield text[:cut]
+    if carry.strip():
+        yield carry
+
+
+# -- PDF: pages extracted in parallel by the pool, yielded in order --
+
+def _pdf_page_count(path: str) -> int:
+    import PyPDF2
+
+    return len(PyPDF2.PdfReader(path).pages)
+
+
+def _extract_pdf_pages(path: str, start: int, end: int) -> list:
+    import PyPDF2
+
+    reader = PyPDF2.PdfReader(path)
+    pages = []
+    for page_num in range(start, end):
+        try:
+            text = reader.pages[page_num].extract_text() or ""
+        except Exception as e:
+            logger.warning(f"Error extracting page {page_num}: {e}")
+            text = ""
+        pages.append(f"\n--- Page {page_num + 1} ---\n{text}\n\n")
+    return pages
+
+
+def _iter_pdf(path: str) -> Iterator[str]:
+    try:
+        import PyPDF2  # noqa: F401 (fail fast with a clear message)
+    except ImportError:
+        raise ParseError("PDF parsing requires PyPDF2. Install with: pip install PyPDF2")
+
+    pool = _get_pool()
     try:
-        if content_type == 'text/plain' or content_type == 'text/markdown':
-            try:
-                return file.read().decode('utf-8')
-            except UnicodeDecodeError:
-                return file.read().decode('latin-1')
-        
-        elif content_type == 'application/pdf':
-            try:
-                import PyPDF2
-                file.seek(0)  # Reset file pointer
-                pdf_reader = PyPDF2.PdfReader(file)
-                text = ""
-                
-                for page_num, page in enumerate(pdf_reader.pages):
-                    try:
-                        text += f"\n--- Page {page_num + 1} ---\n"
-                        text += page.extract_text()
-                    except Exception as e:
-                        logger.warning(f"Error extracting page {page_num}: {e}")
-                        continue
-                
-                return text if text.strip() else "Could not extract text from PDF"
-            
-            except ImportError:
-                logger.error("PyPDF2 not installed")
-                return "ERROR: PDF parsing requires PyPDF2. Install with: pip install PyPDF2"
-            except Exception as e:
-                logger.exception(f"PDF parsing error: {e}")
-                return f"Error parsing PDF: {str(e)}"
-        
-        elif content_type in [
-            'application/vnd.openxmlformats-officedocument.wordprocessingml.document',
-            'application/msword'
-        ]:
-            try:
-                from docx import Document
-                file.seek(0)
-                doc = Document(file)
-                text = "\n".join([paragraph.text for paragraph in doc.paragraphs])
-                
-                # Extract tables
-                for table in doc.tables:
-                    for row in table.rows:
-                        text += "\n" + " | ".join([cell.text for cell in row.cells])
-                
-                return text if text.strip() else "No content found in document"
-            
-            except ImportError:
-                logger.error("python-docx not installed")
-                return "ERROR: DOCX parsing requires python-docx. Install with: pip install python-docx"
-            except Exception as e:
-                logger.exception(f"DOCX parsing error: {e}")
-                return f"Error parsing DOCX: {str(e)}"
-        
-        else:
-            logger.warning(f"Unsupported content type: {content_type}")
-            try:
-                return file.read().decode('utf-8')
-            except UnicodeDecodeError:
-                return file.read().decode('latin-1')
-    
+        page_count = pool.submit(_pdf_page_count, path).result()
+    except BrokenProcessPool:
+        _discard_pool(pool)
+        raise
     except Exception as e:
-        logger.exception(f"Document parsing error: {e}")
-        return f"Error parsing document: {str(e)}"
+        raise ParseError(f"Error parsing PDF: {e}")
+
+    # Keep a bounded window of page batches in flight so a slow consumer
+    # (embedding) doesn't make the whole document pile up in memory
+    step = config.PARSE_PDF_PAGES_PER_TASK
+    window = 2 * config.PARSE_WORKERS
+    pending = deque()
+    try:
+        for start in range(0, page_count, step):
+            pending.append(pool.submit(_extract_pdf_pages, path, start, min(start + step, page_count)))
+            if len(pending) >= window:
+                yield from pending.popleft().result()
+        while pending:
+            yield from pending.popleft().result()
+    except BrokenProcessPool:
+        _discard_pool(pool)
+        raise
+    finally:
+        for future in pending:
+            future.cancel()
+
+
+# -- DOCX: streamed out of word/document.xml without building the DOM --
+
+def _extract_docx_blocks(path: str) -> list:
+    blocks, lines, size = [], [], 0
+    runs, cell, row = [], [], None
+    table_depth = 0
+
+    def emit(line: str):
+        nonlocal size
+        if line.strip():
+            lines.append(line)
+            size += len(line)
+        if size >= TEXT_BLOCK_CHARS:
+            blocks.append("\n\n".join(lines) + "\n\n")
+            lines.clear()
+            size = 0
+
+    with zipfile.ZipFile(path) as archive, archive.open("word/document.xml") as xml:
+        for event, elem in iterparse(xml, events=("start", "end")):
+            tag = elem.tag
+            if event == "start":
+                if tag == _W + "tbl":
+                    table_depth += 1
+                elif tag == _W + "tr":
+                    row = []
+                continue
+
+            if tag == _W + "t":
+                runs.append(elem.text or "")
+            elif tag == _W + "tab":
+                runs.append("\t")
+            elif tag in (_W + "br", _W + "cr"):
+                runs.append("\n")
+            elif tag == _W + "p":
+                text = "".join(runs)
+                runs = []
+                if table_depth:
+                    cell.append(text)
+                else:
+                    emit(text)
+            elif tag == _W + "tc":
+                if row is not None:
+                    row.append(" ".join(cell).strip())
+                cell = []
+            elif tag == _W + "tr":
+                emit(" | ".join(row or []))
+                row = None
+            elif tag == _W + "tbl":
+                table_depth -= 1
+            elem.clear()
+
+    if lines:
+        blocks.append("\n\n".join(lines))
+    return blocks
+
+
+def _iter_docx(path: str) -> Iterator[str]:
+    pool = _get_pool()
+    try:
+        blocks = pool.submit(_extract_docx_blocks, path).result()
+    except BrokenProcessPool:
+        _discard_pool(pool)
+        raise
+    except (zipfile.BadZipFile, KeyError) as e:
+        raise ParseError(f"Error parsing DOCX (only .docx files are supported): {e}")
+    except Exception as e:
+        raise ParseError(f"Error parsing DOCX: {e}")
+    yield from blocks
+
+
+# -- Plain text --
+
+def _iter_text(path: str) -> Iterator[str]:
+    encoding = 'utf-8'
+    try:
+        with open(path, encoding='utf-8') as f:
+            while f.read(TEXT_BLOCK_CHARS):
+                pass
+    except UnicodeDecodeError:
+        encoding = 'latin-1'
+
+    with open(path, encoding=encoding) as f:
+        yield from _paragraph_blocks(iter(lambda: f.read(TEXT_BLOCK_CHARS), ""))
+
+
+def iter_document(path: Union[str, Path], content_type: str) -> Iterator[str]:
+    """
+    Stream the text of an uploaded file as blocks (PDF pages, groups of DOCX
+    paragraphs, runs of text), ready for utils.chunker.iter_chunks.
+
+    PDF pages and DOCX XML are parsed in a spawn-based process pool, so
+    parsing neither holds the GIL in the API process nor needs the whole
+    document in memory; PDF page batches are extracted in parallel and
+    yielded in order. Raises ParseError for files that cannot be parsed
+    (BrokenProcessPool, if a worker dies, is worth a retry).
+    """
+    path = str(path)
+    if content_type in PDF_TYPES:
+        blocks = _iter_pdf(path)
+    elif content_type in DOCX_TYPES:
+        blocks = _iter_docx(path)
+    else:
+        if content_type not in ('text/plain', 'text/markdown'):
+            logger.warning(f"Unsupported content type: {content_type}, reading as text")
+        blocks = _iter_text(path)
+    yield from blocks
+
 
 def sanitize_filename(filename: str, max_length: int = 255) -> str:
     """Sanitize filename to prevent directory traversal attacks"""
     import os
     import re
-    
+
     # Remove path separators
     filename = os.path.basename(filename)
-    
+
     # Remove dangerous characters
     filename = re.sub(r'[^\w\s.-]', '', filename)
-    
+
     # Limit length
     filename = filename[:max_length]
-    
+
     # Ensure it's not empty
     if not filename:
         filename = "document"
-    
-    return filename
\ No newline at end of file
+
+    return filename
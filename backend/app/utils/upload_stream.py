@@ -0,0 +1,184 @@
+"""
+Streaming multipart uploads.
+
+The request body is fed chunk by chunk through python-multipart and the
+file part is written straight to a spool file under UPLOADS_DIR, hashed
+and counted on the way. Nothing is held in memory or copied through the
+system temp dir, and an upload over the size limit is cut off as soon as
+it crosses it (or before reading anything when Content-Length says so).
+Hashing and file writes happen in a worker thread, in batches of up to
+_FLUSH_BYTES, never on the event loop.
+"""
+from pathlib import Path
+import asyncio
+import hashlib
+import time
+import uuid
+
+from multipart.multipart import MultipartParser, parse_options_header
+from starlette.requests import Request
+
+from ..config import config
+
+# Allowance for multipart boundaries and part headers around the file
+_FORM_OVERHEAD = 64 * 1024
+# File data buffered before it is hashed and written out in a worker thread
+_FLUSH_BYTES = 1024 * 1024
+
+
+class UploadError(Exception):
+    def __init__(self, message: str, code: str, details: dict = None):
+        super().__init__(message)
+        self.message = message
+        self.code = code
+        self.details = details or {}
+
+
+class SpooledUpload:
+    """A received file: where it was spooled, its size and sha256"""
+
+    def __init__(self, path: Path, filename: str, content_type: str, size: int, sha256: str):
+        self.path = path
+        self.filename = filename
+        self.content_type = content_type
+        self.size = size
+        self.sha256 = sha256
+
+    def discard(self):
+        self.path.unlink(missing_ok=True)
+
+
+def spool_dir() -> Path:
+    path = config.UPLOADS_DIR / "incoming"
+    path.mkdir(parents=True, exist_ok=True)
+    return path
+
+
+def clear_stale_spool_files(max_age_s: float = 3600):
+    """Remove spool files left behind by uploads interrupted by a crash"""
+    cutoff = time.time() - max_age_s
+    for path in spool_dir().glob("*.part"):
+        try:
+            if path.stat().st_mtime < cutoff:
+                path.unlink()
+        except OSError:
+            pass
+
+
+def _discard(out, path: Path):
+    out.close()
+    path.unlink(missing_ok=True)
+
+
+async def receive_upload(request: Request, field: str = "file", max_bytes: int = None) -> SpooledUpload:
+    """
+    Stream the `field` file part of a multipart request to disk.
+    Raises UploadError (FILE_TOO_LARGE, INVALID_UPLOAD, NO_FILE).
+    """
+    max_bytes = max_bytes or config.MAX_UPLOAD_SIZE
+    too_large = UploadError(
+        f"File exceeds the {max_bytes // (1024 * 1024)}MB upload limit",
+        "FILE_TOO_LARGE",
+        {"max_bytes": max_bytes},
+    )
+
+    declared = request.headers.get("content-length")
+    if declared and declared.isdigit() and int(declared) > max_bytes + _FORM_OVERHEAD:
+        raise too_large
+
+    content_type, params = parse_options_header(request.headers.get("content-type", ""))
+    boundary = params.get(b"boundary")
+    if content_type != b"multipart/form-data" or not boundary:
+        raise UploadError("Expected a multipart/form-data upload", "INVALID_UPLOAD")
+
+    path = await asyncio.to_thread(lambda: spool_dir() / f"{uuid.uuid4().hex}.part")
+    state = {"headers": {}, "field": b"", "value": b"", "file": None, "done": False}
+    received = {"filename": None, "content_type": None, "size": 0}
+    digest = hashlib.sha256()
+    pending = []
+    out = await asyncio.to_thread(open, path, "wb")
+
+    def write_pending(chunks: list):
+        for chunk in chunks:
+            digest.update(chunk)
+            out.write(chunk)
+
+    async def flush():
+        chunks = pending[:]
+        pending.clear()
+        await asyncio.to_thread(write_pending, chunks)
+
+    def on_part_begin():
+        state["headers"] = {}
+
+    def on_header_field(data, start, end):
+        state["field"] += data[start:end]
+
+    def on_header_value(data, start, end):
+        state["value"] += data[start:end]
+
+    def on_header_end():
+        state["headers"][state["field"].lower()] = state["value"]
+        state["field"], state["value"] = b"", b""
+
+    def on_headers_finished():
+        _, options = parse_options_header(state["headers"].get(b"content-disposition", b""))
+        is_target = (
+            options.get(b"name", b"").decode("latin-1") == field
+            and b"filename" in options
+            and received["filename"] is None
+        )
+        state["file"] = is_target
+        if is_target:
+            received["filename"] = options[b"filename"].decode("utf-8", "replace")
+            received["content_type"] = state["headers"].get(b"content-type", b"").decode("latin-1") or None
+
+    def on_part_data(data, start, end):
+        if not state["file"]:
+            return
+        chunk = data[start:end]
+        received["size"] += len(chunk)
+        if received["size"] > max_bytes:
+            raise too_large
+        pending.append(chunk)
+
+    def on_part_end():
+        state["file"] = False
+
+    def on_end():
+        state["done"] = True
+
+    parser = MultipartParser(boundary, {
+        "on_part_begin": on_part_begin,
+        "on_header_field": on_header_field,
+        "on_header_value": on_header_value,
+        "on_header_end": on_header_end,
+        "on_headers_finished": on_headers_finished,
+        "on_part_data": on_part_data,
+        "on_part_end": on_part_end,
+        "on_end": on_end,
+    })
+    buffered = 0
+    try:
+        async for chunk in request.stream():
+            if chunk:
+                parser.write(chunk)
+                buffered += len(chunk)
+                if buffered >= _FLUSH_BYTES:
+                    await flush()
+                    buffered = 0
+        parser.finalize()
+        await flush()
+        await asyncio.to_thread(out.close)
+        if not state["done"]:
+            raise UploadError("Upload was truncated", "INVALID_UPLOAD")
+        if received["filename"] is None:
+            raise UploadError(f"No '{field}' file in the upload", "NO_FILE")
+    except UploadError:
+        await asyncio.to_thread(_discard, out, path)
+        raise
+    except Exception as e:
+        await asyncio.to_thread(_discard, out, path)
+        raise UploadError(f"Malformed upload: {e}", "INVALID_UPLOAD")
+
+    return SpooledUpload(path, received["filename"], received["content_type"], received["size"], digest.hexdigest())
@@ -0,0 +1,161 @@
+"""
+Single-writer queue for small database writes.
+
+SQLite allows one writer at a time; request threads, the reminder
+scheduler and ingestion workers committing on their own contend for the
+lock ("database is locked") and each pays a commit of its own. Writes
+submitted here are run by one thread with its own session and grouped
+into batched transactions: while one batch commits, new writes queue up
+and all go into the next one (group commit), so there is no added
+latency when idle and one commit per batch under load. On PostgreSQL,
+which has no single-writer lock, it still saves a commit per write.
+
+Each write runs in a SAVEPOINT, so a failing write is rolled back on its
+own without sinking the rest of its batch. submit() returns a Future that
+resolves once the batch has committed; write functions should return
+plain values (ids, counts), not ORM objects, which belong to the writer's
+session. If a whole batch fails (commit error, lost connection) its writes
+fail, the session is thrown away and the next batch opens a fresh one; the
+writer thread is restarted by the next submit() should it ever die.
+"""
+from concurrent.futures import Future
+from typing import Callable
+import logging
+import queue
+import threading
+import time
+
+from sqlalchemy import text
+from sqlalchemy.engine import Connection
+
+from .config import config
+from .database import SessionLocal, engine as default_engine
+
+logger = logging.getLogger(__name__)
+
+
+class WriteQueue:
+    def __init__(self, batch_max: int = None, engine=None):
+        self.batch_max = batch_max or config.SQLITE_WRITE_BATCH_MAX
+        self.engine = engine or default_engine
+        self._queue = queue.Queue()
+        self._thread = None
+        self._start_lock = threading.Lock()
+        self._stats = {"writes": 0, "batches": 0, "failed": 0, "commit_ms_total": 0.0}
+
+    def _ensure_started(self):
+        with self._start_lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._worker, name="sqlite-writer", daemon=True)
+                self._thread.start()
+
+    def submit(self, write: Callable) -> Future:
+        """Queue `write(session)`; the Future resolves to its return value after commit"""
+        self._ensure_started()
+        future = Future()
+        self._queue.put((write, future))
+        return future
+
+    def add(self, *objects) -> Future:
+        """Queue new ORM objects for insertion"""
+        return self.submit(lambda session: session.add_all(objects))
+
+    def flush(self, timeout: float = None):
+        """Block until everything queued so far has been committed"""
+        self.submit(lambda session: None).result(timeout)
+
+    def _next_batch(self) -> list:
+        batch = [self._queue.get()]
+        while len(batch) < self.batch_max:
+            try:
+                batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _open_session(self):
+        if self.engine.dialect.name != "sqlite":
+            return SessionLocal(bind=self.engine, expire_on_commit=False)
+        connection = self.engine.connect()
+        # pysqlite begins transactions lazily, which would turn the first
+        # SAVEPOINT into the transaction itself; BEGIN IMMEDIATE explicitly
+        # instead, which also takes the write lock up front (busy_timeout
+        # applies, no deadlock upgrading a read lock)
+        connection.connection.driver_connection.isolation_level = None
+        return SessionLocal(bind=connection, expire_on_commit=False)
+
+    @staticmethod
+    def _discard_session(session):
+        """Best-effort cleanup of a session whose batch failed"""
+        if session is None:
+            return
+        bind = session.bind
+        for close in (session.rollback, session.close, bind.close if isinstance(bind, Connection) else None):
+            if close is None:
+                continue
+            try:
+                close()
+            except Exception as e:
+                logger.warning(f"[WARNING] Discarding writer session: {e}")
+
+    def _run_batch(self, session, batch: list, results: list):
+        """Run `batch` in one transaction, appending (future, result, error) to `results`"""
+        if self.engine.dialect.name == "sqlite":
+            session.execute(text("BEGIN IMMEDIATE"))
+        for write, future in batch:
+            if not future.set_running_or_notify_cancel():
+                continue
+            savepoint = session.begin_nested()
+            try:
+                result = write(session)
+                savepoint.commit()
+                results.append((future, result, None))
+            except Exception as e:
+                savepoint.rollback()
+                results.append((future, None, e))
+        started = time.perf_counter()
+        session.commit()
+        self._stats["commit_ms_total"] += (time.perf_counter() - started) * 1000
+        session.expunge_all()
+
+    def _worker(self):
+        session = None
+        while True:
+            batch = self._next_batch()
+            results = []
+            try:
+                if session is None:
+                    session = self._open_session()
+                self._run_batch(session, batch, results)
+            except Exception as e:
+                logger.error(f"Write batch of {len(batch)} failed: {e}", exc_info=True)
+                self._discard_session(session)
+                session = None
+                errors = {id(future): error for future, _, error in results}
+                results = [
+                    (future, None, errors.get(id(future)) or e)
+                    for _, future in batch if not future.cancelled()
+                ]
+
+            self._stats["batches"] += 1
+            for future, result, error in results:
+                self._stats["writes"] += 1
+                if error is None:
+                    future.set_result(result)
+                else:
+                    self._stats["failed"] += 1
+                    future.set_exception(error)
+
+    def get_stats(self) -> dict:
+        batches = self._stats["batches"]
+        return {
+            "queued": self._queue.qsize(),
+            "writes": self._stats["writes"],
+            "batches": batches,
+            "failed": self._stats["failed"],
+            "avg_batch_size": round(self._stats["writes"] / batches, 2) if batches else 0,
+            "avg_commit_ms": round(self._stats["commit_ms_total"] / batches, 2) if batches else 0,
+        }
+
+
+write_queue = WriteQueue()
@@ -0,0 +1,62 @@
+"""
+Embedding throughput benchmark.
+
+Compares one encode call per chunk (the old ingestion path) with
+LLM.embed_batch, and measures the micro-batching embedder under concurrent
+single-text requests. Run from the repository root:
+
+    python backend/benchmark_embeddings.py --chunks 2000 --concurrency 16
+"""
+import argparse
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).parent.parent))
+
+from backend.app.config import config
+from backend.app.models.llm_models import llm
+from backend.app.services.embedding_service import MicroBatchEmbedder
+
+
+def synthetic_chunks(n: int):
+    sentence = "AURA keeps track of tasks, schedules and notes for the user. "
+    return [f"Chunk {i}: " + sentence * 8 for i in range(n)]
+
+
+def timed(label: str, n: int, fn):
+    started = time.perf_counter()
+    fn()
+    elapsed = time.perf_counter() - started
+    print(f"{label:<32} {n:>6} chunks  {elapsed:7.2f}s  {n / elapsed:8.1f} chunks/s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--chunks", type=int, default=1000)
+    parser.add_argument("--batch-size", type=int, default=config.EMBED_BATCH_SIZE)
+    parser.add_argument("--concurrency", type=int, default=16)
+    args = parser.parse_args()
+
+    llm.wait_ready()
+    if not llm.embedding_model:
+        raise SystemExit("Embedding model not available")
+
+    chunks = synthetic_chunks(args.chunks)
+    llm.embed_batch(chunks[:8])  # warm up
+
+    timed("one encode per chunk", len(chunks), lambda: [llm.embed(c) for c in chunks])
+    timed(f"embed_batch (batch={args.batch_size})", len(chunks),
+          lambda: llm.embed_batch(chunks, batch_size=args.batch_size))
+
+    batcher = MicroBatchEmbedder()
+    with ThreadPoolExecutor(args.concurrency) as pool:
+        timed(f"micro-batched x{args.concurrency} threads", len(chunks),
+              lambda: list(pool.map(batcher.embed, chunks)))
+    stats = batcher.get_stats()
+    print(f"micro-batcher: {stats['batches']} batches, avg {stats['avg_batch']} texts/batch")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,122 @@
+"""
+Vector store benchmark: query latency, recall and memory per backend.
+
+Indexes the same synthetic unit vectors into each backend in a temporary
+directory, then times single-query searches. Every backend runs in its own
+process so the reported RSS is not polluted by the others. Recall@k is
+measured against exact float32 search. Run from the repository root:
+
+    python backend/benchmark_vector_store.py --vectors 20000 --queries 200
+"""
+import argparse
+import json
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+
+sys.path.append(str(Path(__file__).parent.parent))
+
+BACKENDS = ["flat-float16", "flat-int8", "flat-hnsw", "chroma"]
+
+
+def rss_mb() -> float:
+    try:
+        import psutil
+
+        return psutil.Process().memory_info().rss / 2**20
+    except ImportError:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    return float("nan")
+
+
+def make_store(backend: str, path: Path):
+    from backend.app.services.vector_store import ChromaVectorStore, FlatVectorStore
+
+    if backend == "chroma":
+        return ChromaVectorStore(path=path)
+    if backend == "flat-hnsw":
+        return FlatVectorStore(path=path, dtype="float16", hnsw_min_vectors=0)
+    return FlatVectorStore(path=path, dtype=backend.split("-")[1], hnsw_min_vectors=sys.maxsize)
+
+
+def run_backend(backend: str, n: int, dim: int, n_queries: int, k: int) -> dict:
+    rng = np.random.default_rng(0)
+    # Clustered like real embeddings (passages share topics), not uniform on the sphere
+    centers = rng.standard_normal((max(1, n // 100), dim), dtype=np.float32)
+    vectors = centers[rng.integers(0, len(centers), n)] + 0.7 * rng.standard_normal((n, dim), dtype=np.float32)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    # Queries near stored vectors, like a question close to one passage
+    noise = rng.standard_normal((n_queries, dim), dtype=np.float32) * (0.5 / np.sqrt(dim))
+    queries = vectors[rng.choice(n, n_queries)] + noise
+    exact = np.argsort(-(queries @ vectors.T), axis=1)[:, :k]
+
+    with tempfile.TemporaryDirectory() as tmp:
+        base_rss = rss_mb()
+        store = make_store(backend, Path(tmp))
+        started = time.perf_counter()
+        for start in range(0, n, 1000):
+            ids = [str(i) for i in range(start, min(start + 1000, n))]
+            store.upsert(ids, vectors[start:start + 1000], [f"chunk {i}" for i in ids],
+                         [{"filename": "bench.txt"} for _ in ids])
+        store.query(queries[0], k)  # warm up; starts the HNSW build if enabled
+        while store.get_stats().get("hnsw") == "building":
+            time.sleep(0.05)
+        build_s = time.perf_counter() - started
+
+        latencies, hits = [], 0
+        for query, truth in zip(queries, exact):
+            started = time.perf_counter()
+            results = store.query(query, k)
+            latencies.append((time.perf_counter() - started) * 1000)
+            hits += len({int(r["id"]) for r in results} & set(truth.tolist()))
+        rss = rss_mb() - base_rss
+
+    return {
+        "backend": backend,
+        "build_s": round(build_s, 2),
+        "p50_ms": round(float(np.percentile(latencies, 50)), 2),
+        "p95_ms": round(float(np.percentile(latencies, 95)), 2),
+        f"recall@{k}": round(hits / (n_queries * k), 3),
+        "rss_mb": round(rss, 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--vectors", type=int, default=20000)
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=20)
+    parser.add_argument("--backends", default=",".join(BACKENDS))
+    parser.add_argument("--worker", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        print(json.dumps(run_backend(args.worker, args.vectors, args.dim, args.queries, args.k)))
+        return
+
+    print(f"{args.vectors} vectors x {args.dim} dims, {args.queries} queries, k={args.k}")
+    print(f"{'backend':<14} {'build s':>8} {'p50 ms':>8} {'p95 ms':>8} {'recall':>7} {'RSS MB':>8}")
+    for backend in args.backends.split(","):
+        proc = subprocess.run(
+            [sys.executable, __file__, "--worker", backend, "--vectors", str(args.vectors),
+             "--dim", str(args.dim), "--queries", str(args.queries), "--k", str(args.k)],
+            capture_output=True, text=True,
+        )
+        if proc.returncode != 0:
+            print(f"{backend:<14} failed: {proc.stderr.strip().splitlines()[-1] if proc.stderr.strip() else '?'}")
+            continue
+        row = json.loads(proc.stdout.strip().splitlines()[-1])
+        print(f"{backend:<14} {row['build_s']:>8} {row['p50_ms']:>8} {row['p95_ms']:>8} "
+              f"{row[f'recall@{args.k}']:>7} {row['rss_mb']:>8}")
+
+
+if __name__ == "__main__":
+    main()
@@ -14,6 +14,11 @@ MODELS = {
         "name": "all-MiniLM-L6-v2",
         "model_id": "sentence-transformers/all-MiniLM-L6-v2",
         "size": "80 MB"
+    },
+    "reranker": {
+        "name": "ms-marco-MiniLM-L-6-v2",
+        "model_id": "cross-encoder/ms-marco-MiniLM-L-6-v2",
+        "size": "90 MB"
     }
 }
 
@@ -67,10 +72,14 @@ def download_models():
     emb_config = MODELS["embedding"]
     print(f"\n📦 Embedding Model: {emb_config['name']} ({emb_config['size']})")
     print(f"   Will be auto-downloaded on first run by sentence-transformers")
+
+    rerank_config = MODELS["reranker"]
+    print(f"\n📦 Reranker Model: {rerank_config['name']} ({rerank_config['size']})")
+    print(f"   Will be auto-downloaded on first knowledge query by sentence-transformers")
     
     print("\n" + "=" * 50)
     print("🎉 Model setup complete!")
-    print(f"\n📊 Total size: ~{float(llm_config['size'].split()[0]) + 0.08:.1f} GB")
+    print(f"\n📊 Total size: ~{float(llm_config['size'].split()[0]) + 0.17:.1f} GB")
     print("\n💡 Phi-3 is MUCH smarter than TinyLlama!")
     print("   - Better reasoning")
     print("   - More accurate responses")
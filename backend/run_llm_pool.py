@@ -0,0 +1,14 @@
+import os
+import sys
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).parent.parent))
+
+# Tells the app config this process tree serves the model rather than the API
+os.environ["AURA_LLM_POOL_WORKER"] = "1"
+
+if __name__ == "__main__":
+    from backend.app.models.llm_pool import run_pool
+
+    print("🚀 Starting AURA LLM worker pool...")
+    run_pool()
@@ -21,12 +21,13 @@ async function performGlobalSearch(query) {
 
         if (data.results && data.results.length > 0) {
             resultsContainer.innerHTML = data.results.map(item => `
-                <div class="search-result-item" onclick="handleResultClick('${item.type}', '${item.id}')">
+                <div class="search-result-item" onclick="handleResultClick('${escapeHtml(item.type)}', '${escapeHtml(String(item.id))}')">
                     <div class="result-icon">${getResultIcon(item.type)}</div>
                     <div class="result-content">
-                        <div class="result-title">${item.title}</div>
+                        <div class="result-title">${escapeHtml(item.title)}</div>
+                        <!-- snippet is HTML from the server: escaped text plus <mark> tags -->
                         <div class="result-snippet">${item.snippet}</div>
-                        <div class="result-meta">${item.type} • ${item.date}</div>
+                        <div class="result-meta">${escapeHtml(item.type)} • ${escapeHtml(item.date)}</div>
                     </div>
                 </div>
             `).join('');
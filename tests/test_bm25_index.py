@@ -0,0 +1,66 @@
+"""
+Lexical index (services/bm25_index.py): tokenization and BM25 scoring.
+"""
+import sqlite3
+
+import pytest
+
+from app.services.bm25_index import BM25Index, tokenize
+
+
+@pytest.fixture
+def index(tmp_path):
+    return BM25Index(tmp_path / "bm25.db")
+
+
+def test_tokenize_keeps_joined_words_and_their_parts():
+    assert tokenize("The CS-101 exam hit err_timeout in v2.1") == [
+        "cs-101", "cs", "101", "exam", "hit", "err_timeout", "err", "timeout", "v2.1", "v2", "1",
+    ]
+
+
+def test_tokenize_handles_non_ascii_words():
+    assert tokenize("Café Müller: Straße, naïve, 東京 ε-δ") == [
+        "café", "müller", "straße", "naïve", "東京", "ε-δ", "ε", "δ",
+    ]
+
+
+def test_rare_terms_and_short_chunks_score_higher(index):
+    index.add(
+        ["a", "b", "c", "d"],
+        [
+            "budget review for the roadmap",
+            "budget review budget review for the roadmap and the quarterly budget planning notes",
+            "invoice INV-2024-17 is overdue",
+            "roadmap sprint planning",
+        ],
+        "notes.txt",
+    )
+    # "inv-2024-17" appears once in the corpus, "roadmap" three times
+    results = index.search("roadmap INV-2024-17", k=4)
+    assert results[0][0] == "c"
+    assert results[0][1] > results[1][1] > 0
+    # Same term frequency for "roadmap": the shorter chunk wins
+    ranked = [chunk_id for chunk_id, _ in index.search("roadmap", k=4)]
+    assert ranked.index("a") < ranked.index("b")
+    assert ranked.index("d") < ranked.index("b")
+
+
+def test_deleted_chunks_are_not_found(index):
+    index.add(["a", "b"], ["café menu", "café opening hours"], "a.txt")
+    index.add(["c"], ["café prices"], "b.txt")
+    index.delete(["a"])
+    assert {chunk_id for chunk_id, _ in index.search("café")} == {"b", "c"}
+    index.delete_document("b.txt")
+    assert [chunk_id for chunk_id, _ in index.search("café")] == ["b"]
+    assert index.count() == 1
+    assert index.search("the") == []
+
+
+def test_index_from_an_older_tokenizer_is_emptied(tmp_path):
+    path = tmp_path / "bm25.db"
+    BM25Index(path).add(["a"], ["café"], "a.txt")
+    with sqlite3.connect(str(path)) as conn:
+        conn.execute("UPDATE meta SET value = '1' WHERE key = 'tokenizer'")
+    assert BM25Index(path).count() == 0
+    assert BM25Index(path).search("café") == []
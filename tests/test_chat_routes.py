@@ -0,0 +1,61 @@
+"""
+Chat streaming routes (routes/chat.py): the WebSocket and SSE endpoints
+open their own database session for each message, against a fake chat
+service.
+"""
+import json
+
+import pytest
+from fastapi import FastAPI
+from starlette.testclient import TestClient
+
+from app.routes import chat as chat_route
+
+
+class FakeSession:
+    def __init__(self, sessions: list):
+        self.closed = False
+        sessions.append(self)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        self.closed = True
+
+
+@pytest.fixture
+def client(monkeypatch):
+    sessions = []
+
+    async def stream_chat(user_id, message, db):
+        assert not db.closed
+        # Earlier messages' sessions were closed, not held for the socket's life
+        assert all(session.closed for session in sessions if session is not db)
+        yield {"type": "token", "text": message.message, "session": sessions.index(db)}
+        yield {"type": "done"}
+
+    monkeypatch.setattr(chat_route, "AsyncSessionLocal", lambda: FakeSession(sessions))
+    monkeypatch.setattr(chat_route, "stream_chat", stream_chat)
+    monkeypatch.setattr(chat_route.llm_scheduler, "check_capacity", lambda: None)
+    app = FastAPI()
+    app.include_router(chat_route.router)
+    with TestClient(app) as client:
+        client.sessions = sessions
+        yield client
+
+
+def test_websocket_uses_a_session_per_message(client):
+    with client.websocket_connect("/chat/ws") as socket:
+        for n, text in enumerate(["first", "second"]):
+            socket.send_json({"message": text})
+            assert socket.receive_json() == {"type": "token", "text": text, "session": n}
+            assert socket.receive_json() == {"type": "done"}
+    assert len(client.sessions) == 2
+
+
+def test_sse_stream_opens_its_session_in_the_stream(client):
+    response = client.post("/chat/stream", json={"message": "hello"})
+    events = [json.loads(line[len("data: "):]) for line in response.text.splitlines() if line]
+    assert events == [{"type": "token", "text": "hello", "session": 0}, {"type": "done"}]
+    assert len(client.sessions) == 1 and client.sessions[0].closed
@@ -0,0 +1,72 @@
+"""
+Streaming chunker (utils/chunker.py): token limits, section breaks and
+overlap, counting one token per word.
+"""
+from app.utils.chunker import estimate_tokens, iter_chunks
+
+
+def words(text: str) -> int:
+    return len(text.split())
+
+
+def sentences(n: int, length: int = 5, start: int = 0) -> str:
+    return " ".join(" ".join(f"s{i}w{j}" for j in range(length)) + "." for i in range(start, start + n))
+
+
+def test_chunks_stay_within_the_token_limit():
+    chunks = list(iter_chunks(sentences(20), max_tokens=12, count_tokens=words))
+    assert len(chunks) == 10
+    assert all(words(chunk) <= 12 for chunk in chunks)
+    # Sentences are never split when they fit
+    assert chunks[0] == "s0w0 s0w1 s0w2 s0w3 s0w4. s1w0 s1w1 s1w2 s1w3 s1w4."
+
+
+def test_over_long_sentence_is_split_on_words():
+    chunks = list(iter_chunks(" ".join(f"w{i}" for i in range(25)), max_tokens=10, count_tokens=words))
+    assert [words(chunk) for chunk in chunks] == [10, 10, 5]
+
+
+def test_heading_starts_a_new_chunk_without_overlap():
+    text = f"{sentences(2)}\n\n# Setup\n{sentences(1, start=2)}\n\nINSTALLATION\n\n{sentences(1, start=3)}"
+    chunks = list(iter_chunks(text, max_tokens=100, overlap_tokens=4, count_tokens=words))
+    assert chunks == [
+        sentences(2),
+        "# Setup\n\n" + sentences(1, start=2),
+        "INSTALLATION\n\n" + sentences(1, start=3),
+    ]
+
+
+def test_overlap_carries_trailing_words_across_sentences():
+    chunks = list(iter_chunks(sentences(4), max_tokens=10, overlap_tokens=3, count_tokens=words))
+    assert chunks[0].endswith("s1w2 s1w3 s1w4.")
+    # Part of the previous sentence, although no whole sentence fits in 3 tokens
+    assert chunks[1].startswith("s1w2 s1w3 s1w4. s2w0")
+    assert all(words(chunk) <= 10 for chunk in chunks)
+    assert "s3w4." in chunks[-1]
+
+
+def test_overlap_is_dropped_when_it_would_overflow():
+    chunks = list(iter_chunks(sentences(2, length=9), max_tokens=10, overlap_tokens=3, count_tokens=words))
+    assert chunks == [sentences(1, length=9), sentences(1, length=9, start=1)]
+
+
+def test_streamed_blocks_match_the_whole_text():
+    text = "\n\n".join(sentences(3, start=3 * i) for i in range(6))
+    pages = [paragraph + "\n\n" for paragraph in text.split("\n\n")]
+
+    consumed = []
+
+    def lazy():
+        for page in pages:
+            consumed.append(page)
+            yield page
+
+    stream = iter_chunks(lazy(), max_tokens=20, overlap_tokens=4, count_tokens=words)
+    first = next(stream)
+    assert len(consumed) < len(pages)
+    assert [first, *stream] == list(iter_chunks(text, max_tokens=20, overlap_tokens=4, count_tokens=words))
+
+
+def test_estimate_tokens():
+    assert estimate_tokens("") == 1
+    assert estimate_tokens("one two three four five six seven eight nine ten") == 14
@@ -0,0 +1,103 @@
+"""
+Behaviour that differs between database backends, checked on each one
+of the test matrix (see conftest.py).
+"""
+import asyncio
+import json
+
+import pytest
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from app.database import async_url, create_db_engine
+from app.models.queries import unscheduled_tasks
+from app.models.sql_models import IngestionJob, Task, User, json_list_contains
+
+
+def test_async_url_picks_the_async_driver():
+    assert async_url("sqlite:////data/aura.db").drivername == "sqlite+aiosqlite"
+    url = async_url("postgresql://aura:secret@db:5432/aura")
+    assert url.drivername == "postgresql+asyncpg"
+    assert (url.host, url.port, url.database, url.password) == ("db", 5432, "aura", "secret")
+
+
+def test_json_columns_round_trip(db_engine):
+    with Session(db_engine) as db:
+        db.add(User(id=1, name="User", settings={"theme": "dark", "ai_temperature": 0.3}))
+        db.add(IngestionJob(filename="notes.pdf", counts={"chunks": 12, "added": 3}))
+        db.commit()
+    with Session(db_engine) as db:
+        assert db.get(User, 1).settings == {"theme": "dark", "ai_temperature": 0.3}
+        assert db.scalars(select(IngestionJob)).one().counts == {"chunks": 12, "added": 3}
+
+
+def test_tag_filter_matches_whole_tags(db_engine):
+    with Session(db_engine) as db:
+        db.add(User(id=1, name="User"))
+        db.add_all([
+            Task(title="Report", tags='["work", "urgent"]', user_id=1),
+            Task(title="Homework", tags='["homework"]', user_id=1),
+            Task(title="Untagged", tags='[]', user_id=1),
+        ])
+        db.commit()
+        titles = db.scalars(select(Task.title).where(json_list_contains(Task.tags, "work"))).all()
+    assert titles == ["Report"]
+
+
+@pytest.mark.parametrize("tag, expected", [
+    ("50%", ["Discount"]),
+    ("5%", []),
+    ("a_b", ["Snake"]),
+    ("a-b", []),
+    ('say "hi"', ["Quote"]),
+    ("say", []),
+    ("Work", ["Capital"]),
+    ("work", []),
+    ("WORK", []),
+])
+def test_tag_filter_is_exact_and_case_sensitive(db_engine, tag, expected):
+    with Session(db_engine) as db:
+        db.add(User(id=1, name="User"))
+        db.add_all([
+            Task(title="Discount", tags=json.dumps(["50%"]), user_id=1),
+            Task(title="Snake", tags=json.dumps(["a_b"]), user_id=1),
+            Task(title="Quote", tags=json.dumps(['say "hi"']), user_id=1),
+            Task(title="Capital", tags=json.dumps(["Work"]), user_id=1),
+        ])
+        db.commit()
+        titles = db.scalars(select(Task.title).where(json_list_contains(Task.tags, tag))).all()
+    assert titles == expected
+
+
+def test_unscheduled_tasks_most_urgent_first(db_engine):
+    with Session(db_engine) as db:
+        db.add(User(id=1, name="User"))
+        db.add_all([
+            Task(title="Someday", priority="low", user_id=1),
+            Task(title="Inbox", priority="unsorted", user_id=1),
+            Task(title="Taxes", priority="urgent", user_id=1),
+            Task(title="Essay", priority="medium", user_id=1),
+            Task(title="Exam prep", priority="high", user_id=1),
+        ])
+        db.commit()
+        titles = [task.title for task in db.scalars(unscheduled_tasks(1))]
+    assert titles == ["Taxes", "Exam prep", "Essay", "Someday", "Inbox"]
+
+
+def test_async_session_sees_sync_writes(db_engine):
+    from sqlalchemy.ext.asyncio import async_sessionmaker
+
+    with Session(db_engine) as db:
+        db.add(User(id=1, name="User"))
+        db.add(Task(title="Shared", user_id=1))
+        db.commit()
+
+    async def read_titles():
+        async_engine = create_db_engine(db_engine.url, asynchronous=True)
+        try:
+            async with async_sessionmaker(async_engine)() as db:
+                return (await db.scalars(select(Task.title))).all()
+        finally:
+            await async_engine.dispose()
+
+    assert asyncio.run(read_titles()) == ["Shared"]
@@ -0,0 +1,35 @@
+"""
+Embedding cache (models/embedding_cache.py): memory LRU in front of a
+row-capped SQLite tier.
+"""
+import sqlite3
+
+from app.models.embedding_cache import EmbeddingCache
+
+
+def test_disk_tier_evicts_least_recently_used(tmp_path):
+    cache = EmbeddingCache("test-model", path=tmp_path / "embeddings.db", memory_entries=1, max_entries=2)
+    cache.put_many(["a"], [[0.5, 1.0]])
+    cache.put_many(["b"], [[1.5, 2.0]])
+    # Read "a" back from disk ("b" holds the single memory slot), so "b" is the oldest row
+    cache._memory.clear()
+    assert cache.get_many(["a"]) == [[0.5, 1.0]]
+    cache.put_many(["c"], [[2.5, 3.0]])
+
+    reopened = EmbeddingCache("test-model", path=tmp_path / "embeddings.db", memory_entries=1, max_entries=2)
+    assert reopened.get_many(["a", "b", "c"]) == [[0.5, 1.0], None, [2.5, 3.0]]
+    stats = cache.get_stats()
+    assert stats["disk_entries"] == 2
+    assert stats["evictions"] == 1
+
+
+def test_files_without_last_used_are_upgraded(tmp_path):
+    path = tmp_path / "embeddings.db"
+    conn = sqlite3.connect(str(path))
+    conn.execute("CREATE TABLE embeddings (key TEXT PRIMARY KEY, vector BLOB NOT NULL)")
+    conn.commit()
+    conn.close()
+
+    cache = EmbeddingCache("test-model", path=path, max_entries=10)
+    cache.put_many(["a"], [[1.0]])
+    assert cache.get_many(["a"], kind="ingest") == [[1.0]]
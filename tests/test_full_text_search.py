@@ -0,0 +1,85 @@
+"""
+Full-text search over tasks and chat history (models/full_text.py), on
+every backend of the test matrix.
+"""
+import pytest
+from sqlalchemy import delete, update
+from sqlalchemy.orm import Session
+
+from app.models.full_text import parse_query, search_chat_history, search_tasks
+from app.models.sql_models import ChatHistory, Task, User
+
+
+@pytest.fixture
+def db(db_engine):
+    with Session(db_engine) as session:
+        session.add_all([User(id=1, name="User"), User(id=2, name="Other")])
+        session.flush()
+        session.add_all([
+            Task(id=1, title="Quarterly report", description="Draft the budget section", user_id=1),
+            Task(id=2, title="Groceries", description="Milk, eggs and a report binder", user_id=1),
+            Task(id=3, title="Meeting notes", description=None, user_id=1),
+            Task(id=4, title="Quarterly report", description="Someone else's", user_id=2),
+        ])
+        session.add_all([
+            ChatHistory(user_id=1, role="user", content="Remind me about the dentist appointment"),
+            ChatHistory(user_id=1, role="assistant", content="Your dentist appointment is on Friday."),
+            ChatHistory(user_id=1, role="user", content="What's for dinner?"),
+        ])
+        session.commit()
+        yield session
+
+
+def task_hits(db, query):
+    return db.execute(search_tasks(db.bind.dialect.name, 1, query)).all()
+
+
+def test_parse_query_drops_search_syntax():
+    assert parse_query('report" OR title* (x') == [("report", False), ("or", False), ("title", True), ("x", False)]
+    assert parse_query("meet") == [("meet", True)]
+    assert parse_query("  ") == []
+
+
+def test_title_matches_rank_first(db):
+    hits = task_hits(db, "report")
+    assert [task.id for task, _, _ in hits] == [1, 2]
+    assert hits[0].score > hits[1].score
+    assert "<mark>" in hits[0].snippet
+
+
+def test_stemming_and_prefix_matches(db):
+    assert [task.id for task, _, _ in task_hits(db, "reports")] == [1, 2]
+    assert [task.id for task, _, _ in task_hits(db, "meet")] == [3]
+    assert [task.id for task, _, _ in task_hits(db, "budg* draft")] == [1]
+
+
+def test_no_words_no_results(db):
+    assert task_hits(db, '"*()') == []
+
+
+def test_index_follows_updates_and_deletes(db):
+    db.execute(update(Task).where(Task.id == 3).values(description="Agenda for the standup"))
+    db.execute(delete(Task).where(Task.id == 2))
+    db.commit()
+    assert [task.id for task, _, _ in task_hits(db, "standup")] == [3]
+    assert [task.id for task, _, _ in task_hits(db, "binder")] == []
+
+
+def test_chat_history_search(db):
+    dialect = db.bind.dialect.name
+    hits = db.execute(search_chat_history(dialect, 1, "dentist")).all()
+    assert len(hits) == 2
+    assert all("<mark>dentist</mark>" in hit.snippet.lower() for hit in hits)
+    assert db.execute(search_chat_history(dialect, 2, "dentist")).all() == []
+
+
+def test_snippets_escape_markup(db):
+    db.add(Task(id=5, title="Payload", user_id=1,
+                description='<script>alert("x")</script> <b>invoice</b> & <mark>fake</mark>'))
+    db.commit()
+    snippet = task_hits(db, "invoice")[0].snippet
+    assert "<mark>invoice</mark>" in snippet
+    # The only tags left are ours (ts_headline drops tags, SQLite keeps them as escaped text)
+    assert "<" not in snippet.replace("<mark>invoice</mark>", "")
+    assert "&amp;" in snippet and "&quot;x&quot;" in snippet
+    assert "\x02" not in snippet and "\x03" not in snippet
@@ -0,0 +1,170 @@
+"""
+Ingestion job claiming (services/ingestion_service.py): a queued job is
+run by exactly one process, and only jobs whose owner stopped
+heartbeating are taken over, on every backend of the test matrix.
+"""
+from datetime import datetime, timedelta
+import threading
+
+import pytest
+from sqlalchemy import delete, update
+from sqlalchemy.orm import Session, sessionmaker
+
+from app.models.sql_models import Document, IngestionJob, User
+from app.services import ingestion_service
+from app.services.ingestion_service import IngestionQueue, JobLostError
+from app.utils.parser import ParseError
+
+
+@pytest.fixture
+def sessions(db_engine):
+    with Session(db_engine) as db:
+        db.add(User(id=1, name="test"))
+        db.flush()
+        db.add(Document(id=1, user_id=1, filename="notes.txt", file_type="text/plain"))
+        db.commit()
+    return sessionmaker(bind=db_engine, autoflush=False)
+
+
+def add_job(sessions, **fields) -> int:
+    with sessions() as db:
+        job = IngestionJob(document_id=1, filename="notes.txt", **fields)
+        db.add(job)
+        db.commit()
+        return job.id
+
+
+def get_job(sessions, job_id: int) -> IngestionJob:
+    with sessions() as db:
+        return db.get(IngestionJob, job_id)
+
+
+def queued_ids(ingestion_queue: IngestionQueue) -> list:
+    return sorted(ingestion_queue._queued_ids)
+
+
+def test_a_queued_job_is_claimed_once(sessions):
+    job_id = add_job(sessions, status="queued")
+    first, second = IngestionQueue(session_factory=sessions), IngestionQueue(session_factory=sessions)
+
+    with sessions() as db:
+        assert first._claim(db, job_id)
+    with sessions() as db:
+        assert not second._claim(db, job_id)
+
+    job = get_job(sessions, job_id)
+    assert (job.status, job.owner, job.attempts) == ("parsing", first.owner, 1)
+    assert job.heartbeat_at is not None
+
+
+def test_racing_workers_claim_a_job_once(sessions):
+    job_ids = [add_job(sessions, status="queued") for _ in range(5)]
+    queues = [IngestionQueue(session_factory=sessions) for _ in range(4)]
+    barrier = threading.Barrier(len(queues))
+    wins = []
+
+    def race(ingestion_queue):
+        barrier.wait(5)
+        for job_id in job_ids:
+            with sessions() as db:
+                if ingestion_queue._claim(db, job_id):
+                    wins.append(job_id)
+
+    threads = [threading.Thread(target=race, args=(q,)) for q in queues]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(10)
+    assert sorted(wins) == job_ids
+
+
+def test_a_job_claimed_elsewhere_is_not_run(sessions):
+    job_id = add_job(sessions, status="embedding", owner="other-host:1:abc", heartbeat_at=datetime.utcnow())
+    IngestionQueue(session_factory=sessions)._run(job_id)
+    job = get_job(sessions, job_id)
+    assert (job.status, job.owner, job.attempts) == ("embedding", "other-host:1:abc", 0)
+
+
+def test_only_jobs_of_a_dead_owner_are_taken_over(sessions):
+    now = datetime.utcnow()
+    alive = add_job(sessions, status="embedding", owner="alive:1:a", heartbeat_at=now)
+    dead = add_job(sessions, status="parsing", owner="dead:1:b", heartbeat_at=now - timedelta(minutes=10))
+    unowned = add_job(sessions, status="embedding")
+    waiting = add_job(sessions, status="queued")
+    done = add_job(sessions, status="done", owner="dead:1:b", heartbeat_at=now - timedelta(minutes=10))
+
+    ingestion_queue = IngestionQueue(session_factory=sessions)
+    assert ingestion_queue.recover() == 2
+
+    assert get_job(sessions, alive).status == "embedding"
+    assert (get_job(sessions, dead).status, get_job(sessions, dead).owner) == ("queued", None)
+    assert get_job(sessions, unowned).status == "queued"
+    assert get_job(sessions, done).status == "done"
+    assert queued_ids(ingestion_queue) == sorted([dead, unowned, waiting])
+
+    # Sweeps don't queue a job twice
+    ingestion_queue.recover()
+    assert ingestion_queue._queue.qsize() == 3
+
+
+def test_sweeps_leave_recently_queued_jobs_to_their_process(sessions):
+    job_id = add_job(sessions, status="queued")
+    ingestion_queue = IngestionQueue(session_factory=sessions)
+    ingestion_queue.recover(waiting_since=datetime.utcnow() - timedelta(minutes=1))
+    assert queued_ids(ingestion_queue) == []
+    ingestion_queue.recover(waiting_since=datetime.utcnow() + timedelta(minutes=1))
+    assert queued_ids(ingestion_queue) == [job_id]
+
+
+def test_heartbeat_touches_only_our_running_jobs(sessions):
+    ingestion_queue = IngestionQueue(session_factory=sessions)
+    old = datetime.utcnow() - timedelta(minutes=10)
+    ours = add_job(sessions, status="embedding", owner=ingestion_queue.owner, heartbeat_at=old)
+    theirs = add_job(sessions, status="embedding", owner="other:1:c", heartbeat_at=old)
+    finished = add_job(sessions, status="done", owner=ingestion_queue.owner, heartbeat_at=old)
+
+    assert ingestion_queue.heartbeat() == 1
+    assert get_job(sessions, ours).heartbeat_at > old
+    assert get_job(sessions, theirs).heartbeat_at == old
+    assert get_job(sessions, finished).heartbeat_at == old
+    assert ingestion_queue.recover() == 1
+    assert get_job(sessions, ours).status == "embedding"
+
+
+def test_a_worker_stops_once_its_job_is_taken_over(sessions, monkeypatch):
+    job_id = add_job(sessions, status="queued")
+    pages = []
+
+    def add_to_rag(filename, content, progress=None):
+        for page in range(3):
+            if page == 1:
+                # Our heartbeat went stale and another process took the job over
+                with sessions() as db:
+                    db.execute(update(IngestionJob).where(IngestionJob.id == job_id)
+                               .values(owner="other:1:d", status="embedding", chunks_done=0))
+                    db.commit()
+            pages.append(page)
+            progress(page + 1)
+        return {"chunks": 3}
+
+    monkeypatch.setattr(ingestion_service, "add_to_rag", add_to_rag)
+    with pytest.raises(JobLostError):
+        IngestionQueue(session_factory=sessions)._run(job_id)
+
+    assert pages == [0, 1]
+    job = get_job(sessions, job_id)
+    assert (job.owner, job.status, job.chunks_done, job.finished_at) == ("other:1:d", "embedding", 0, None)
+
+
+def test_parse_error_on_a_deleted_job(sessions, monkeypatch):
+    job_id = add_job(sessions, status="queued")
+
+    def add_to_rag(filename, content, progress=None):
+        with sessions() as db:
+            db.execute(delete(IngestionJob).where(IngestionJob.id == job_id))
+            db.commit()
+        raise ParseError("corrupt file")
+
+    monkeypatch.setattr(ingestion_service, "add_to_rag", add_to_rag)
+    IngestionQueue(session_factory=sessions)._run(job_id)
+    assert get_job(sessions, job_id) is None
@@ -0,0 +1,61 @@
+"""
+Fast-path intent classification (services/intent_classifier.py): entity
+handling for confident classifier answers.
+"""
+import pytest
+
+from app.services import intent_classifier as classifier_module
+from app.services.intent_classifier import classify_intent, extract_username, intent_classifier
+
+
+@pytest.fixture
+def confident(monkeypatch):
+    """Make the classifier confidently predict the intent set on the returned list"""
+    llm_calls = []
+    label = ["general_chat"]
+    monkeypatch.setattr(classifier_module.config, "INTENT_CLASSIFIER_ENABLED", True)
+    monkeypatch.setattr(intent_classifier, "predict", lambda message: (label[0], 0.99, 0.5))
+
+    def detect_intent(message):
+        llm_calls.append(message)
+        return {"intent": "add_task", "entities": {"title": "Call John", "time": "2026-01-05 17:00"},
+                "sentiment": "neutral"}
+
+    monkeypatch.setattr(classifier_module, "detect_intent", detect_intent)
+    return label, llm_calls
+
+
+@pytest.mark.parametrize("message, name", [
+    ("My name is Sam", "Sam"),
+    ("Change my name to Priya", "Priya"),
+    ("Call me Rylix from now on", "Rylix"),
+    ("please call me Mary Jane", "Mary Jane"),
+    ("What's my name?", None),
+])
+def test_extract_username(message, name):
+    assert extract_username(message) == name
+
+
+def test_name_change_is_answered_without_the_llm(confident):
+    label, llm_calls = confident
+    label[0] = "change_name"
+    result = classify_intent("My name is Sam")
+    assert result["intent"] == "change_name"
+    assert result["entities"] == {"username": "Sam"}
+    assert llm_calls == []
+
+
+def test_entity_intents_still_get_their_entities(confident):
+    label, llm_calls = confident
+    label[0] = "add_task"
+    result = classify_intent("Remind me to call John at 5pm")
+    assert result["intent"] == "add_task"
+    assert result["entities"]["title"] == "Call John"
+    assert llm_calls == ["Remind me to call John at 5pm"]
+
+
+def test_other_intents_skip_the_llm(confident):
+    label, llm_calls = confident
+    label[0] = "task_query"
+    assert classify_intent("Show my tasks")["entities"] == {}
+    assert llm_calls == []
@@ -0,0 +1,79 @@
+"""
+JSON schema to GBNF conversion and parsing of constrained output
+(utils/json_grammar.py).
+"""
+import json
+
+import pytest
+
+from app.utils.json_grammar import drop_nulls, load_constrained, schema_to_gbnf
+
+
+def rules(grammar: str) -> dict:
+    return dict(line.split(" ::= ", 1) for line in grammar.strip().splitlines())
+
+
+def test_enum_is_an_alternation_of_json_literals():
+    grammar = rules(schema_to_gbnf({"type": "object", "properties": {"priority": {"enum": ["low", "high"]}}}))
+    assert grammar["root"] == r'"{" ws "\"priority\"" ws ":" ws ("\"low\"" | "\"high\"") ws "}"'
+
+
+def test_nested_objects_get_their_own_rules():
+    schema = {
+        "type": "object",
+        "properties": {
+            "intent": {"type": "string"},
+            "entities": {"type": "object", "properties": {"duration": {"type": "integer"}}},
+        },
+    }
+    grammar = rules(schema_to_gbnf(schema))
+    assert "root-entities" in grammar["root"]
+    assert grammar["root-entities"] == r'"{" ws "\"duration\"" ws ":" ws integer ws "}"'
+
+
+def test_optional_fields_may_be_null():
+    schema = {
+        "type": "object",
+        "properties": {"title": {"type": "string"}, "time": {"type": "string"}},
+        "required": ["title"],
+    }
+    root = rules(schema_to_gbnf(schema))["root"]
+    assert r'"\"title\"" ws ":" ws string' in root
+    assert r'"\"time\"" ws ":" ws (string | null)' in root
+
+
+def test_arrays_and_type_lists():
+    schema = {"type": "array", "items": {"type": ["integer", "null"]}}
+    assert rules(schema_to_gbnf(schema))["root"] == '"[" ws ((integer | null) (ws "," ws (integer | null))*)? ws "]"'
+
+
+def test_strings_exclude_control_characters():
+    string_rule = rules(schema_to_gbnf({"type": "string"}))["string"]
+    assert r'[^"\\\x7F\x00-\x1F]' in string_rule
+
+
+def test_unsupported_schema_is_rejected():
+    with pytest.raises(ValueError):
+        schema_to_gbnf({"type": "object", "properties": {"when": {"format": "date"}}})
+
+
+def test_load_constrained_keeps_complete_elements_of_truncated_output():
+    events = [{"title": "Class", "start": "09:00"}, {"title": "Gym", "start": "17:00"}]
+    text = json.dumps(events)
+    assert load_constrained(text) == events
+    assert load_constrained(text[:-10]) == events[:1]
+
+    intent = json.dumps({"intent": "add_task", "entities": {"title": "Call, \"mom\"", "time": "18:00"}})
+    assert load_constrained(intent[:-5]) == {"intent": "add_task"}
+
+
+def test_load_constrained_rejects_unusable_text():
+    with pytest.raises(ValueError):
+        load_constrained("I'm currently running in offline mode.")
+    with pytest.raises(ValueError):
+        load_constrained('[{"title": "Cla')
+
+
+def test_drop_nulls():
+    assert drop_nulls({"title": "Gym", "time": None, "duration": 0}) == {"title": "Gym", "duration": 0}
+    assert drop_nulls(None) == {}
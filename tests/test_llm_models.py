@@ -0,0 +1,79 @@
+"""
+Prompt-prefix KV cache (models/llm_models.py, LLM._use_prefix) against a
+fake llama.cpp model whose input_ids buffer, like the real one, keeps
+stale tokens past n_tokens.
+"""
+import numpy as np
+import pytest
+
+from app.models.llm_models import LLM
+
+PREFIX = " ".join(f"rule{i}" for i in range(40)) + "\n"
+
+
+class FakeLlama:
+    def __init__(self, n_ctx: int = 128):
+        self.input_ids = np.zeros(n_ctx, dtype=np.intc)
+        self.n_tokens = 0
+        self.loads = 0
+        self.fail_loads = False
+
+    def tokenize(self, text: bytes, special: bool = False) -> list:
+        return [sum(word) for word in text.split()]
+
+    def reset(self):
+        self.n_tokens = 0
+
+    def eval(self, tokens: list):
+        self.input_ids[self.n_tokens:self.n_tokens + len(tokens)] = tokens
+        self.n_tokens += len(tokens)
+
+    def save_state(self):
+        return self.input_ids.copy(), self.n_tokens
+
+    def load_state(self, state):
+        if self.fail_loads:
+            raise RuntimeError("state does not fit")
+        self.loads += 1
+        self.input_ids, self.n_tokens = state[0].copy(), state[1]
+
+
+@pytest.fixture
+def model():
+    model = LLM(lazy=True)
+    model.llm = FakeLlama()
+    model._use_prefix(PREFIX + "first question", PREFIX)
+    assert model.stats["prefix_misses"] == 1
+    return model
+
+
+def hits(model) -> int:
+    return model.stats["prefix_hits"]
+
+
+def test_resident_prefix_is_not_restored(model):
+    model._use_prefix(PREFIX + "second question", PREFIX)
+    assert (model.llm.loads, hits(model)) == (0, 1)
+    assert model.stats["prefill_tokens_skipped"] == 40
+
+
+def test_stale_buffer_after_reset_is_restored(model):
+    model.llm.reset()
+    model._use_prefix(PREFIX + "second question", PREFIX)
+    assert (model.llm.loads, hits(model)) == (1, 1)
+    assert model.llm.n_tokens == 40
+
+
+def test_shorter_eval_is_restored(model):
+    model.llm.reset()
+    model.llm.eval(model._tokenize("something else entirely"))
+    model._use_prefix(PREFIX + "second question", PREFIX)
+    assert (model.llm.loads, hits(model)) == (1, 1)
+
+
+def test_failed_restore_is_not_a_hit(model):
+    model.llm.reset()
+    model.llm.fail_loads = True
+    model._use_prefix(PREFIX + "second question", PREFIX)
+    assert hits(model) == 0
+    assert model.stats["prefill_tokens_skipped"] == 0
@@ -0,0 +1,132 @@
+"""
+LLMScheduler (services/llm_scheduler.py): lane priority, admission
+control, queue deadlines and warm-up, against a fake model.
+"""
+import asyncio
+import threading
+import time
+import types
+
+import pytest
+
+from app.services import llm_scheduler as scheduler_module
+from app.services.llm_scheduler import (
+    BACKGROUND, INTERACTIVE, LLMDeadlineExceededError, LLMQueueFullError, LLMScheduler,
+    LLMWarmingUpError,
+)
+
+
+@pytest.fixture
+def fake_llm(monkeypatch):
+    fake = types.SimpleNamespace(ready=True, status="ready", loads=0, responses={})
+
+    def start_loading():
+        fake.loads += 1
+
+    def generate_stream(prompt, max_tokens, **kwargs):
+        yield from prompt.split()
+
+    def generate(prompt, max_tokens=None, **kwargs):
+        return f"generated: {prompt}"
+
+    fake.start_loading = start_loading
+    fake.generate = generate
+    fake.cached_response = lambda prompt, max_tokens=None, **kwargs: fake.responses.get(prompt)
+    fake.generate_stream = generate_stream
+    monkeypatch.setattr(scheduler_module, "llm", fake)
+    return fake
+
+
+@pytest.fixture
+def scheduler(fake_llm):
+    """One worker, held busy by `scheduler.block()` until `scheduler.release()`"""
+    scheduler = LLMScheduler(workers=1)
+    gate, started = threading.Event(), threading.Event()
+
+    def hold():
+        started.set()
+        gate.wait(5)
+
+    def block():
+        scheduler.submit(hold, deadline=0)
+        assert started.wait(5)
+
+    scheduler.block, scheduler.release = block, gate.set
+    yield scheduler
+    gate.set()
+
+
+def test_interactive_lane_is_served_first(scheduler):
+    scheduler.block()
+    order = []
+    background = scheduler.submit(order.append, "background", priority=BACKGROUND)
+    interactive = scheduler.submit(order.append, "interactive", priority=INTERACTIVE)
+    scheduler.release()
+    background.future.result(5)
+    interactive.future.result(5)
+    assert order == ["interactive", "background"]
+
+
+def test_full_lane_is_rejected_with_429(scheduler):
+    scheduler.limits[INTERACTIVE] = 2
+    scheduler.block()
+    scheduler.submit(time.sleep, 0)
+    scheduler.submit(time.sleep, 0)
+    with pytest.raises(LLMQueueFullError) as error:
+        scheduler.submit(time.sleep, 0)
+    assert error.value.status_code == 429
+    assert scheduler.get_stats()["rejected"] == 1
+    # The background lane has its own limit
+    scheduler.submit(time.sleep, 0, priority=BACKGROUND)
+
+
+def test_queued_request_expires_at_its_deadline(scheduler):
+    scheduler.block()
+    started = time.monotonic()
+    with pytest.raises(LLMDeadlineExceededError):
+        scheduler.run(time.sleep, 0, deadline=0.05)
+    assert time.monotonic() - started < 1
+    stats = scheduler.get_stats()
+    assert stats["expired"] == 1
+    assert stats["queue_depth"] == 0
+
+
+def test_warming_up_is_rejected_with_503(scheduler, fake_llm):
+    fake_llm.ready, fake_llm.status = False, "loading"
+    with pytest.raises(LLMWarmingUpError) as error:
+        scheduler.submit(time.sleep, 0)
+    assert error.value.status_code == 503
+    assert error.value.status == "warming_up"
+    assert fake_llm.loads == 1
+
+
+def test_stream(scheduler):
+    async def collect():
+        return [piece async for piece in scheduler.stream("one two three")]
+
+    assert asyncio.run(collect()) == ["one", "two", "three"]
+
+
+def test_abandoned_stream_gives_up_its_queue_slot(scheduler):
+    scheduler.block()
+
+    async def disconnect():
+        stream = scheduler.stream("never sent")
+        with pytest.raises(asyncio.TimeoutError):
+            await asyncio.wait_for(stream.__anext__(), timeout=0.05)
+
+    asyncio.run(disconnect())
+    assert scheduler.get_stats()["queue_depth"] == 0
+
+
+def test_response_cache_hit_skips_the_queue(scheduler, fake_llm):
+    fake_llm.responses["What is AURA?"] = "A productivity assistant."
+    scheduler.limits[INTERACTIVE] = 1
+    scheduler.block()
+    scheduler.submit(time.sleep, 0)
+    # The lane is full, but a cached answer does not need a worker
+    assert scheduler.generate("What is AURA?") == "A productivity assistant."
+    assert asyncio.run(scheduler.generate_async("What is AURA?")) == "A productivity assistant."
+    with pytest.raises(LLMQueueFullError):
+        scheduler.generate("Something new")
+    assert scheduler.get_stats()["rejected"] == 1
@@ -0,0 +1,134 @@
+"""
+Query-plan checks for the hot paths: each must search an index, never
+scan a whole table or sort. Runs on every backend of the test matrix
+(see conftest.py) against a schema built the way init_db builds it.
+"""
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import func, inspect, select, text
+
+from app.database import Base
+from app.migrations import MIGRATIONS, run_migrations
+from app.models.full_text import search_chat_history, search_tasks
+from app.models.queries import (
+    count_of, document_by_body_key, document_by_filename, pending_tasks, recent_chat_turns,
+    tasks_completed_between, tasks_due_between, unscheduled_tasks,
+)
+from app.models.sql_models import (
+    SEARCH_CONFIG, ChatHistory, Task, chat_search_vector, json_list_contains, task_search_vector,
+)
+
+NOW = datetime(2024, 1, 15, 9, 0)
+
+# Built by the same helpers the services run (models/queries.py)
+HOT_QUERIES = {
+    # schedule_service.generate_daily_schedule, chat_service.get_user_context/handle_task_query
+    "tasks due in a range": tasks_due_between(1, NOW, NOW + timedelta(days=1)),
+    # chat_service.handle_task_query (pending tasks)
+    "pending tasks by due date": pending_tasks(1, limit=10),
+    # routes/insights.get_focus_score, chat_service.handle_day_summary
+    "tasks completed in a period": count_of(tasks_completed_between(1, NOW - timedelta(days=7), NOW)),
+    "tasks completed since": count_of(tasks_completed_between(1, NOW - timedelta(days=1))),
+    # chat_service.get_recent_turns
+    "recent chat turns": recent_chat_turns(1, limit=10),
+    # routes/upload.upload_file
+    "document by filename": document_by_filename("notes.pdf"),
+    # services/ingestion_service.release_blob
+    "document by body key": document_by_body_key("0" * 64),
+}
+
+# Index lookups whose few matching rows are then sorted by an expression
+SORTED_HOT_QUERIES = {
+    # schedule_service.auto_schedule_tasks: ORDER BY priority rank
+    "unscheduled tasks": unscheduled_tasks(1),
+}
+
+# Only indexed on PostgreSQL (GIN over jsonb); SQLite has no index for LIKE '%..%'
+POSTGRES_HOT_QUERIES = {
+    # routes/tasks.get_tasks?tag=
+    "tasks with a tag": select(Task.id).where(json_list_contains(Task.tags, "work")),
+    # The full-text predicates must match the GIN index expressions
+    "task text search": select(Task.id).where(
+        task_search_vector.op("@@")(func.to_tsquery(SEARCH_CONFIG, "report"))
+    ),
+    "chat text search": select(ChatHistory.id).where(
+        chat_search_vector.op("@@")(func.to_tsquery(SEARCH_CONFIG, "report"))
+    ),
+}
+
+
+def query_plan(engine, statement) -> list:
+    sql = statement.compile(dialect=engine.dialect, compile_kwargs={"literal_binds": True})
+    with engine.connect() as conn:
+        if engine.dialect.name == "sqlite":
+            return [row[-1] for row in conn.exec_driver_sql(f"EXPLAIN QUERY PLAN {sql}")]
+        # Empty tables make a sequential scan the cheapest plan; ask whether
+        # an index *can* serve the query instead
+        conn.exec_driver_sql("SET enable_seqscan = off")
+        return [row[0] for row in conn.exec_driver_sql(f"EXPLAIN {sql}")]
+
+
+def plan_problems(engine, plan: list, sort_ok: bool = False) -> list:
+    if engine.dialect.name == "sqlite":
+        return [
+            step for step in plan
+            if (step.startswith("SCAN") and "USING" not in step) or ("TEMP B-TREE" in step and not sort_ok)
+        ]
+    return [
+        step for step in plan
+        if "Seq Scan" in step or (step.lstrip("-> ").startswith("Sort") and not sort_ok)
+    ]
+
+
+@pytest.mark.parametrize("name", sorted(HOT_QUERIES))
+def test_hot_query_uses_an_index(db_engine, name):
+    plan = query_plan(db_engine, HOT_QUERIES[name])
+    assert not plan_problems(db_engine, plan), f"{name}: table scan or sort in {plan}"
+
+
+@pytest.mark.parametrize("name", sorted(SORTED_HOT_QUERIES))
+def test_sorted_hot_query_uses_an_index(db_engine, name):
+    plan = query_plan(db_engine, SORTED_HOT_QUERIES[name])
+    assert not plan_problems(db_engine, plan, sort_ok=True), f"{name}: table scan in {plan}"
+
+
+@pytest.mark.parametrize("name", sorted(POSTGRES_HOT_QUERIES))
+def test_postgres_hot_query_uses_an_index(db_engine, name):
+    if db_engine.dialect.name != "postgresql":
+        pytest.skip("PostgreSQL-only index")
+    plan = query_plan(db_engine, POSTGRES_HOT_QUERIES[name])
+    assert not plan_problems(db_engine, plan), f"{name}: table scan or sort in {plan}"
+
+
+@pytest.mark.parametrize("search", [search_tasks, search_chat_history])
+def test_search_uses_the_full_text_index(db_engine, search):
+    plan = query_plan(db_engine, search(db_engine.dialect.name, 1, "weekly report"))
+    if db_engine.dialect.name == "sqlite":
+        assert any("VIRTUAL TABLE INDEX" in step for step in plan), plan
+        assert not [step for step in plan if step.startswith("SCAN") and "VIRTUAL TABLE" not in step], plan
+    else:
+        assert not any("Seq Scan" in step for step in plan), plan
+
+
+def test_migrations_upgrade_an_old_database(empty_engine):
+    """A database created before the indexes existed gains them on startup"""
+    engine = empty_engine
+    with engine.begin() as conn:
+        conn.execute(text(
+            "CREATE TABLE documents (id INTEGER PRIMARY KEY, user_id INTEGER, filename VARCHAR(200), "
+            "content TEXT, file_type VARCHAR(50), uploaded_at TIMESTAMP)"
+        ))
+    Base.metadata.create_all(engine)
+
+    assert run_migrations(engine) == max(version for version, _, _ in MIGRATIONS)
+    inspector = inspect(engine)
+    columns = {column["name"] for column in inspector.get_columns("documents")}
+    assert {"content_hash", "file_size", "content_blob"} <= columns
+    indexes = {index["name"] for index in inspector.get_indexes("documents")}
+    assert {"ix_documents_filename", "ix_documents_content_blob", "ix_documents_content_hash"} <= indexes
+
+    # Applied migrations are recorded and not run again
+    assert run_migrations(engine) == max(version for version, _, _ in MIGRATIONS)
+    with engine.connect() as conn:
+        assert conn.execute(text("SELECT COUNT(*) FROM schema_version")).scalar() == len(MIGRATIONS)
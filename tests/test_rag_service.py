@@ -0,0 +1,92 @@
+"""
+Document indexing (services/rag_service.py): incremental re-indexing
+against a flat vector store and BM25 index in a temporary directory.
+"""
+import random
+import types
+
+import pytest
+
+from app.services import rag_service
+from app.services.bm25_index import BM25Index
+from app.services.vector_store import FlatVectorStore
+from app.utils.chunker import estimate_tokens
+
+
+@pytest.fixture
+def rag(tmp_path, monkeypatch):
+    embedded = []
+
+    def embed_batch(texts):
+        embedded.extend(texts)
+        return [[1.0, float(len(text)), float(sum(map(ord, text)) % 97)] for text in texts]
+
+    fake_llm = types.SimpleNamespace(count_embedding_tokens=estimate_tokens, embed_batch=embed_batch)
+    monkeypatch.setattr(rag_service, "llm", fake_llm)
+    monkeypatch.setattr(rag_service, "vector_store", FlatVectorStore(tmp_path / "vectors", dtype="float16"))
+    monkeypatch.setattr(rag_service, "bm25_index", BM25Index(tmp_path / "bm25.db"))
+    monkeypatch.setattr(rag_service, "embedder", types.SimpleNamespace(record_ingestion=lambda *args: None))
+    monkeypatch.setattr(rag_service.config, "RAG_MANIFEST_DIR", tmp_path)
+    monkeypatch.setattr(rag_service.config, "RAG_INGEST_PAGE_SIZE", 8)
+    return embedded
+
+
+def pages(n: int = 30, seed: int = 11) -> list:
+    rng = random.Random(seed)
+    words = ["budget", "meeting", "roadmap", "invoice", "sprint", "review", "deadline", "client", "draft"]
+
+    def sentence():
+        return " ".join(rng.choice(words) for _ in range(rng.randint(5, 25))).capitalize() + "."
+
+    return [" ".join(sentence() for _ in range(rng.randint(10, 30))) + "\n\n" for _ in range(n)]
+
+
+def test_reindex_unchanged_document_embeds_nothing(rag):
+    first = rag_service.add_to_rag("notes.txt", pages())
+    assert first["added"] == first["chunks"] == len(rag)
+
+    again = rag_service.add_to_rag("notes.txt", pages())
+    assert again["added"] == again["deleted"] == 0
+    assert again["unchanged"] == first["chunks"]
+
+
+def test_editing_one_page_reembeds_only_nearby_chunks(rag):
+    original = pages()
+    first = rag_service.add_to_rag("notes.txt", original)
+
+    edited = list(original)
+    edited[3] = edited[3].replace(
+        ". ", ". Moved the client review to Friday because the invoice draft is still waiting on the budget. ", 1
+    )
+    rag.clear()
+    counts = rag_service.add_to_rag("notes.txt", edited)
+
+    # Greedy packing re-embeds ~75 chunks here: every cut after the edit moves
+    assert 1 <= counts["added"] <= 6
+    assert counts["deleted"] <= 6
+    assert counts["unchanged"] + counts["moved"] >= first["chunks"] - 6
+    assert len(rag) == counts["added"]
+    assert rag_service.vector_store.count() == counts["chunks"]
+
+
+def test_fuse_ranks_by_reciprocal_rank_and_fetches_lexical_hits(rag):
+    rag_service.vector_store.upsert(
+        ["x", "y", "z"], [[1.0, 0.0], [0.0, 1.0], [1.0, 1.0]], ["dense only", "both", "lexical only"],
+        [{"filename": "a.txt"}] * 3,
+    )
+    dense = [
+        {"id": "x", "text": "dense only", "metadata": {"filename": "a.txt"}, "score": 0.9},
+        {"id": "y", "text": "both", "metadata": {"filename": "a.txt"}, "score": 0.8},
+    ]
+    lexical = [("y", 7.5), ("z", 3.0), ("gone", 1.0)]
+
+    fused = rag_service._fuse(dense, lexical, top_k=4)
+    assert [chunk["id"] for chunk in fused] == ["y", "x", "z"]
+    k = rag_service.config.RAG_RRF_K
+    assert fused[0]["score"] == pytest.approx(1 / (k + 2) + 1 / (k + 1))
+    assert (fused[0]["dense_rank"], fused[0]["lexical_rank"]) == (2, 1)
+    # Found only by BM25: text and metadata come from the vector store
+    assert fused[2]["text"] == "lexical only"
+    assert fused[2]["metadata"] == {"filename": "a.txt"}
+    # Lexical ids missing from the store ("gone") are dropped
+    assert len(rag_service._fuse(dense, lexical, top_k=2)) == 2
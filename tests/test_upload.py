@@ -0,0 +1,206 @@
+"""
+Streaming uploads: receive_upload (utils/upload_stream.py) behind a bare
+Starlette route with a small size limit, and content-hash deduplication in
+POST /api/upload (routes/upload.py).
+"""
+import asyncio
+import hashlib
+import types
+
+import pytest
+from fastapi import FastAPI
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.orm import Session
+from sqlalchemy.pool import NullPool
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import JSONResponse
+from starlette.routing import Route
+from starlette.testclient import TestClient
+
+from app.database import async_url, get_async_db
+from app.models.sql_models import Document, User
+from app.routes import upload as upload_route
+from app.utils import upload_stream
+from app.utils.upload_stream import UploadError, receive_upload
+
+MAX_BYTES = 1024
+BOUNDARY = "aura-test-boundary"
+
+
+def multipart(*parts, closed: bool = True) -> bytes:
+    """Body with `(name, filename, data)` parts; filename None for a plain field"""
+    body = b""
+    for name, filename, data in parts:
+        disposition = f'form-data; name="{name}"' + (f'; filename="{filename}"' if filename else "")
+        body += f"--{BOUNDARY}\r\nContent-Disposition: {disposition}\r\n".encode()
+        if filename:
+            body += b"Content-Type: text/plain\r\n"
+        body += b"\r\n" + data + b"\r\n"
+    if closed:
+        body += f"--{BOUNDARY}--\r\n".encode()
+    return body
+
+
+HEADERS = {"content-type": f"multipart/form-data; boundary={BOUNDARY}"}
+
+
+@pytest.fixture
+def uploads_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(upload_stream.config, "UPLOADS_DIR", tmp_path)
+    return tmp_path
+
+
+@pytest.fixture
+def client(uploads_dir):
+    async def receive(request):
+        try:
+            upload = await receive_upload(request, max_bytes=MAX_BYTES)
+        except UploadError as e:
+            return JSONResponse({"code": e.code, "message": e.message}, status_code=400)
+        spooled_sha256 = hashlib.sha256(upload.path.read_bytes()).hexdigest()
+        upload.discard()
+        return JSONResponse({
+            "filename": upload.filename, "content_type": upload.content_type, "size": upload.size,
+            "sha256": upload.sha256, "spooled_sha256": spooled_sha256,
+        })
+
+    with TestClient(Starlette(routes=[Route("/upload", receive, methods=["POST"])])) as client:
+        yield client
+
+
+def spooled(uploads_dir) -> list:
+    return list((uploads_dir / "incoming").glob("*.part"))
+
+
+def test_file_is_spooled_and_hashed(client, uploads_dir):
+    data = b"lecture notes " * 50
+    response = client.post("/upload", content=multipart(("title", None, b"ignored"), ("file", "notes.txt", data)),
+                           headers=HEADERS)
+    assert response.status_code == 200
+    assert response.json() == {
+        "filename": "notes.txt", "content_type": "text/plain", "size": len(data),
+        "sha256": hashlib.sha256(data).hexdigest(), "spooled_sha256": hashlib.sha256(data).hexdigest(),
+    }
+    assert spooled(uploads_dir) == []
+
+
+def test_file_over_the_limit_is_cut_off(client, uploads_dir):
+    # Small enough to pass the Content-Length check, so the streamed count trips
+    body = multipart(("file", "big.txt", b"x" * (MAX_BYTES + 1)))
+
+    def chunks():
+        for start in range(0, len(body), 256):
+            yield body[start:start + 256]
+
+    response = client.post("/upload", content=chunks(), headers=HEADERS)
+    assert response.json()["code"] == "FILE_TOO_LARGE"
+    assert spooled(uploads_dir) == []
+
+    exact = client.post("/upload", content=multipart(("file", "ok.txt", b"x" * MAX_BYTES)), headers=HEADERS)
+    assert exact.json()["size"] == MAX_BYTES
+
+
+def test_content_length_is_checked_before_reading(uploads_dir):
+    scope = {
+        "type": "http", "method": "POST", "path": "/upload",
+        "headers": [
+            (b"content-type", HEADERS["content-type"].encode()),
+            (b"content-length", str(MAX_BYTES + upload_stream._FORM_OVERHEAD + 1).encode()),
+        ],
+    }
+
+    async def receive():
+        raise AssertionError("the body must not be read")
+
+    with pytest.raises(UploadError) as error:
+        asyncio.run(receive_upload(Request(scope, receive), max_bytes=MAX_BYTES))
+    assert error.value.code == "FILE_TOO_LARGE"
+    assert error.value.details == {"max_bytes": MAX_BYTES}
+
+
+@pytest.mark.parametrize("body, headers", [
+    (multipart(("file", "notes.txt", b"cut short"), closed=False), HEADERS),
+    (multipart(("file", "notes.txt", b"data"))[:-40], HEADERS),
+    (b"--" + BOUNDARY.encode() + b"\r\nthis is not a part header\r\n\r\n", HEADERS),
+    (b"file=notes.txt", {"content-type": "application/x-www-form-urlencoded"}),
+    (multipart(("file", "notes.txt", b"data")), {"content-type": "multipart/form-data"}),
+])
+def test_truncated_or_malformed_uploads_are_rejected(client, uploads_dir, body, headers):
+    response = client.post("/upload", content=body, headers=headers)
+    assert response.json()["code"] == "INVALID_UPLOAD"
+    assert spooled(uploads_dir) == []
+
+
+def test_upload_without_the_file_field(client, uploads_dir):
+    for body in (multipart(("title", None, b"just a field")), multipart(("attachment", "notes.txt", b"data"))):
+        response = client.post("/upload", content=body, headers=HEADERS)
+        assert response.json()["code"] == "NO_FILE"
+    assert spooled(uploads_dir) == []
+
+
+# -- POST /api/upload: content-hash deduplication --
+
+@pytest.fixture
+def api(db_engine, db_url, uploads_dir, monkeypatch):
+    monkeypatch.setattr(upload_route.ingestion_queue, "enqueue", lambda db, doc: types.SimpleNamespace(id=1))
+    monkeypatch.setattr(upload_route, "source_path", lambda doc_id: uploads_dir / f"document_{doc_id}.upload")
+    with Session(db_engine) as db:
+        db.add(User(id=1, name="User"))
+        db.commit()
+
+    # NullPool: TestClient runs the app on its own event loop
+    async_engine = create_async_engine(async_url(db_url), poolclass=NullPool)
+    sessions = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+
+    async def get_test_db():
+        async with sessions() as session:
+            yield session
+
+    app = FastAPI()
+    app.include_router(upload_route.router, prefix="/api")
+    app.dependency_overrides[get_async_db] = get_test_db
+    with TestClient(app) as client:
+        yield client, db_engine
+
+
+def upload(client, filename: str, data: bytes, **params):
+    return client.post("/api/upload", params=params, content=multipart(("file", filename, data)),
+                       headers=HEADERS).json()
+
+
+def documents(engine) -> list:
+    with Session(engine) as db:
+        return [(doc.filename, doc.content_hash) for doc in db.query(Document).order_by(Document.id)]
+
+
+def test_identical_content_is_deduplicated(api, uploads_dir):
+    client, engine = api
+    data = b"syllabus for CS-101"
+    first = upload(client, "syllabus.txt", data)
+    assert first["success"]
+    assert (uploads_dir / f"document_{first['data']['id']}.upload").read_bytes() == data
+
+    rejected = upload(client, "copy.txt", data)
+    assert rejected["error"]["code"] == "DUPLICATE_CONTENT"
+    assert rejected["error"]["details"]["existing_filename"] == "syllabus.txt"
+
+    linked = upload(client, "copy.txt", data, duplicate="link")
+    assert linked["data"]["id"] == first["data"]["id"]
+    assert linked["data"]["linked"] is True
+    assert linked["data"]["requested_filename"] == "copy.txt"
+    # A lookup only: nothing is recorded under the new name
+    assert documents(engine) == [("syllabus.txt", hashlib.sha256(data).hexdigest())]
+    assert spooled(uploads_dir) == []
+
+
+def test_same_name_is_rejected_unless_replaced(api):
+    client, engine = api
+    upload(client, "notes.txt", b"v1")
+    assert upload(client, "notes.txt", b"v2")["error"]["code"] == "FILE_ALREADY_EXISTS"
+    unchanged = upload(client, "notes.txt", b"v1", replace="true")
+    assert "unchanged" in unchanged["message"]
+    assert "job_id" not in unchanged["data"]
+    replaced = upload(client, "notes.txt", b"v2", replace="true")
+    assert replaced["data"]["job_id"] == 1
+    assert documents(engine) == [("notes.txt", hashlib.sha256(b"v2").hexdigest())]
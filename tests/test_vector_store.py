@@ -0,0 +1,107 @@
+"""
+Vector store backends (services/vector_store.py). FlatVectorStore runs
+against a temporary directory; Chroma only needs its upsert arguments.
+"""
+import types
+
+import numpy as np
+import pytest
+
+from app.services.vector_store import ChromaVectorStore, FlatVectorStore, VectorStore
+
+
+def chunk_ids(results) -> list:
+    return [chunk["id"] for chunk in results]
+
+
+@pytest.fixture(params=["float16", "int8"])
+def store_path(request, tmp_path):
+    return tmp_path / "vectors", request.param
+
+
+@pytest.fixture
+def store(store_path):
+    path, dtype = store_path
+    store = FlatVectorStore(path, dtype=dtype, hnsw_min_vectors=10**9)
+    store.upsert(
+        ["a", "b", "c"],
+        [[3.0, 0.0, 0.0], [0.0, 2.0, 0.0], [1.0, 1.0, 0.0]],
+        ["alpha", "beta", "gamma"],
+        [{"filename": "one.txt", "chunk_index": i} for i in range(3)],
+    )
+    return store
+
+
+def test_vector_store_is_abstract():
+    with pytest.raises(TypeError):
+        VectorStore()
+
+
+def test_query_ranks_by_cosine_similarity(store):
+    results = store.query([1.0, 0.1, 0.0], 3)
+    assert chunk_ids(results) == ["a", "c", "b"]
+    # Stored vectors are unit length whatever their input norm
+    assert results[0]["score"] == pytest.approx(1 / np.linalg.norm([1.0, 0.1]), abs=1e-2)
+    assert results[0]["text"] == "alpha"
+    assert results[0]["metadata"] == {"filename": "one.txt", "chunk_index": 0}
+    assert chunk_ids(store.query([0.0, 1.0, 0.0], 10)) == ["b", "c", "a"]
+
+
+def test_upsert_replaces_existing_chunks(store):
+    store.upsert(["a"], [[0.0, 0.0, 5.0]], ["alpha v2"], [{"filename": "one.txt", "chunk_index": 0}])
+    assert store.count() == 3
+    assert store.query([0.0, 0.0, 1.0], 1)[0]["text"] == "alpha v2"
+    with pytest.raises(ValueError):
+        store.upsert(["d"], [[1.0, 0.0]], ["short"], [{"filename": "one.txt"}])
+
+
+def test_update_metadata_keeps_the_vector(store):
+    store.update_metadata(["b"], [{"filename": "two.txt", "chunk_index": 7}])
+    assert store.get(["b"]) == [{"id": "b", "text": "beta", "metadata": {"filename": "two.txt", "chunk_index": 7}}]
+    assert store.ids_for("two.txt") == ["b"]
+    assert chunk_ids(store.query([0.0, 1.0, 0.0], 1)) == ["b"]
+
+
+def test_delete_and_row_reuse(store):
+    assert store.delete(["b", "missing"]) == 1
+    assert store.count() == 2
+    assert "b" not in chunk_ids(store.query([0.0, 1.0, 0.0], 3))
+    assert store.get(["b"]) == []
+
+    rows_before = store._high
+    store.upsert(["d"], [[0.0, 1.0, 0.0]], ["delta"], [{"filename": "two.txt"}])
+    assert store._high == rows_before
+    assert store._row_of["d"] == 1
+    assert chunk_ids(store.query([0.0, 1.0, 0.0], 1)) == ["d"]
+
+    assert store.delete_document("one.txt") == 2
+    assert chunk_ids(store.query([1.0, 0.0, 0.0], 3)) == ["d"]
+
+
+def test_iter_pages(store):
+    pages = list(store.iter_pages(2))
+    assert [chunk_ids(page) for page in pages] == [["a", "b"], ["c"]]
+
+
+def test_index_persists_across_reopen(store, store_path):
+    path, dtype = store_path
+    store.delete(["a"])
+    reopened = FlatVectorStore(path, dtype="float16" if dtype == "int8" else "int8", hnsw_min_vectors=10**9)
+    # The stored dtype wins over the requested one
+    assert reopened.dtype == np.dtype(dtype)
+    assert reopened.count() == 2
+    assert chunk_ids(reopened.query([1.0, 1.0, 0.0], 3)) == ["c", "b"]
+    # The deleted row is free for the next insert
+    reopened.upsert(["e"], [[1.0, 0.0, 0.0]], ["epsilon"], [{"filename": "three.txt"}])
+    assert reopened._row_of["e"] == 0
+    assert reopened.get_stats()["vectors"] == 3
+
+
+def test_chroma_upsert_stores_unit_vectors():
+    store = ChromaVectorStore.__new__(ChromaVectorStore)
+    calls = []
+    store.collection = types.SimpleNamespace(upsert=lambda **kwargs: calls.append(kwargs))
+    store.upsert(["a", "b"], [[3.0, 4.0], [0.0, 0.0]], ["x", "y"], [{"filename": "f"}] * 2)
+    assert np.allclose(calls[0]["embeddings"], [[0.6, 0.8], [0.0, 0.0]])
+    store.upsert([], [], [], [])
+    assert len(calls) == 1
@@ -0,0 +1,110 @@
+"""
+Single-writer queue (write_queue.py): group commit, per-write savepoints
+and recovery from failed batches, on every backend of the test matrix.
+"""
+import threading
+
+import pytest
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from app.models.sql_models import User
+from app.write_queue import WriteQueue
+
+
+@pytest.fixture
+def writer(db_engine):
+    return WriteQueue(batch_max=50, engine=db_engine)
+
+
+def names(engine) -> list:
+    with Session(engine) as db:
+        return db.scalars(select(User.name).order_by(User.id)).all()
+
+
+def hold(writer):
+    """Keep the writer busy until the returned event is set"""
+    gate, started = threading.Event(), threading.Event()
+
+    def wait(session):
+        started.set()
+        gate.wait(5)
+
+    blocker = writer.submit(wait)
+    assert started.wait(5)
+    return gate, blocker
+
+
+def test_writes_queued_behind_a_batch_commit_together(writer, db_engine):
+    gate, blocker = hold(writer)
+    futures = [writer.add(User(id=i, name=f"user {i}")) for i in range(1, 6)]
+    futures.append(writer.submit(lambda session: session.get(User, 3).name))
+    gate.set()
+
+    assert futures[-1].result(5) == "user 3"
+    blocker.result(5)
+    assert names(db_engine) == [f"user {i}" for i in range(1, 6)]
+    stats = writer.get_stats()
+    assert (stats["writes"], stats["batches"], stats["failed"]) == (7, 2, 0)
+
+
+def test_failing_write_is_rolled_back_alone(writer, db_engine):
+    writer.add(User(id=1, name="first")).result(5)
+
+    gate, _ = hold(writer)
+    before = writer.add(User(id=2, name="second"))
+    duplicate = writer.add(User(id=1, name="duplicate"))
+    after = writer.add(User(id=3, name="third"))
+    gate.set()
+
+    before.result(5)
+    after.result(5)
+    with pytest.raises(Exception):
+        duplicate.result(5)
+    assert names(db_engine) == ["first", "second", "third"]
+    assert writer.get_stats()["failed"] == 1
+
+
+def test_failed_batch_fails_its_writes_and_the_writer_recovers(writer, db_engine):
+    def break_session(session):
+        def fail():
+            raise RuntimeError("connection lost")
+
+        session.commit = session.rollback = fail
+
+    gate, _ = hold(writer)
+    lost = writer.add(User(id=1, name="lost"))
+    writer.submit(break_session)
+    gate.set()
+    with pytest.raises(RuntimeError):
+        lost.result(5)
+
+    # The next batch runs on a fresh session
+    writer.add(User(id=2, name="saved")).result(5)
+    assert names(db_engine) == ["saved"]
+
+
+def test_session_that_cannot_be_opened_fails_the_batch(writer, db_engine, monkeypatch):
+    open_session = writer._open_session
+
+    def unavailable():
+        monkeypatch.setattr(writer, "_open_session", open_session)
+        raise OSError("database unavailable")
+
+    monkeypatch.setattr(writer, "_open_session", unavailable)
+    with pytest.raises(OSError):
+        writer.add(User(id=1, name="lost")).result(5)
+    writer.add(User(id=2, name="saved")).result(5)
+    assert names(db_engine) == ["saved"]
+
+
+def test_dead_writer_thread_is_restarted(writer, db_engine):
+    writer.flush(5)
+    dead = threading.Thread(target=lambda: None)
+    dead.start()
+    dead.join()
+    writer._thread = dead
+
+    writer.add(User(id=1, name="after restart")).result(5)
+    assert writer._thread is not dead and writer._thread.is_alive()
+    assert names(db_engine) == ["after restart"]